@@ -7,6 +7,7 @@ from app.api.v1.endpoints import health
 from app.api.v1.endpoints import sources
 from app.api.v1.endpoints import telemetry
 from app.api.v1.endpoints import chatbot
+from app.api.v1.endpoints import streams
 
 api_router = APIRouter()
 api_router.include_router(items.router, prefix="/items", tags=["items"])
@@ -16,3 +17,4 @@ api_router.include_router(health.router, prefix="/health", tags=["health"])
 api_router.include_router(sources.router, prefix="/sources", tags=["sources"])
 api_router.include_router(telemetry.router, prefix="/telemetry", tags=["telemetry"])
 api_router.include_router(chatbot.router, prefix="/chatbot", tags=["chatbot"])
+api_router.include_router(streams.router, prefix="/streams", tags=["streams"])
@@ -1,6 +1,11 @@
 from fastapi import APIRouter
 from datetime import datetime, timezone
 
+from app.services.embedding import get_embedding_cache_stats
+from app.services.metric_store import get_metric_store
+from app.services.source_configs import get_source_configs
+from app.services.template_routes import get_template_routes
+
 router = APIRouter()
 
 
@@ -13,9 +18,25 @@ async def health() -> dict[str, object]:
     }
 
 
+@router.get("/embedding-cache", tags=["health"])
+async def embedding_cache() -> dict[str, object]:
+    """Hit/miss counters of the process-wide embedding cache."""
+    return get_embedding_cache_stats()
 
 
+@router.get("/template-routes", tags=["health"])
+async def template_routes() -> dict[str, object]:
+    """Hit/miss counters of the exact-template route table."""
+    return get_template_routes().stats()
 
 
+@router.get("/source-configs", tags=["health"])
+async def source_configs() -> dict[str, object]:
+    """Hit/miss counters of the DataSource config cache."""
+    return get_source_configs().stats()
 
 
+@router.get("/metric-store", tags=["health"])
+async def metric_store() -> dict[str, object]:
+    """Series count and counters of the in-memory metric store."""
+    return get_metric_store().stats()
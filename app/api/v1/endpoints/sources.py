@@ -1,17 +1,44 @@
 from __future__ import annotations
 
 from fastapi import APIRouter, Depends, HTTPException, status
+import logging
 import secrets
 import uuid
+from typing import Any
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_db_session
 from app.crud.crud_data_source import crud_data_source
 from app.schemas.data_source import DataSourceCreate, DataSourceOut, DataSourceUpdate
+from app.services.source_configs import get_source_configs
+from app.services.telegraf_tokens import get_telegraf_tokens
 from app.streams.producer_manager import manager
 
 
 router = APIRouter()
+LOG = logging.getLogger(__name__)
+
+
+def _token_of(obj: Any) -> str | None:
+    cfg = getattr(obj, "config", None) or {}
+    return cfg.get("token") if obj is not None and obj.type == "telegraf" else None
+
+
+async def _sync_token_index(obj: Any, previous_token: str | None = None, *, removed: bool = False) -> None:
+    """Keep the telegraf token index in line with a source change; never fail the request over it."""
+    tokens = get_telegraf_tokens()
+    try:
+        if removed:
+            await tokens.remove(_token_of(obj), obj.id)
+        else:
+            await tokens.sync_source(obj, previous_token)
+    except Exception as exc:  # noqa: BLE001
+        LOG.warning("telegraf token index update failed source_id=%s err=%s", getattr(obj, "id", None), exc)
+        try:
+            # rebuilt from Postgres on the next lookup
+            await tokens.invalidate()
+        except Exception as inner:  # noqa: BLE001
+            LOG.warning("telegraf token index invalidation failed err=%s", inner)
 
 
 @router.get("/", response_model=list[DataSourceOut])
@@ -39,6 +66,9 @@ async def create_source(
         body = DataSourceCreate(name=body.name, type=body.type, enabled=body.enabled, config=cfg)
 
     obj = await crud_data_source.create(db, obj_in=body)
+    await get_source_configs().invalidate(obj.id)
+    if obj.type == "telegraf":
+        await _sync_token_index(obj)
     # Only start producer-backed sources
     if obj.enabled and obj.type not in {"telegraf"}:
         manager.start(obj.id, obj.type, obj.config)
@@ -65,7 +95,11 @@ async def update_source(
     exists = await crud_data_source.get(db, source_id)
     if exists is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Data source not found")
+    previous_token = _token_of(exists)
     updated = await crud_data_source.update(db, db_obj=exists, obj_in=body)
+    await get_source_configs().invalidate(updated.id)
+    if updated.type == "telegraf" or previous_token:
+        await _sync_token_index(updated, previous_token)
 
     # Reconcile running instance (skip non-producer types like telegraf)
     await manager.stop(updated.id)
@@ -82,8 +116,11 @@ async def delete_source(
 ) -> dict[str, str]:
     await manager.stop(source_id)
     deleted = await crud_data_source.remove(db, source_id=source_id)
+    await get_source_configs().invalidate(source_id)
     if deleted is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Data source not found")
+    if _token_of(deleted):
+        await _sync_token_index(deleted, removed=True)
     return {"status": "ok"}
 
 
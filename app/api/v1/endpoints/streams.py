@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from typing import Any
+
+import redis.asyncio as aioredis
+from fastapi import APIRouter, HTTPException, status
+from pydantic import BaseModel
+
+from app.core.config import get_settings
+from app.streams.retention import StreamArchive, StreamRetention, is_entry_id, replay_archive
+
+
+router = APIRouter()
+
+
+class ReplayRequest(BaseModel):
+    start_id: str = "-"
+    end_id: str = "+"
+    target_stream: str | None = None  # defaults to the archived stream; otherwise must start with STREAM_REPLAY_PREFIX
+    max_entries: int | None = None  # capped at STREAM_REPLAY_MAX_ENTRIES
+
+
+@router.get("/retention")
+async def retention_status() -> dict[str, Any]:
+    """Stream lengths, trim policies and archive progress."""
+    settings = get_settings()
+    async with aioredis.from_url(settings.REDIS_URL, decode_responses=True) as redis:
+        return await StreamRetention(redis).status()
+
+
+@router.get("/archive/{stream}")
+async def list_archive(stream: str) -> dict[str, Any]:
+    """Archived segments of `stream`, oldest first."""
+    try:
+        return {"stream": stream, "segments": StreamArchive().list_segments(stream)}
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(exc))
+
+
+@router.post("/archive/{stream}/replay")
+async def replay(stream: str, body: ReplayRequest) -> dict[str, Any]:
+    """Re-add archived entries with ids in [start_id, end_id] to the pipeline.
+
+    At most `max_entries` (bounded by STREAM_REPLAY_MAX_ENTRIES) are
+    replayed per request; when more remain, pass the returned
+    `next_start_id` as `start_id` to continue.
+    """
+    settings = get_settings()
+    if stream not in StreamRetention.policies():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"no retention policy for stream {stream!r}")
+    for entry_id, open_end in ((body.start_id, "-"), (body.end_id, "+")):
+        if entry_id != open_end and not is_entry_id(entry_id):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"invalid stream entry id {entry_id!r}")
+    target = body.target_stream or stream
+    prefix = settings.STREAM_REPLAY_PREFIX
+    if target != stream and not (prefix and target.startswith(prefix) and len(target) > len(prefix)):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"target_stream must be {stream!r} or start with {prefix!r}",
+        )
+    limit = int(settings.STREAM_REPLAY_MAX_ENTRIES)
+    max_entries = max(1, min(body.max_entries or limit, limit))
+    async with aioredis.from_url(settings.REDIS_URL, decode_responses=True) as redis:
+        replayed, next_start_id = await replay_archive(
+            redis, stream, start_id=body.start_id, end_id=body.end_id, target=target, max_entries=max_entries
+        )
+    return {"stream": stream, "target_stream": target, "replayed": replayed, "next_start_id": next_start_id}
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Header, HTTPException, status, Depends
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, Header, HTTPException, Request, status, Depends
+from pydantic import BaseModel
 
 from app.services.otel_exporter import get_export_status, set_export_enabled
 from app.services.normalizers.dcim_http import get_redfish_status, set_redfish_enabled
@@ -10,15 +10,29 @@ from app.streams.automations import get_status as get_auto_status, set_dry_run a
 from app.rules.automations import get_rules as rules_get, upsert_rule as rules_upsert, delete_rule as rules_delete
 import redis.asyncio as aioredis
 from typing import Any
-import json as _json
 import json
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 from app.api.deps import get_db_session
-from app.models.data_source import DataSource
+from app.services.metric_store import get_metric_store
+from app.services.source_configs import SourceSnapshot, get_source_configs
+from app.services.telegraf_tokens import get_telegraf_tokens
+from app.parsers.line_protocol import parse_lines
+from app.streams.metric_codec import MetricCodec
+from app.streams.metric_index import MetricSeriesIndex
+from app.streams.utils import stream_for_source
+import hmac
+import logging
+import time
+import zlib
 
 
 router = APIRouter()
+LOG = logging.getLogger(__name__)
+settings = get_settings()
+# Shared pool for every request on the API event loop
+redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+_codec = MetricCodec(redis)
+_index = MetricSeriesIndex(redis, _codec)
 
 
 class ExportToggle(BaseModel):
@@ -47,31 +61,42 @@ async def redfish_toggle(body: ExportToggle) -> dict[str, object]:
 
 @router.get("/metrics")
 async def metrics_recent(limit: int = 100, vendor: str | None = None, schema: str | None = None) -> dict[str, Any]:
-    """Return recent normalized metric points from the internal metrics stream.
+    """Return recent normalized metric points, served from the in-memory metric store.
     Optional filters: vendor (e.g., 'dcim_http', 'snmp') or schema ('redfish').
+    With METRIC_STORE_ENABLED off, the internal metrics stream is read instead.
     """
-    settings = get_settings()
-    redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+    limit = max(1, min(limit, 1000))
+    if settings.METRIC_STORE_ENABLED:
+        points = get_metric_store().recent(
+            limit=limit, vendor=vendor, name_prefix="redfish." if schema == "redfish" else None
+        )
+        items = [
+            {
+                "id": f"{point['series']}:{point['t']}",
+                "name": point["name"],
+                "type": point["type"],
+                "value": point["value"],
+                "unit": point["unit"],
+                "resource": point["resource"],
+                "attributes": point["attributes"],
+                "t": point["t"],
+            }
+            for point in reversed(points)
+        ]
+        return {"items": items}
     # fetch recent entries
-    rows = await redis.xrevrange("metrics", count=max(1, min(limit, 1000)))
+    rows = await redis.xrevrange("metrics", count=limit)
     items: list[dict[str, Any]] = []
-    for _id, fields in rows:
-        try:
-            resource = _json.loads(fields.get("resource") or "{}")
-        except Exception:
-            resource = {}
-        try:
-            attributes = _json.loads(fields.get("attributes") or "{}")
-        except Exception:
-            attributes = {}
+    for point in await _codec.decode(rows):
+        resource = point["resource"]
         obj = {
-            "id": _id,
-            "name": fields.get("name"),
-            "type": fields.get("type"),
-            "value": fields.get("value"),
-            "unit": fields.get("unit"),
+            "id": point["id"],
+            "name": point["name"],
+            "type": point["type"],
+            "value": point["value"],
+            "unit": point["unit"],
             "resource": resource,
-            "attributes": attributes,
+            "attributes": point["attributes"],
         }
         # filters
         if vendor and (resource.get("vendor") != vendor):
@@ -84,6 +109,116 @@ async def metrics_recent(limit: int = 100, vendor: str | None = None, schema: st
     return {"items": items}
 
 
+@router.get("/metrics/query")
+async def metrics_query(
+    name: str | None = None,
+    host: str | None = None,
+    vendor: str | None = None,
+    start: int | None = None,
+    end: int | None = None,
+    step: float | None = None,
+    cursor: str | None = None,
+    limit: int = 50,
+    max_points: int = 1000,
+) -> dict[str, Any]:
+    """Query metric series over a time range from the per-series index.
+
+    Filters: name, host and vendor (resource fields); start/end are epoch
+    milliseconds (default: the last hour). With `step` (seconds) each series
+    is downsampled to min/max/avg/count buckets. Results page over series:
+    pass `next_cursor` back as `cursor`.
+    """
+    if not settings.METRICS_INDEX_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="metrics index disabled")
+    end_ms = int(end if end is not None else time.time() * 1000)
+    start_ms = int(start if start is not None else end_ms - 3_600_000)
+    if start_ms > end_ms:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must not be after end")
+    max_points = max(1, min(max_points, 10_000))
+    if step is not None and (step <= 0 or (end_ms - start_ms) / (step * 1000) > max_points):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="step too small for the range and max_points")
+    return await _index.query(
+        name=name,
+        host=host,
+        vendor=vendor,
+        start_ms=start_ms,
+        end_ms=end_ms,
+        step_sec=step,
+        cursor=cursor,
+        limit=max(1, min(limit, 500)),
+        max_points=max_points,
+    )
+
+
+def _require_metric_store():
+    if not settings.METRIC_STORE_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="metric store disabled")
+    return get_metric_store()
+
+
+@router.get("/metrics/series")
+async def metrics_series(
+    name: str | None = None,
+    host: str | None = None,
+    vendor: str | None = None,
+    resolution: str = "raw",
+    start: int | None = None,
+    end: int | None = None,
+    cursor: str | None = None,
+    limit: int = 50,
+) -> dict[str, Any]:
+    """Recent metric series from the in-memory store, without touching Redis.
+
+    `resolution` is "raw", "1m" or "1h" (min/max/avg/count rollups);
+    start/end are epoch milliseconds (default: the last hour). Pages over
+    series like /metrics/query.
+    """
+    store = _require_metric_store()
+    end_ms = int(end if end is not None else time.time() * 1000)
+    start_ms = int(start if start is not None else end_ms - 3_600_000)
+    try:
+        return store.query(
+            name=name,
+            host=host,
+            vendor=vendor,
+            resolution=resolution,
+            start_ms=start_ms,
+            end_ms=end_ms,
+            cursor=cursor,
+            limit=max(1, min(limit, 500)),
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+
+
+@router.get("/metrics/latest")
+async def metrics_latest(name: str | None = None, host: str | None = None, vendor: str | None = None) -> dict[str, Any]:
+    """Latest value of every matching series in the in-memory store."""
+    store = _require_metric_store()
+    return {"items": store.latest(name=name, host=host, vendor=vendor)}
+
+
+@router.get("/metrics/threshold")
+async def metrics_threshold(
+    name: str,
+    op: str,
+    value: float,
+    window: float = 300.0,
+    agg: str = "avg",
+    host: str | None = None,
+    vendor: str | None = None,
+) -> dict[str, Any]:
+    """Series of metric `name` whose `agg` (last/avg/min/max) over the last `window` seconds breaches `op value`."""
+    store = _require_metric_store()
+    try:
+        breaches = store.check_threshold(
+            name=name, op=op, threshold=value, window_sec=max(1.0, window), agg=agg, host=host, vendor=vendor
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return {"breached": bool(breaches), "items": breaches}
+
+
 class AutomationsToggle(BaseModel):
     dry_run: bool
 
@@ -125,50 +260,128 @@ async def delete_automation_rule(rule_id: str) -> dict[str, object]:
 
 # --- Telegraf ingestion ---
 
-class TelegrafMetric(BaseModel):
-    name: str
-    tags: dict[str, Any] = Field(default_factory=dict)
-    fields: dict[str, Any] = Field(default_factory=dict)
-    timestamp: int | None = None  # seconds epoch
+# Log-like metrics are written as lines of the matching OS log so the consumer routes them by substring
+_LOG_SOURCES = {
+    "macos_log": "Mac.log:telegraf",
+    "linux_log": "Linux.log:telegraf",
+    "windows_log": "Windows_2k.log:telegraf",
+}
 
 
-class TelegrafBatch(BaseModel):
-    metrics: list[TelegrafMetric] = Field(default_factory=list)
+def _agent_matches(agent: SourceSnapshot | None, token: str, agent_id: str | None) -> bool:
+    if agent is None or agent.type != "telegraf" or not agent.enabled:
+        return False
+    cfg = agent.config or {}
+    tok = str(cfg.get("token") or "")
+    if not tok or not hmac.compare_digest(tok.encode("utf-8"), token.encode("utf-8")):
+        return False
+    aid = str(cfg.get("agent_id") or "")
+    return not (aid and agent_id and aid != agent_id)
+
+
+async def _authenticate_agent(token: str, agent_id: str | None, db: AsyncSession) -> SourceSnapshot | None:
+    """Resolve the agent for a token via the token index.
+
+    When the index is unavailable, misses, or points at a source that does
+    not match, the cached enabled agents are scanned instead, and a match
+    found that way is written back to the index.
+    """
+    configs = get_source_configs()
+    tokens = get_telegraf_tokens()
+    index_ok = True
+    try:
+        source_id = await tokens.lookup(token, db)
+    except Exception as exc:  # noqa: BLE001
+        LOG.info("telegraf token index unavailable, scanning agents err=%s", exc)
+        source_id, index_ok = None, False
+    if source_id is not None:
+        agent = await configs.get(source_id, db)
+        if _agent_matches(agent, token, agent_id):
+            return agent
+    for agent in await configs.telegraf_agents(db):
+        if _agent_matches(agent, token, agent_id):
+            if index_ok:
+                try:
+                    await tokens.repair(token, agent.id)
+                    LOG.info("telegraf token index repaired source_id=%s", agent.id)
+                except Exception as exc:  # noqa: BLE001
+                    LOG.info("telegraf token index repair failed source_id=%s err=%s", agent.id, exc)
+            return agent
+    return None
+
+
+def _decode_body(raw: bytes, content_encoding: str | None) -> bytes:
+    limit = int(settings.TELEGRAF_MAX_BODY_BYTES)
+    if len(raw) > limit:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="body too large")
+    if (content_encoding or "").strip().lower() != "gzip":
+        return raw
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        body = inflater.decompress(raw, limit)
+    except zlib.error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid gzip body")
+    if inflater.unconsumed_tail:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="body too large")
+    return body
+
+
+def _parse_metrics(body: bytes, content_type: str | None, precision: str) -> tuple[list[dict[str, Any]], list[str]]:
+    """Metrics as telegraf JSON-style dicts plus per-metric errors.
+
+    Bodies are JSON when the content type says so or when they start with
+    `{`/`[` (agents that send JSON without a content type), else line protocol.
+    """
+    text = body.decode("utf-8", "replace")
+    is_json = "json" in (content_type or "").lower() or text.lstrip().startswith(("{", "["))
+    if not is_json:
+        try:
+            return parse_lines(text, precision)
+        except ValueError as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    try:
+        doc = json.loads(text or "{}")
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid JSON body")
+    items = doc.get("metrics", [doc]) if isinstance(doc, dict) else doc
+    if not isinstance(items, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="expected a list of metrics")
+    metrics: list[dict[str, Any]] = []
+    errors: list[str] = []
+    for i, m in enumerate(items):
+        if isinstance(m, dict) and m.get("name"):
+            metrics.append(m)
+        else:
+            errors.append(f"metric {i}: missing name")
+    return metrics, errors
 
 
 @router.post("/telegraf")
 async def ingest_telegraf(
-    batch: TelegrafBatch,
+    request: Request,
+    precision: str = "ns",
     x_telegraf_token: str | None = Header(default=None, convert_underscores=False),
     x_agent_id: str | None = Header(default=None, convert_underscores=False),
     db: AsyncSession = Depends(get_db_session),
 ) -> dict[str, Any]:
-    """Accept Telegraf metrics and enqueue them to the central logs stream.
+    """Accept Telegraf metrics and enqueue them for the logs consumer and metrics worker.
+
+    The body is telegraf JSON (`{"metrics": [...]}`, a list, or one metric)
+    when Content-Type is JSON, otherwise InfluxDB line protocol with
+    timestamps in `precision` (ns, us, ms, s); `Content-Encoding: gzip` is
+    accepted for both. Malformed metrics are skipped and reported.
 
     - Log-like metrics (e.g., macos_log) are written as plain log lines for parsing/template routing.
-    - Numeric metrics are written as JSON payloads with source kind 'telegraf' for normalization/export.
-    """
-    settings = get_settings()
-    redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+    - Numeric metrics are written as JSON payloads with source kind 'telegraf' to the metrics input
+      stream for normalization/export.
 
+    The whole batch is written with one pipeline round trip.
+    """
     # Authenticate agent via DataSource(type=telegraf, enabled=true) using token in config
     if not x_telegraf_token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="missing telegraf token")
 
-    # Load telegraf agents and find match by token (and optional agent_id)
-    res = await db.execute(select(DataSource).where(DataSource.type == "telegraf", DataSource.enabled == True))
-    agents = [row for row in res.scalars().all()]
-    matched: DataSource | None = None
-    for a in agents:
-        cfg = a.config or {}
-        tok = str(cfg.get("token") or "")
-        if not tok or tok != x_telegraf_token:
-            continue
-        aid = str(cfg.get("agent_id") or "")
-        if aid and x_agent_id and aid != x_agent_id:
-            continue
-        matched = a
-        break
+    matched = await _authenticate_agent(x_telegraf_token, x_agent_id, db)
     if matched is None:
         # incremental metric for failed auth
         try:
@@ -177,62 +390,57 @@ async def ingest_telegraf(
             pass
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="invalid or disabled token")
 
+    body = _decode_body(await request.body(), request.headers.get("content-encoding"))
+    metrics, errors = _parse_metrics(body, request.headers.get("content-type"), precision)
+    if errors and not metrics:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail={"errors": errors[:20]})
+
     # Optional host allow-list enforcement
     allowed_hosts = (matched.config or {}).get("allowed_hosts") or []
-    provided_hosts = {str((m.tags or {}).get("host") or "") for m in batch.metrics}
     if allowed_hosts:
+        provided_hosts = {str((m.get("tags") or {}).get("host") or "") for m in metrics}
         if not any(h and h in allowed_hosts for h in provided_hosts):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="host not allowed for this agent")
 
+    source_id = str(matched.id)
     logs_written = 0
     metrics_written = 0
-
-    for m in batch.metrics:
-        name = (m.name or "").strip().lower()
-        # Treat *os*_log as raw log lines
-        msg = None
-        if isinstance(m.fields, dict):
-            val = m.fields.get("message")
-            if isinstance(val, str) and val:
-                msg = val
-
-        if name in {"macos_log", "linux_log", "windows_log"} and msg:
-            # Map to existing OS file names so consumer routes correctly by substring
-            source_map = {
-                "macos_log": "Mac.log:telegraf",
-                "linux_log": "Linux.log:telegraf",
-                "windows_log": "Windows_2k.log:telegraf",
-            }
-            source = source_map.get(name, "Mac.log:telegraf")
-            await redis.xadd("logs", {"source": source, "line": msg, "source_id": str(matched.id)})
+    pipe = redis.pipeline(transaction=False)
+    for m in metrics:
+        name = str(m.get("name") or "")
+        tags = m.get("tags") if isinstance(m.get("tags"), dict) else {}
+        fields = m.get("fields") if isinstance(m.get("fields"), dict) else {}
+        log_source = _LOG_SOURCES.get(name.strip().lower())
+        msg = fields.get("message")
+        if log_source and isinstance(msg, str) and msg:
+            pipe.xadd("logs", {"source": log_source, "line": msg, "source_id": source_id})
             logs_written += 1
             continue
-
-        # Otherwise, enqueue as telegraf JSON for normalization in consumer
-        payload = {
-            "name": m.name,
-            "tags": m.tags or {},
-            "fields": m.fields or {},
-            "timestamp": m.timestamp,
-        }
-        # Use source prefix 'telegraf' so consumer can normalize
-        host = str((m.tags or {}).get("host") or "")
-        await redis.xadd("logs", {"source": f"telegraf:{host}", "line": json.dumps(payload), "source_id": str(matched.id)})
+        # Otherwise, enqueue as telegraf JSON for normalization by the metrics worker
+        payload = {"name": name, "tags": tags, "fields": fields, "timestamp": m.get("timestamp")}
+        source = f"telegraf:{tags.get('host') or ''}"
+        pipe.xadd(stream_for_source(source), {"source": source, "line": json.dumps(payload), "source_id": source_id})
         metrics_written += 1
 
     # agent runtime stats
+    key = f"telegraf:agent:{matched.id}"
+    pipe.hset(key, mapping={"last_seen": str(int(time.time())), "name": matched.name})
+    pipe.incrby(f"{key}:accepted", logs_written + metrics_written)
+    if errors:
+        pipe.incrby(f"{key}:rejected", len(errors))
     try:
-        key = f"telegraf:agent:{matched.id}"
-        pipe = redis.pipeline()
-        pipe.hset(key, mapping={
-            "last_seen": str(int(__import__('time').time())),
-            "name": matched.name,
-        })
-        pipe.incrby(f"{key}:accepted", logs_written + metrics_written)
         await pipe.execute()
-    except Exception:
-        pass
-
-    return {"accepted": len(batch.metrics), "logs_enqueued": logs_written, "metrics_enqueued": metrics_written, "source_id": matched.id}
-
-
+    except Exception as exc:
+        LOG.warning("telegraf enqueue failed source_id=%s metrics=%d err=%s", source_id, len(metrics), exc)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="stream unavailable")
+
+    out: dict[str, Any] = {
+        "accepted": len(metrics),
+        "logs_enqueued": logs_written,
+        "metrics_enqueued": metrics_written,
+        "source_id": matched.id,
+    }
+    if errors:
+        out["rejected"] = len(errors)
+        out["errors"] = errors[:20]
+    return out
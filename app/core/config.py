@@ -31,14 +31,26 @@ class Settings(BaseSettings):
     OPENAI_ORG_ID: str | None = None
     OPENAI_PROJECT: str | None = None
     OPENAI_EMBEDDING_MODEL: str = "text-embedding-3-small"
+    # Embedding request chunking (API limits: 2048 inputs / 300k tokens per request)
+    OPENAI_EMBED_BATCH_SIZE: int = 512
+    OPENAI_EMBED_MAX_TOKENS_PER_REQUEST: int = 250_000
+    OPENAI_EMBED_CONCURRENCY: int = 4
+    OPENAI_EMBED_MAX_RETRIES: int = 6  # backoff retries on 429/5xx/connection errors
     OPENAI_CHAT_MODEL: str = "gpt-4o-mini"
     # Ollama config (used when provider=ollama)
     OLLAMA_BASE_URL: str = "http://localhost:11434"
     OLLAMA_EMBEDDING_MODEL: str = "nomic-embed-text"
+    OLLAMA_EMBED_BATCH_SIZE: int = 64  # texts per /api/embed request
+    OLLAMA_EMBED_CONCURRENCY: int = 4  # parallel requests (pooled keep-alive connections)
     # LLM provider and models (inference/classification)
     LLM_PROVIDER: str = "openai"  # "openai" | "ollama"
     OLLAMA_CHAT_MODEL: str = "mistral"
     CHROMA_COLLECTION_PREFIX: str = "templates_"  # results: templates_macos, templates_linux, templates_windows
+    # Embedding cache: in-process LRU plus optional Redis tier (packed float32)
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 50_000
+    EMBEDDING_CACHE_REDIS: bool = False
+    EMBEDDING_CACHE_TTL_SEC: int = 60 * 60 * 24 * 7  # 7d
 
     # Redis stream config used by producer/consumer
     # Default to localhost; override to redis://redis:6379/0 inside Docker Compose
@@ -57,6 +69,24 @@ class Settings(BaseSettings):
     ENABLE_OTEL_EXPORT: bool = False
     OTEL_EXPORTER_OTLP_ENDPOINT: str = "http://localhost:4318/v1/metrics"
     OTEL_SERVICE_NAME: str = "enterprise-log-analyzer"
+    OTEL_EXPORT_QUEUE_SIZE: int = 100_000  # points waiting for the export thread; more are dropped
+    OTEL_MAX_INSTRUMENTS: int = 2000  # distinct metric names (one instrument each)
+    OTEL_MAX_ATTRIBUTE_SETS: int = 1000  # last values kept per observable instrument; least recently updated evicted
+    OTEL_ATTRIBUTE_STALE_SEC: float = 600.0  # attribute sets not updated for this long stop being reported
+    # Metrics worker (app/streams/metrics_worker.py), separate from the logs consumer
+    METRICS_INPUT_STREAM: str = "metrics_raw"  # raw snmp/dcim_http/telegraf payloads awaiting normalization
+    METRICS_WORKERS: int = 1  # metrics workers per process (API or scripts/run_metrics_worker.py)
+    METRICS_BATCH_SIZE: int = 500  # entries read, normalized and written per batch
+    METRICS_INDEX_ENABLED: bool = True  # per-series sample index for GET /telemetry/metrics/query
+    METRICS_INDEX_RETENTION_SEC: float = 86_400.0  # samples kept per series in the index
+    METRIC_STORE_ENABLED: bool = True  # in-memory rolling series (app/services/metric_store.py) following the metrics stream
+    METRIC_STORE_RAW_POINTS: int = 360  # raw samples kept per series
+    METRIC_STORE_MINUTE_POINTS: int = 240  # 1-minute rollups kept per series (4h)
+    METRIC_STORE_HOUR_POINTS: int = 168  # 1-hour rollups kept per series (7d)
+    METRIC_STORE_MAX_SERIES: int = 10_000  # beyond it the least recently updated series is evicted
+    METRIC_STORE_MEMORY_MB: float = 128.0  # ring budget per process; also caps the series count (~22 KB per series with the defaults)
+    METRIC_STORE_WARM_ENTRIES: int = 50_000  # latest metrics stream entries loaded on startup
+    METRICS_INTERN_CACHE_SIZE: int = 50_000  # interned resource/attribute set ids cached per process (app/streams/metric_codec.py)
     ALERTS_CANDIDATES_STREAM: str = "alerts_candidates"
     ALERTS_STREAM: str = "alerts"
     ALERTS_TTL_SEC: int = 60 * 60 * 24  # 24h
@@ -75,6 +105,18 @@ class Settings(BaseSettings):
 
     # Routing / clustering params
     NEAREST_PROTO_THRESHOLD: float = 0.25  # cosine distance threshold
+    # In-memory prototype index; Chroma stays the durable store. Shards are
+    # reloaded after this many seconds to pick up writes from other processes.
+    PROTOTYPE_INDEX_ENABLED: bool = True
+    PROTOTYPE_INDEX_REFRESH_SEC: int = 300
+    # Exact-template route table in front of top-1 prototype routing (memory + Redis write-through)
+    TEMPLATE_ROUTES_ENABLED: bool = True
+    TEMPLATE_ROUTES_REDIS: bool = True
+    TEMPLATE_ROUTES_MAX_ENTRIES: int = 100_000
+    TEMPLATE_ROUTES_MISS_TTL_SEC: float = 60.0  # routes farther than ONLINE_CLUSTER_DISTANCE_THRESHOLD expire
+    TEMPLATE_ROUTES_SYNC_SEC: float = 5.0  # how often other processes' invalidations are picked up
+    TEMPLATE_ROUTES_REDIS_TTL_SEC: int = 60 * 60 * 24 * 7  # 7d
+    TEMPLATE_ROUTES_REDIS_MAX_ENTRIES: int = 200_000  # per OS hash; when full it becomes the previous hash and a new one starts
     CLUSTER_MIN_SIZE: int = 5
     CLUSTER_DISTANCE_THRESHOLD: float = 0.2  # max cosine distance intra-cluster
     # Online clustering + cluster classification thresholds
@@ -86,12 +128,60 @@ class Settings(BaseSettings):
     ISSUE_MAX_LOGS_FOR_LLM: int = 50  # cap logs sent to LLM
     ENABLE_PER_LINE_CANDIDATES: bool = False  # if true, also publish per-line candidates
 
+    # DataSource rows cached for the consumer metrics path and telegraf auth (app/services/source_configs.py)
+    SOURCE_CONFIG_CACHE_TTL_SEC: float = 30.0
+    SOURCE_CONFIG_CACHE_SYNC_SEC: float = 2.0  # how often other processes' invalidations are picked up
+
+    # Stream consumer identities and parallelism
+    STREAM_CONSUMER_ID: str | None = None  # defaults to hostname
+    LOG_CONSUMER_WORKERS: int = 1  # logs consumers per process (API or scripts/run_consumer.py)
+    # Parse/template stage shared by the logs consumer and issues aggregator
+    LOG_PARSE_WORKERS: int = 0  # process-pool size; 0 parses on a worker thread
+    LOG_PARSE_CHUNK_SIZE: int = 256  # lines per pool task
+    LOG_PARSE_CACHE_SIZE: int = 20_000  # parsed entries kept so co-located readers parse each line once
+    # Drain-style template miner (app/parsers/drain.py)
+    TEMPLATE_MINER_ENABLED: bool = True
+    TEMPLATE_MINER_DEPTH: int = 4  # tree depth incl. root and token-count levels
+    TEMPLATE_MINER_SIM_THRESHOLD: float = 0.4  # share of matching tokens to join a template
+    TEMPLATE_MINER_MAX_CHILDREN: int = 100  # per tree node before tokens share the <*> branch
+    TEMPLATE_MINER_SNAPSHOT: str = "file"  # file | redis | "" (no snapshots)
+    TEMPLATE_MINER_SNAPSHOT_PATH: str = "data/template_miner.json"
+    TEMPLATE_MINER_SNAPSHOT_INTERVAL_SEC: float = 60.0
+    # Pending-entry recovery shared by all stream workers
+    STREAM_RECLAIM_IDLE_MS: int = 300_000  # claim entries another consumer left unacked this long
+    STREAM_RECLAIM_INTERVAL_SEC: float = 30.0  # pause between full scans of a group's pending list
+    STREAM_MAX_DELIVERIES: int = 5  # entries delivered more often go to the dead-letter stream
+    STREAM_DEAD_LETTER_SUFFIX: str = ":dead"  # dead-letter stream = <stream><suffix>
+    STREAM_CONSUMER_PRUNE_IDLE_MS: int = 86_400_000  # delete idle consumers with nothing pending; 0 disables
+    # Stream retention (app/streams/retention.py): archive the oldest entries, then trim (MINID ~)
+    STREAM_RETENTION_INTERVAL_SEC: float = 60.0
+    STREAM_MAXLEN: dict[str, int] = {"logs": 1_000_000, "metrics_raw": 500_000, "metrics": 500_000, "alerts": 100_000, "issues_candidates": 100_000}
+    STREAM_MAX_AGE_SEC: dict[str, int] = {}  # e.g. {"metrics": 86400}
+    STREAM_TRIM_UNCONSUMED: bool = False  # also trim entries consumer groups have not read/acked yet
+    STREAM_ARCHIVE_DIR: str = "data/archive"  # gzip JSONL segments per stream; "" trims without archiving
+    STREAM_ARCHIVE_SEGMENT_ENTRIES: int = 50_000
+    STREAM_REPLAY_MAX_ENTRIES: int = 100_000  # per replay request; continue from the returned next_start_id
+    STREAM_REPLAY_PREFIX: str = "replay:"  # replays may target the archived stream itself or streams with this prefix
+    # Batched producer writes (app/streams/utils.py StreamWriter)
+    PRODUCER_BATCH_SIZE: int = 500  # entries per XADD pipeline
+    PRODUCER_LINGER_MS: float = 50.0  # max wait before a partial batch is written
+    # File tailing (app/streams/tail.py)
+    TAIL_BLOCK_SIZE: int = 1 << 20  # bytes per read
+    TAIL_USE_INOTIFY: bool = True  # fall back to polling when unavailable
+    TAIL_POLL_MIN_SEC: float = 0.05  # polling delay right after new data
+    TAIL_POLL_MAX_SEC: float = 2.0  # polling delay cap while idle; also the inotify safety timeout
+    TAIL_OFFSETS_ENABLED: bool = True  # resume tailed files at offsets checkpointed in Redis
+    PRODUCER_BACKFILL: bool = False  # legacy producer: re-read data/*.log from the start (filetail: config "backfill")
+    # Telegraf push endpoint (POST /telemetry/telegraf: JSON or line protocol, optionally gzip)
+    TELEGRAF_MAX_BODY_BYTES: int = 64 << 20  # decompressed body limit
+
     # Background stream toggles
     ENABLE_PRODUCER: bool = False
     ENABLE_ENRICHER: bool = False
     ENABLE_AUTOMATIONS: bool = False
     AUTOMATIONS_DRY_RUN: bool = True
     ENABLE_CLUSTER_ENRICHER: bool = True
+    ENABLE_STREAM_RETENTION: bool = True
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
@@ -5,14 +5,17 @@ from app.core.config import settings
 from app.core.logging_config import configure_logging, install_request_logging
 from app.api.v1.api import api_router
 from app.streams.consumer import attach_consumer
+from app.streams.metrics_worker import attach_metrics_worker
 from app.streams.issues_aggregator import attach_issues_aggregator
 from app.db.init_db import init_db
 from app.streams.enricher import attach_enricher
 from app.services.prototype_improver import attach_prototype_improver
 from app.services.llm_service import llm_healthcheck
+from app.services.metric_store import attach_metric_store
 from app.streams.producer_manager import attach_producers
 from app.streams.automations import attach_automations
 from app.streams.cluster_enricher import attach_cluster_enricher
+from app.streams.retention import attach_stream_retention
 import logging
 
 LOG = logging.getLogger(__name__)
@@ -78,6 +81,10 @@ async def _log_llm_configuration():
 
 attach_consumer(app)
 LOG.info("consumer attachment registered")
+attach_metrics_worker(app)
+LOG.info("metrics worker attachment registered")
+# Rolling in-memory metric series for the telemetry endpoints (METRIC_STORE_ENABLED)
+attach_metric_store(app)
 attach_issues_aggregator(app)
 LOG.info("issues aggregator attachment registered")
 
@@ -95,6 +102,9 @@ attach_cluster_enricher(app)
 
 attach_prototype_improver(app)
 
+# Archive and trim streams per STREAM_MAXLEN / STREAM_MAX_AGE_SEC (ENABLE_STREAM_RETENTION)
+attach_stream_retention(app)
+
 # Optionally start automations when ENABLE_AUTOMATIONS is true
 if settings.ENABLE_AUTOMATIONS:
     attach_automations(app)
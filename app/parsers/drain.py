@@ -0,0 +1,383 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import glob
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from app.core.config import settings
+
+
+LOG = logging.getLogger(__name__)
+
+WILDCARD = "<*>"
+
+
+class TemplateCluster:
+    """One mined template: a token list where varying positions are `<*>`."""
+
+    __slots__ = ("id", "tokens", "size", "path")
+
+    def __init__(self, cluster_id: str, tokens: List[str], size: int = 1, path: Tuple[str, ...] = ()) -> None:
+        self.id = cluster_id
+        self.tokens = tokens
+        self.size = size
+        self.path = path
+
+    @property
+    def template(self) -> str:
+        return " ".join(self.tokens)
+
+
+class _Node:
+    __slots__ = ("children", "clusters")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _Node] = {}
+        self.clusters: List[TemplateCluster] = []
+
+
+def _has_digit(token: str) -> bool:
+    return any(ch.isdigit() for ch in token)
+
+
+class TemplateMiner:
+    """Online Drain-style template miner over already-masked log lines.
+
+    Lines are routed through a fixed-depth prefix tree: the first level is
+    the token count, the next `depth - 2` levels are the leading tokens
+    (tokens with digits, and tokens past `max_children` per node, share the
+    `<*>` branch). The leaf holds a handful of templates; the line joins the
+    most similar one when at least `sim_threshold` of its tokens match,
+    turning differing positions into `<*>`, otherwise it starts a new one.
+
+    Template ids hash the first line of a template with digit-bearing
+    tokens masked, so they stay the same as the template generalizes, across
+    restarts from a snapshot, and across replicas that first see the same
+    (masked) line.
+    """
+
+    def __init__(self, depth: int = 4, sim_threshold: float = 0.4, max_children: int = 100, namespace: str = "") -> None:
+        self.depth = max(3, int(depth))
+        self.sim_threshold = float(sim_threshold)
+        self.max_children = max(1, int(max_children))
+        self.namespace = namespace
+        self._root = _Node()
+        self._clusters: Dict[str, TemplateCluster] = {}
+        self._lock = threading.Lock()
+        self.changed = False
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+    def get(self, cluster_id: str) -> TemplateCluster | None:
+        return self._clusters.get(cluster_id)
+
+    def _route(self, tokens: List[str], create: bool) -> Tuple[_Node | None, Tuple[str, ...]]:
+        key = str(len(tokens))
+        node = self._root.children.get(key)
+        if node is None:
+            if not create:
+                return None, ()
+            node = self._root.children[key] = _Node()
+        path = [key]
+        for token in tokens[: self.depth - 2]:
+            key = WILDCARD if _has_digit(token) else token
+            child = node.children.get(key)
+            if child is None:
+                if not create:
+                    key = WILDCARD
+                    child = node.children.get(key)
+                    if child is None:
+                        return None, ()
+                else:
+                    if len(node.children) >= self.max_children:
+                        key = WILDCARD
+                    child = node.children.get(key)
+                    if child is None:
+                        child = node.children[key] = _Node()
+            node = child
+            path.append(key)
+        return node, tuple(path)
+
+    def _node_for_path(self, path: Tuple[str, ...]) -> _Node:
+        node = self._root
+        for key in path:
+            child = node.children.get(key)
+            if child is None:
+                child = node.children[key] = _Node()
+            node = child
+        return node
+
+    @staticmethod
+    def _similarity(template: List[str], tokens: List[str]) -> Tuple[float, int]:
+        if not tokens:
+            return 1.0, 0
+        same = 0
+        params = 0
+        for expected, token in zip(template, tokens):
+            if expected == WILDCARD:
+                params += 1
+            elif expected == token:
+                same += 1
+        return same / len(tokens), params
+
+    def _best_match(self, clusters: List[TemplateCluster], tokens: List[str]) -> TemplateCluster | None:
+        best: TemplateCluster | None = None
+        best_key = (-1.0, -1)
+        for cluster in clusters:
+            key = self._similarity(cluster.tokens, tokens)
+            if key > best_key:
+                best, best_key = cluster, key
+        if best is not None and best_key[0] >= self.sim_threshold:
+            return best
+        return None
+
+    def _new_id(self, tokens: List[str], attempt: int = 0) -> str:
+        # a function of the line only: no arrival order or per-process state
+        masked = " ".join(WILDCARD if _has_digit(token) else token for token in tokens)
+        seed = f"{self.namespace}|{masked}" + (f"|{attempt}" if attempt else "")
+        return hashlib.sha1(seed.encode("utf-8", errors="replace")).hexdigest()[:16]
+
+    def _generalize(self, cluster: TemplateCluster, tokens: List[str]) -> None:
+        cluster.size += 1
+        for i, (expected, token) in enumerate(zip(cluster.tokens, tokens)):
+            if expected != token and expected != WILDCARD:
+                cluster.tokens[i] = WILDCARD
+                self.changed = True
+
+    def add(self, line: str) -> TemplateCluster:
+        """Assign `line` to a template (creating or generalizing one) and return it.
+
+        A line below `sim_threshold` whose id already names a template of the
+        same leaf generalizes that template rather than duplicating the id;
+        an id taken by a template elsewhere in the tree gets a disambiguator.
+        """
+        tokens = line.split()
+        with self._lock:
+            leaf, path = self._route(tokens, create=True)
+            assert leaf is not None
+            cluster = self._best_match(leaf.clusters, tokens)
+            if cluster is not None:
+                self._generalize(cluster, tokens)
+                return cluster
+            attempt = 0
+            cluster_id = self._new_id(tokens)
+            while cluster_id in self._clusters:
+                existing = self._clusters[cluster_id]
+                if existing.path == path:
+                    self._generalize(existing, tokens)
+                    return existing
+                attempt += 1
+                cluster_id = self._new_id(tokens, attempt)
+            cluster = TemplateCluster(cluster_id, list(tokens), 1, path)
+            leaf.clusters.append(cluster)
+            self._clusters[cluster.id] = cluster
+            self.changed = True
+            return cluster
+
+    def match(self, line: str) -> TemplateCluster | None:
+        """Look up the template for `line` without learning from it."""
+        tokens = line.split()
+        with self._lock:
+            leaf, _ = self._route(tokens, create=False)
+            return self._best_match(leaf.clusters, tokens) if leaf is not None else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "depth": self.depth,
+                "sim_threshold": self.sim_threshold,
+                "max_children": self.max_children,
+                "clusters": [
+                    {"id": c.id, "tokens": list(c.tokens), "size": c.size, "path": list(c.path)}
+                    for c in self._clusters.values()
+                ],
+            }
+
+    def merge_dict(self, data: Dict[str, Any]) -> int:
+        """Merge a snapshot taken by `to_dict` (possibly by another replica) into the tree.
+
+        Templates already known by id, or matched by a template in the same
+        leaf, absorb the snapshot's counts; the rest are added. Returns the
+        number of templates added.
+        """
+        added = 0
+        with self._lock:
+            for item in data.get("clusters") or []:
+                tokens = [str(t) for t in item.get("tokens") or []]
+                path = tuple(str(k) for k in item.get("path") or [])
+                if not path:
+                    continue
+                size = int(item.get("size") or 1)
+                leaf = self._node_for_path(path)
+                existing = self._clusters.get(str(item["id"])) or self._best_match(leaf.clusters, tokens)
+                if existing is not None:
+                    existing.size = max(existing.size, size)
+                    continue
+                cluster = TemplateCluster(str(item["id"]), tokens, size, path)
+                leaf.clusters.append(cluster)
+                self._clusters[cluster.id] = cluster
+                added += 1
+        return added
+
+
+class TemplateMiners:
+    """Per-OS template miners with periodic snapshots to a file or Redis.
+
+    Each instance (STREAM_CONSUMER_ID or hostname) writes its own snapshot,
+    one JSON document holding every OS tree, so replicas never overwrite
+    each other. `restore()` merges the snapshots of every instance; workers
+    call it at startup, off the event loop, so a restarted worker keeps
+    assigning the same ids and picks up templates mined by other replicas.
+    """
+
+    REDIS_KEY = "template_miner:snapshot"  # per instance: <REDIS_KEY>:<instance>
+    _REDIS_TTL_SEC = 7 * 24 * 3600  # snapshots of instances gone for a week expire
+
+    def __init__(self) -> None:
+        self._miners: Dict[str, TemplateMiner] = {}
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._restored = False
+        self._restore_lock = threading.Lock()
+        self._last_snapshot = time.time()
+        self.instance = settings.STREAM_CONSUMER_ID or socket.gethostname()
+
+    def _new_miner(self, os_name: str) -> TemplateMiner:
+        return TemplateMiner(
+            depth=settings.TEMPLATE_MINER_DEPTH,
+            sim_threshold=settings.TEMPLATE_MINER_SIM_THRESHOLD,
+            max_children=settings.TEMPLATE_MINER_MAX_CHILDREN,
+            namespace=os_name,
+        )
+
+    def get(self, os_name: str) -> TemplateMiner:
+        with self._lock:
+            miner = self._miners.get(os_name)
+            if miner is None:
+                miner = self._miners[os_name] = self._new_miner(os_name)
+            return miner
+
+    def add(self, os_name: str, line: str) -> TemplateCluster:
+        return self.get(os_name or "unknown").add(line)
+
+    def _snapshot_path(self, instance: str) -> str:
+        root, ext = os.path.splitext(settings.TEMPLATE_MINER_SNAPSHOT_PATH)
+        return f"{root}.{instance}{ext or '.json'}"
+
+    def _read_snapshots(self) -> List[str]:
+        """Every instance's snapshot, this instance's first."""
+        target = (settings.TEMPLATE_MINER_SNAPSHOT or "").lower()
+        if target == "file":
+            own = self._snapshot_path(self.instance)
+            root, ext = os.path.splitext(settings.TEMPLATE_MINER_SNAPSHOT_PATH)
+            others = sorted(p for p in glob.glob(f"{glob.escape(root)}.*{ext or '.json'}") if p != own)
+            # the unsuffixed path holds snapshots taken before they were per instance
+            paths = [own, *others, settings.TEMPLATE_MINER_SNAPSHOT_PATH]
+            payloads = []
+            for path in paths:
+                if os.path.exists(path):
+                    with open(path, "r", encoding="utf-8") as f:
+                        payloads.append(f.read())
+            return payloads
+        if target == "redis":
+            import redis as _redis
+
+            client = _redis.Redis.from_url(settings.REDIS_URL)
+            own = f"{self.REDIS_KEY}:{self.instance}"
+            others = sorted(k.decode("utf-8") for k in client.scan_iter(match=f"{self.REDIS_KEY}:*"))
+            keys = [own, *(k for k in others if k != own), self.REDIS_KEY]
+            return [raw.decode("utf-8") for raw in client.mget(keys) if raw]
+        return []
+
+    def _write_snapshot(self, payload: str) -> None:
+        target = (settings.TEMPLATE_MINER_SNAPSHOT or "").lower()
+        if target == "file":
+            path = self._snapshot_path(self.instance)
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp, path)
+        elif target == "redis":
+            import redis as _redis
+
+            _redis.Redis.from_url(settings.REDIS_URL).set(
+                f"{self.REDIS_KEY}:{self.instance}", payload, ex=self._REDIS_TTL_SEC
+            )
+
+    def restore(self) -> None:
+        """Merge the snapshots of every instance into the trees, once per process.
+
+        Blocking (file or Redis I/O): call it from a worker thread at startup.
+        Lines mined before it completes are kept; snapshots merge into them.
+        """
+        with self._restore_lock:
+            if self._restored or not settings.TEMPLATE_MINER_ENABLED:
+                return
+            self._restored = True
+            try:
+                payloads = self._read_snapshots()
+            except Exception as exc:
+                LOG.info("template miner snapshot restore failed err=%s", exc)
+                return
+            added = 0
+            for raw in payloads:
+                try:
+                    data = json.loads(raw)
+                    for os_name, tree in (data.get("miners") or {}).items():
+                        added += self.get(os_name).merge_dict(tree)
+                except Exception as exc:
+                    LOG.info("template miner snapshot restore failed err=%s", exc)
+            LOG.info("template miners restored snapshots=%d templates=%d", len(payloads), added)
+
+    def snapshot_due(self) -> bool:
+        if not settings.TEMPLATE_MINER_SNAPSHOT:
+            return False
+        if time.time() - self._last_snapshot < float(settings.TEMPLATE_MINER_SNAPSHOT_INTERVAL_SEC):
+            return False
+        with self._lock:
+            return any(m.changed for m in self._miners.values())
+
+    def snapshot(self) -> None:
+        """Persist all trees now (no-op without a snapshot target)."""
+        if not settings.TEMPLATE_MINER_SNAPSHOT:
+            return
+        with self._snapshot_lock:
+            self._last_snapshot = time.time()
+            with self._lock:
+                miners = dict(self._miners)
+            for miner in miners.values():
+                miner.changed = False
+            payload = json.dumps({"miners": {name: m.to_dict() for name, m in miners.items()}})
+            try:
+                self._write_snapshot(payload)
+            except Exception as exc:
+                for miner in miners.values():
+                    miner.changed = True
+                LOG.info("template miner snapshot failed err=%s", exc)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {name: len(m) for name, m in self._miners.items()}
+
+
+_miners: TemplateMiners | None = None
+_miners_lock = threading.Lock()
+
+
+def get_template_miners() -> TemplateMiners:
+    """Return the process-wide template miners."""
+    global _miners
+    with _miners_lock:
+        if _miners is None:
+            _miners = TemplateMiners()
+        return _miners
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Tuple
+
+
+# Divisor turning a line protocol timestamp of the given precision into seconds
+PRECISION_DIVISORS = {"ns": 1e9, "n": 1e9, "us": 1e6, "u": 1e6, "ms": 1e3, "s": 1.0}
+
+_ESCAPED = re.compile(r"\\([ ,=\"\\])")
+_TRUE = {"t", "T", "true", "True", "TRUE"}
+_FALSE = {"f", "F", "false", "False", "FALSE"}
+
+
+def _unescape(text: str) -> str:
+    return _ESCAPED.sub(r"\1", text) if "\\" in text else text
+
+
+def _find(text: str, stops: str, start: int = 0, quoted: bool = False) -> int:
+    """Index of the first unescaped char of `stops` (outside "strings" when `quoted`), or -1."""
+    in_string = False
+    i, n = start, len(text)
+    while i < n:
+        c = text[i]
+        if c == "\\":
+            i += 2
+            continue
+        if quoted and c == '"':
+            in_string = not in_string
+        elif not in_string and c in stops:
+            return i
+        i += 1
+    return -1
+
+
+def _split(text: str, sep: str, quoted: bool = False) -> List[str]:
+    if "\\" not in text and not (quoted and '"' in text):
+        return text.split(sep)
+    parts: List[str] = []
+    start = 0
+    while True:
+        end = _find(text, sep, start, quoted)
+        if end < 0:
+            parts.append(text[start:])
+            return parts
+        parts.append(text[start:end])
+        start = end + 1
+
+
+def _pair(text: str) -> Tuple[str, str]:
+    eq = _find(text, "=")
+    if eq <= 0:
+        raise ValueError(f"expected key=value, got {text!r}")
+    return _unescape(text[:eq]), text[eq + 1 :]
+
+
+def _field_value(raw: str) -> Any:
+    if raw.startswith('"'):
+        if len(raw) < 2 or not raw.endswith('"'):
+            raise ValueError(f"unterminated string field {raw!r}")
+        body = raw[1:-1]
+        return body.replace('\\"', '"').replace("\\\\", "\\") if "\\" in body else body
+    if raw in _TRUE:
+        return True
+    if raw in _FALSE:
+        return False
+    if raw.endswith(("i", "u")):
+        return int(raw[:-1])
+    return float(raw)
+
+
+def parse_line(line: str, precision: str = "ns") -> Dict[str, Any]:
+    """Parse one line protocol line into a telegraf JSON-style metric.
+
+    Returns `{"name", "tags", "fields", "timestamp"}` with the timestamp in
+    (float) seconds, or None when the line has none. Raises ValueError on
+    malformed input.
+    """
+    key_end = _find(line, " ")
+    if key_end <= 0:
+        raise ValueError("missing field set")
+    key = _split(line[:key_end], ",")
+    name = _unescape(key[0])
+    if not name:
+        raise ValueError("missing measurement")
+    tags = dict(_pair(tag) for tag in key[1:])
+    for tag, value in tags.items():
+        tags[tag] = _unescape(value)
+
+    rest = line[key_end + 1 :].lstrip(" ")
+    fields_end = _find(rest, " ", quoted=True)
+    fields_raw = rest if fields_end < 0 else rest[:fields_end]
+    fields: Dict[str, Any] = {}
+    for item in _split(fields_raw, ",", quoted=True):
+        field, raw = _pair(item)
+        fields[field] = _field_value(raw)
+    if not fields:
+        raise ValueError("missing field set")
+
+    timestamp = None
+    ts_raw = "" if fields_end < 0 else rest[fields_end + 1 :].strip()
+    if ts_raw:
+        timestamp = int(ts_raw) / PRECISION_DIVISORS[precision]
+    return {"name": name, "tags": tags, "fields": fields, "timestamp": timestamp}
+
+
+def parse_lines(text: str, precision: str = "ns") -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Parse a line protocol body; returns (metrics, errors) so one bad line doesn't reject the batch."""
+    if precision not in PRECISION_DIVISORS:
+        raise ValueError(f"unknown precision {precision!r}")
+    metrics: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            metrics.append(parse_line(line, precision))
+        except (ValueError, KeyError) as exc:
+            errors.append(f"line {number}: {exc}")
+    return metrics, errors
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures as cf
+import logging
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.parsers.drain import get_template_miners
+from app.parsers.linux import parse_linux_line
+from app.parsers.macos import parse_macos_line
+from app.parsers.templating import render_templated_line
+
+
+LOG = logging.getLogger(__name__)
+
+# (os, templated line, parsed fields)
+ParsedLine = Tuple[str, str, Dict[str, str]]
+
+
+def os_from_source(source: str | None) -> str:
+    if not source:
+        return "unknown"
+    s = source.lower()
+    if "linux.log" in s:
+        return "linux"
+    if "mac.log" in s:
+        return "macos"
+    if "windows" in s:
+        return "windows"
+    return "unknown"
+
+
+def parse_and_template(os_name: str, line: str) -> Tuple[str, Dict[str, str]]:
+    parsed: Dict[str, str] | None = None
+    if os_name == "linux":
+        parsed = parse_linux_line(0, line) or None
+    elif os_name == "macos":
+        parsed = parse_macos_line(0, line) or None
+    if not parsed:
+        templated = render_templated_line(component="unknown", pid=None, content=line)
+        return templated, {"content": line, "component": "unknown"}
+    templated = render_templated_line(
+        component=parsed.get("component", ""),
+        pid=parsed.get("PID"),
+        content=parsed.get("content", ""),
+    )
+    return templated, parsed
+
+
+def parse_line(source: str | None, line: str) -> ParsedLine:
+    os_name = os_from_source(source)
+    templated, parsed = parse_and_template(os_name, line)
+    return os_name, templated, parsed
+
+
+def _parse_chunk(items: Sequence[Tuple[str | None, str]]) -> List[ParsedLine]:
+    """Pool task: parse a chunk of (source, line) pairs."""
+    return [parse_line(source, line) for source, line in items]
+
+
+def _mine_templates(rows: List[ParsedLine]) -> None:
+    """Tag parsed rows with their mined template id (parent process only; the miner is stateful).
+
+    CPU-bound; callers run it on a worker thread.
+    """
+    if not settings.TEMPLATE_MINER_ENABLED:
+        return
+    miners = get_template_miners()
+    for os_name, templated, parsed in rows:
+        parsed["template_id"] = miners.add(os_name, templated).id
+
+
+class ParsePipeline:
+    """Parse/template stage shared by the workers reading the logs stream.
+
+    Batches are split into `chunk_size` chunks and fanned out to a process
+    pool, or parsed on a worker thread when `workers` is 0, so the syslog
+    regexes and templating never run on an event loop. Rows are then tagged
+    with a `template_id` by the process's template miners. Results are kept
+    per stream entry id in a bounded table: when the logs consumer and the
+    issues aggregator share a process, whichever reads an entry first parses
+    it and the other reuses the result (waiting for it if it is still in flight).
+    """
+
+    def __init__(self, workers: int = 0, chunk_size: int = 256, cache_size: int = 20_000) -> None:
+        self.workers = max(0, int(workers))
+        self.chunk_size = max(1, int(chunk_size))
+        self.cache_size = max(0, int(cache_size))
+        self._lock = threading.Lock()
+        self._results: "OrderedDict[str, ParsedLine]" = OrderedDict()
+        self._inflight: Dict[str, cf.Future] = {}
+        self._executor: cf.ProcessPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> Optional[cf.ProcessPoolExecutor]:
+        if not self.workers:
+            return None
+        with self._executor_lock:
+            if self._executor is None:
+                # spawn: workers must not inherit the parent's event loops and Redis sockets
+                self._executor = cf.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _reset_executor(self) -> None:
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        self._reset_executor()
+
+    async def _run(self, items: List[Tuple[str | None, str]]) -> List[ParsedLine]:
+        executor = self._get_executor()
+        if executor is None:
+            return await asyncio.to_thread(_parse_chunk, items)
+        loop = asyncio.get_running_loop()
+        chunks = [items[i : i + self.chunk_size] for i in range(0, len(items), self.chunk_size)]
+        try:
+            parts = await asyncio.gather(*(loop.run_in_executor(executor, _parse_chunk, chunk) for chunk in chunks))
+        except BrokenProcessPool as exc:
+            LOG.info("parse pool broken, parsing batch on a thread err=%s", exc)
+            self._reset_executor()
+            return await asyncio.to_thread(_parse_chunk, items)
+        return [row for part in parts for row in part]
+
+    async def parse(self, entries: Sequence[Tuple[str, str | None, str]]) -> List[ParsedLine]:
+        """Parse (entry_id, source, line) triples; results come back in input order."""
+        results: List[ParsedLine | None] = [None] * len(entries)
+        owned: List[int] = []
+        waiting: List[Tuple[int, cf.Future]] = []
+        with self._lock:
+            for i, (entry_id, _, _) in enumerate(entries):
+                hit = self._results.get(entry_id)
+                if hit is not None:
+                    self._results.move_to_end(entry_id)
+                    results[i] = hit
+                    continue
+                pending = self._inflight.get(entry_id)
+                if pending is not None:
+                    waiting.append((i, pending))
+                    continue
+                self._inflight[entry_id] = cf.Future()
+                owned.append(i)
+
+        if owned:
+            try:
+                rows = await self._run([(entries[i][1], entries[i][2]) for i in owned])
+                await asyncio.to_thread(_mine_templates, rows)
+            except BaseException:
+                with self._lock:
+                    for i in owned:
+                        pending = self._inflight.pop(entries[i][0], None)
+                        if pending is not None:
+                            pending.set_exception(RuntimeError("parse failed"))
+                raise
+            with self._lock:
+                for i, row in zip(owned, rows):
+                    entry_id = entries[i][0]
+                    results[i] = row
+                    if self.cache_size:
+                        self._results[entry_id] = row
+                    pending = self._inflight.pop(entry_id, None)
+                    if pending is not None:
+                        pending.set_result(row)
+                while len(self._results) > self.cache_size:
+                    self._results.popitem(last=False)
+
+        for i, pending in waiting:
+            try:
+                results[i] = await asyncio.wrap_future(pending)
+            except Exception:
+                _, source, line = entries[i]
+                rows = await asyncio.to_thread(_parse_chunk, [(source, line)])
+                await asyncio.to_thread(_mine_templates, rows)
+                results[i] = rows[0]
+        miners = get_template_miners()
+        if settings.TEMPLATE_MINER_ENABLED and miners.snapshot_due():
+            await asyncio.to_thread(miners.snapshot)
+        return results  # type: ignore[return-value]
+
+
+_pipeline: ParsePipeline | None = None
+_pipeline_lock = threading.Lock()
+
+
+def get_parse_pipeline() -> ParsePipeline:
+    """Return the process-wide parse pipeline."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = ParsePipeline(
+                workers=settings.LOG_PARSE_WORKERS,
+                chunk_size=settings.LOG_PARSE_CHUNK_SIZE,
+                cache_size=settings.LOG_PARSE_CACHE_SIZE,
+            )
+        return _pipeline
@@ -15,23 +15,128 @@ HASH_NUMBER = re.compile(r"#\d+")
 NUMBER = re.compile(r"(?<!\w)[-+]?\d+(?:\.\d+)?(?!\w)")
 
 
+# (pattern, replacement) in the order the masks apply
+_MASKS = (
+    (MAC_ADDRESS, "<*>"),
+    (IPV4_ADDRESS, "<*>"),
+    (IPV6_ADDRESS, "<*>"),
+    (UUID_PATTERN, "<*>"),
+    (HEX_LITERAL, "<*>"),
+    (VERSION_PATTERN, "<*>"),
+    (HASH_NUMBER, "#<*>"),
+    (NUMBER, "<*>"),
+)
+_WHITESPACE = re.compile(r"\s+")
+_NON_WORD = re.compile(r"\W")
+# Every mask needs a digit, or `:`/`-` for all-letter MAC/IPv6/UUID forms
+_MAY_MASK = re.compile(r"[\d:\-]")
+_CHUNK_CACHE_MAX = 65_536
+
+
+def _alternation(patterns: list[str]) -> str:
+    return "|".join(f"(?P<m{i}>{pattern})" for i, pattern in enumerate(patterns))
+
+
+def _strip_leading_guard(pattern: str) -> str:
+    for guard in (r"\b", r"(?<!\w)"):
+        if pattern.startswith(guard):
+            return pattern[len(guard):]
+    return pattern
+
+
+# One scanner for all masks. Alternatives are tried in mask order, so at any
+# position the earliest mask in `_MASKS` wins.
+_SCANNER = re.compile(_alternation([p.pattern for p, _ in _MASKS]))
+# Directly after a token replaced by mask j, the passes of later masks see
+# `<*>` (a non-word character) instead of the token's last character, so their
+# leading \b and (?<!\w) guards always hold there. Mask j's own pass still
+# sees the original text.
+_AFTER_MASK = [
+    re.compile(_alternation([
+        _strip_leading_guard(p.pattern) if i > j else p.pattern for i, (p, _) in enumerate(_MASKS)
+    ]))
+    for j in range(len(_MASKS))
+]
+# For mask i: "does any earlier mask match here?"
+_EARLIER = [None] + [re.compile(_alternation([p.pattern for p, _ in _MASKS[:i]])) for i in range(1, len(_MASKS))]
+
+_chunk_cache: dict[str, str] = {}
+
+
+def _template_content_passes(message: str) -> str:
+    """Reference implementation: one substitution pass per mask, then whitespace."""
+    templated = message
+    for pattern, replacement in _MASKS:
+        templated = pattern.sub(replacement, templated)
+    # collapse excessive whitespace that may appear after substitutions
+    templated = _WHITESPACE.sub(" ", templated).strip()
+    return templated
+
+
+def _earlier_mask_inside(text: str, start: int, end: int, index: int) -> bool:
+    """True if a mask applied before mask `index` starts inside text[start:end].
+
+    The sequential passes would have masked that token first; a leftmost
+    single scan cannot reproduce that, so the caller falls back to them.
+    Masks can only start at or after a non-word character.
+    """
+    earlier = _EARLIER[index]
+    if earlier is None or _NON_WORD.search(text, start, end - 1) is None:
+        return False
+    for pos in range(start + 1, end):
+        if earlier.match(text, pos):
+            return True
+    return False
+
+
+def _scan_chunk(chunk: str) -> str | None:
+    """Mask a whitespace-free chunk in one scan; None when that could differ from the passes."""
+    out: list[str] = []
+    pos = 0
+    last_mask_end = -1
+    last_mask = 0
+    while True:
+        match = _AFTER_MASK[last_mask].match(chunk, pos) if pos == last_mask_end else None
+        if match is None:
+            match = _SCANNER.search(chunk, pos)
+            if match is None:
+                break
+        start, end = match.span()
+        index = int(match.lastgroup[1:])
+        if _earlier_mask_inside(chunk, start, end, index):
+            return None
+        out.append(chunk[pos:start])
+        out.append(_MASKS[index][1])
+        last_mask_end = end
+        last_mask = index
+        pos = end
+    out.append(chunk[pos:])
+    return "".join(out)
+
+
+def _mask_chunk(chunk: str) -> str:
+    if _MAY_MASK.search(chunk) is None:
+        return chunk
+    masked = _chunk_cache.get(chunk)
+    if masked is None:
+        masked = _scan_chunk(chunk)
+        if masked is None:
+            masked = _template_content_passes(chunk)
+        if len(_chunk_cache) >= _CHUNK_CACHE_MAX:
+            _chunk_cache.clear()
+        _chunk_cache[chunk] = masked
+    return masked
+
+
 def template_content(message: str) -> str:
     """Return a templated version of a log message body by masking variable tokens.
 
     The function attempts to preserve structure while replacing volatile values with `<*>`.
+    No mask spans whitespace and whitespace bounds tokens like the string edges do, so
+    the message is split once and only chunks that can hold a mask are scanned, with
+    results memoized per chunk. Output is identical to `_template_content_passes`.
     """
-    templated = message
-    templated = MAC_ADDRESS.sub("<*>", templated)
-    templated = IPV4_ADDRESS.sub("<*>", templated)
-    templated = IPV6_ADDRESS.sub("<*>", templated)
-    templated = UUID_PATTERN.sub("<*>", templated)
-    templated = HEX_LITERAL.sub("<*>", templated)
-    templated = VERSION_PATTERN.sub("<*>", templated)
-    templated = HASH_NUMBER.sub("#<*>", templated)
-    templated = NUMBER.sub("<*>", templated)
-    # collapse excessive whitespace that may appear after substitutions
-    templated = re.sub(r"\s+", " ", templated).strip()
-    return templated
+    return " ".join(_mask_chunk(chunk) for chunk in message.split())
 
 
 def render_templated_line(component: str, pid: Optional[str], content: str) -> str:
@@ -9,6 +9,7 @@ from chromadb.api.models.Collection import Collection
 from app.core.config import settings
 import re
 from app.services.embedding import (
+    CachedEmbeddingFunction,
     SentenceTransformerEmbeddingFunction,
     OpenAIEmbeddingFunction,
     OllamaEmbeddingFunction,
@@ -40,6 +41,9 @@ class ChromaClientProvider:
                 f"Unknown EMBEDDING_PROVIDER '{settings.EMBEDDING_PROVIDER}'. "
                 "Supported: openai, sentence-transformers, ollama"
             )
+        if settings.EMBEDDING_CACHE_ENABLED:
+            # Templated lines repeat heavily; share vectors across all callers
+            self.embedding_fn = CachedEmbeddingFunction(self.embedding_fn)
         self._client = self._create_client()
 
     def _create_client(self) -> ClientAPI:
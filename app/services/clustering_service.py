@@ -3,11 +3,13 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Any, Dict, List, Tuple
 
-import math
+import numpy as np
 
 from app.core.config import settings
 from app.services.chroma_service import ChromaClientProvider
 from app.services.failure_rules import match_failure_signals
+from app.services.prototype_index import get_prototype_index
+from app.services.template_routes import get_template_routes
 
 
 def _suffix_for_os(os_name: str) -> str:
@@ -33,32 +35,18 @@ def _proto_collection_name(os_name: str) -> str:
     return f"{settings.CHROMA_PROTO_COLLECTION_PREFIX}{_suffix_for_os(os_name)}"
 
 
-def _l2_norm(vec: List[float]) -> float:
-    return math.sqrt(sum(v * v for v in vec)) or 1.0
+def _unit_rows(embeddings: Any) -> np.ndarray:
+    """Return embeddings as a float64 matrix of L2-normalized rows (zero rows stay zero)."""
+    matrix = np.asarray(embeddings, dtype=np.float64)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(matrix), -1)
+    norms = np.linalg.norm(matrix, axis=1)
+    return matrix / np.where(norms > 0, norms, 1.0)[:, None]
 
 
-def _normalize(vec: List[float]) -> List[float]:
-    n = _l2_norm(vec)
-    return [v / n for v in vec]
-
-
-def _cosine_distance(a: List[float], b: List[float]) -> float:
-    # expects normalized vectors
-    dot = sum(x * y for x, y in zip(a, b))
-    # numeric stability on bounds
-    dot = max(min(dot, 1.0), -1.0)
-    return 1.0 - dot
-
-
-def _mean(vectors: List[List[float]]) -> List[float]:
-    if not vectors:
-        return []
-    dim = len(vectors[0])
-    acc = [0.0] * dim
-    for v in vectors:
-        for i in range(dim):
-            acc[i] += v[i]
-    return [x / float(len(vectors)) for x in acc]
+def _cosine_distances(vectors: np.ndarray, centroid: np.ndarray) -> np.ndarray:
+    # expects normalized vectors; clip dot products for numeric stability
+    return 1.0 - np.clip(vectors @ centroid, -1.0, 1.0)
 
 
 @dataclass
@@ -76,51 +64,76 @@ def _single_pass_cluster(
     embeddings: List[List[float]],
     threshold: float,
     min_size: int,
+    *,
+    block_size: int = 256,
 ) -> Tuple[List[List[int]], List[List[float]]]:
     """Simple incremental clustering by cosine distance to current centroids.
 
+    Each vector joins its nearest centroid when within `threshold`, otherwise
+    it seeds a new cluster. Centroids are the normalized running sum of member
+    vectors (same direction as the normalized mean), so a join is O(d).
+    Distances are computed a block of vectors at a time against the centroids
+    as of the block start; only centroids touched inside the block are
+    recomputed per vector, which keeps results identical to the sequential
+    definition.
+
     Returns (clusters_indices, centroids).
     """
-    normalized = [_normalize(e) for e in embeddings]
+    vectors = _unit_rows(embeddings)
+    n = len(vectors)
+    if n == 0:
+        return [], []
+    dim = vectors.shape[1]
+    capacity = min(n, 1024)
+    centroids = np.zeros((capacity, dim))
+    sums = np.zeros((capacity, dim))
     clusters: List[List[int]] = []
-    centroids: List[List[float]] = []
 
-    for idx, vec in enumerate(normalized):
-        if not centroids:
-            clusters.append([idx])
-            centroids.append(vec[:])
-            continue
-        # find nearest centroid
-        distances = [_cosine_distance(vec, c) for c in centroids]
-        best_i = min(range(len(distances)), key=lambda i: distances[i])
-        if distances[best_i] <= threshold:
-            clusters[best_i].append(idx)
-            # update centroid as mean of members (on normalized vectors), then renormalize
-            members = [normalized[i] for i in clusters[best_i]]
-            centroids[best_i] = _normalize(_mean(members))
-        else:
+    def _grow() -> None:
+        nonlocal centroids, sums
+        bigger = min(n, 2 * len(centroids))
+        centroids = np.vstack([centroids, np.zeros((bigger - len(centroids), dim))])
+        sums = np.vstack([sums, np.zeros((bigger - len(sums), dim))])
+
+    for start in range(0, n, max(1, block_size)):
+        block = vectors[start:start + block_size]
+        base_count = len(clusters)
+        base = block @ centroids[:base_count].T
+        touched: set[int] = set()
+        for offset, vec in enumerate(block):
+            idx = start + offset
+            count = len(clusters)
+            if count:
+                dots = base[offset].copy()
+                if touched:
+                    cols = np.fromiter(touched, dtype=np.intp)
+                    dots[cols] = centroids[cols] @ vec
+                if count > base_count:
+                    dots = np.concatenate([dots, centroids[base_count:count] @ vec])
+                distances = 1.0 - np.clip(dots, -1.0, 1.0)
+                best_i = int(np.argmin(distances))
+                if distances[best_i] <= threshold:
+                    clusters[best_i].append(idx)
+                    sums[best_i] += vec
+                    norm = np.linalg.norm(sums[best_i])
+                    centroids[best_i] = sums[best_i] / (norm if norm > 0 else 1.0)
+                    if best_i < base_count:
+                        touched.add(best_i)
+                    continue
+            if count == len(centroids):
+                _grow()
             clusters.append([idx])
-            centroids.append(vec[:])
+            sums[count] = vec
+            centroids[count] = vec
 
     # filter small clusters
-    filtered: List[List[int]] = []
-    filtered_centroids: List[List[float]] = []
-    for c, ctr in zip(clusters, centroids):
-        if len(c) >= max(1, min_size):
-            filtered.append(c)
-            filtered_centroids.append(ctr)
-    return filtered, filtered_centroids
-
-
-def _medoid_index(indices: List[int], vectors: List[List[float]], centroid: List[float]) -> int:
-    best_idx = indices[0]
-    best_dist = 1e9
-    for i in indices:
-        d = _cosine_distance(vectors[i], centroid)
-        if d < best_dist:
-            best_dist = d
-            best_idx = i
-    return best_idx
+    keep = [i for i, c in enumerate(clusters) if len(c) >= max(1, min_size)]
+    return [clusters[i] for i in keep], centroids[keep].tolist()
+
+
+def _medoid_index(indices: List[int], vectors: np.ndarray, centroid: List[float]) -> int:
+    distances = _cosine_distances(vectors[indices], np.asarray(centroid, dtype=np.float64))
+    return indices[int(np.argmin(distances))]
 
 
 def _label_cluster(documents: List[str]) -> Tuple[str, str]:
@@ -145,13 +158,11 @@ def build_prototypes(
     centroids: List[List[float]],
 ) -> List[Prototype]:
     prototypes: List[Prototype] = []
+    # normalize once, not once per cluster
+    vectors = _unit_rows(embeddings) if clusters else np.zeros((0, 0))
     for ci, member_indices in enumerate(clusters):
         centroid = centroids[ci]
-        medoid_local = _medoid_index(member_indices, [
-            _normalize(e) for e in embeddings
-        ], centroid)
-        medoid_global = medoid_local
-        medoid_doc = documents[medoid_global]
+        medoid_doc = documents[_medoid_index(member_indices, vectors, centroid)]
         label, rationale = _label_cluster([documents[i] for i in member_indices])
         proto = Prototype(
             cluster_id=f"cluster_{ci}",
@@ -185,6 +196,9 @@ def upsert_prototypes(os_name: str, provider: ChromaClientProvider, prototypes:
     ]
     embeddings = [p.centroid for p in prototypes]
     collection.upsert(ids=ids, documents=docs, embeddings=embeddings, metadatas=metas)
+    get_prototype_index().upsert(coll_name, ids, embeddings, docs, metas)
+    # Re-clustered prototypes move centroids; cached template routes are stale
+    get_template_routes().invalidate(_suffix_for_os(os_name))
     return len(prototypes)
 
 
@@ -1,21 +1,22 @@
 from __future__ import annotations
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterable, List
+import hashlib
 import logging
+import random
+import threading
 import time
 
+import httpx
 import numpy as np
 import ollama
+import openai
 from openai import OpenAI
 from sentence_transformers import SentenceTransformer
-# Assuming settings are configured elsewhere, for example:
-# from app.core.config import settings
-class MockSettings:
-    OPENAI_API_KEY = "your-api-key-here"
-    OPENAI_ORG_ID = "your-org-id-here"
-    OPENAI_PROJECT = "your-project-id-here"
 
-settings = MockSettings()
+from app.core.config import settings
 
 
 class SentenceTransformerEmbeddingFunction:
@@ -26,6 +27,7 @@ class SentenceTransformerEmbeddingFunction:
 
     def __init__(self, model_name: str) -> None:
         self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
 
     def __call__(self, input: Iterable[str]) -> List[List[float]]:
         embeddings = self.model.encode(list(input), normalize_embeddings=True)
@@ -37,6 +39,10 @@ class SentenceTransformerEmbeddingFunction:
     def name(self) -> str:  # pragma: no cover - simple getter
         return f"sentence-transformers::{self.model.get_sentence_embedding_dimension()}"
 
+    # name() only carries the dimension; the cache must distinguish models
+    def cache_namespace(self) -> str:  # pragma: no cover - simple getter
+        return f"sentence-transformers::{self.model_name}"
+
     # Some Chroma paths call embed_documents/embed_query when available
     def embed_documents(self, input: Iterable[str]) -> List[List[float]]:
         return self(list(input))
@@ -56,26 +62,115 @@ def embed_single_text(
     return embedding_function([text])
 
 
+def _token_counter(model: str):
+    """Return a text -> token count function for `model`.
+
+    Uses tiktoken when installed; otherwise a conservative ~4 chars/token
+    estimate, which is all chunking needs.
+    """
+    try:
+        import tiktoken
+
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        return lambda text: len(text) // 4 + 1
+
+
 class OpenAIEmbeddingFunction:
-    """OpenAI embeddings adapter compatible with Chroma's embedding_function interface."""
+    """OpenAI embeddings adapter compatible with Chroma's embedding_function interface.
+
+    Inputs are split into requests bounded by both input count and estimated
+    tokens, sent with bounded concurrency, retried with exponential backoff
+    on 429/5xx responses, and reassembled in input order.
+    """
 
-    def __init__(self, model: str, api_key: str | None = None) -> None:
-        # OpenAI Python SDK v1 uses client with api_key from env or provided
+    def __init__(
+        self,
+        model: str,
+        api_key: str | None = None,
+        *,
+        batch_size: int | None = None,
+        max_tokens_per_request: int | None = None,
+        concurrency: int | None = None,
+        max_retries: int | None = None,
+    ) -> None:
+        # OpenAI Python SDK v1 uses client with api_key from env or provided.
+        # SDK retries are disabled; _create_with_backoff owns the retry policy.
         self.client = OpenAI(
             api_key=api_key or settings.OPENAI_API_KEY,
             organization=settings.OPENAI_ORG_ID,
             project=settings.OPENAI_PROJECT,
+            max_retries=0,
         )
         self.model = model
+        self.batch_size = max(1, int(batch_size or settings.OPENAI_EMBED_BATCH_SIZE))
+        self.max_tokens_per_request = max(1, int(max_tokens_per_request or settings.OPENAI_EMBED_MAX_TOKENS_PER_REQUEST))
+        self.concurrency = max(1, int(concurrency or settings.OPENAI_EMBED_CONCURRENCY))
+        self.max_retries = max(0, int(max_retries if max_retries is not None else settings.OPENAI_EMBED_MAX_RETRIES))
+        self._count_tokens = _token_counter(model)
+        self._executor: ThreadPoolExecutor | None = None
+
+    def _chunks(self, inputs: List[str]) -> List[List[str]]:
+        chunks: List[List[str]] = []
+        current: List[str] = []
+        tokens = 0
+        for text in inputs:
+            n = self._count_tokens(text)
+            if current and (len(current) >= self.batch_size or tokens + n > self.max_tokens_per_request):
+                chunks.append(current)
+                current, tokens = [], 0
+            current.append(text)
+            tokens += n
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _create_with_backoff(self, inputs: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                response = self.client.embeddings.create(model=self.model, input=inputs)
+                # Ensure ordering is preserved
+                return [emb.embedding for emb in sorted(response.data, key=lambda e: e.index)]
+            except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as exc:
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = None
+                response = getattr(exc, "response", None)
+                if response is not None:
+                    try:
+                        retry_after = float(response.headers.get("retry-after") or "")
+                    except (TypeError, ValueError):
+                        retry_after = None
+                delay = retry_after if retry_after is not None else min(0.5 * (2 ** attempt), 30.0)
+                delay += random.uniform(0, delay * 0.25)
+                logging.getLogger(__name__).info(
+                    "openai embeddings retry attempt=%d size=%d delay=%.1fs err=%s",
+                    attempt + 1,
+                    len(inputs),
+                    delay,
+                    exc,
+                )
+                time.sleep(delay)
+                attempt += 1
 
     def __call__(self, input: Iterable[str]) -> List[List[float]]:
         inputs = list(input)
         if not inputs:
             return []
-        # Batching can be added if needed; for simplicity, do one request
-        response = self.client.embeddings.create(model=self.model, input=inputs)
-        # Ensure ordering is preserved
-        return [emb.embedding for emb in response.data]
+        chunks = self._chunks(inputs)
+        if len(chunks) == 1 or self.concurrency == 1:
+            results = [self._create_with_backoff(chunk) for chunk in chunks]
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="openai-embed")
+            # map() preserves chunk order
+            results = list(self._executor.map(self._create_with_backoff, chunks))
+        return [vec for chunk in results for vec in chunk]
 
     def name(self) -> str:  # pragma: no cover - simple getter
         return f"openai::{self.model}"
@@ -91,20 +186,40 @@ class OpenAIEmbeddingFunction:
 class OllamaEmbeddingFunction:
     """Ollama embeddings adapter using the official ollama python library.
 
-    This implementation performs one request per input string for simplicity
-    and robustness. It returns lists of floats compatible with Chroma's
-    embedding_function interface.
+    Inputs are sent to the batch `/api/embed` endpoint in chunks of
+    `batch_size`, with up to `concurrency` chunks in flight over the client's
+    pooled keep-alive connections. A chunk that fails is retried one text at
+    a time through the legacy `/api/embeddings` endpoint; those vectors are
+    L2-normalized to match `/api/embed` output.
     """
 
     # Module-level throttling for readiness logs to avoid spamming
     _logged_ready_keys: set[tuple[str, str]] = set()
     _last_error_ts: dict[tuple[str, str], float] = {}
 
-    def __init__(self, base_url: str, model: str) -> None:
-        self.client = ollama.Client(host=base_url)
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        *,
+        batch_size: int | None = None,
+        concurrency: int | None = None,
+    ) -> None:
+        self.batch_size = max(1, int(batch_size or settings.OLLAMA_EMBED_BATCH_SIZE))
+        self.concurrency = max(1, int(concurrency or settings.OLLAMA_EMBED_CONCURRENCY))
+        # Keep one pooled connection per concurrent chunk alive between calls
+        self.client = ollama.Client(
+            host=base_url,
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            ),
+        )
         self.model = model
+        self._executor: ThreadPoolExecutor | None = None
+        self._key = (base_url, model)
         logger = logging.getLogger(__name__)
-        key = (base_url, model)
+        key = self._key
         # One-time readiness probe per (base_url, model)
         try:
             info = self.client.list()
@@ -123,43 +238,245 @@ class OllamaEmbeddingFunction:
                 logger.warning("ollama embedding provider not reachable host=%s model=%s err=%s", base_url, model, e)
                 OllamaEmbeddingFunction._last_error_ts[key] = now
 
+    @staticmethod
+    def _coerce(text: object) -> str:
+        # Defensively coerce any non-string input (e.g., ['text']) to a string
+        if isinstance(text, str):
+            return text
+        if isinstance(text, (list, tuple)):
+            try:
+                return " ".join(map(str, text))
+            except Exception:
+                return str(text)
+        return str(text)
+
+    def _embed_one(self, text: str) -> List[float]:
+        try:
+            response = self.client.embeddings(model=self.model, prompt=text)
+            embedding = response.get("embedding")
+            if not isinstance(embedding, list):
+                raise RuntimeError("ollama embeddings response missing 'embedding' list")
+        except ollama.ResponseError as e:  # pragma: no cover - network
+            raise RuntimeError(f"ollama embeddings API error: {e.error}") from e
+        except RuntimeError:
+            raise
+        except Exception as e:  # pragma: no cover - unexpected
+            raise RuntimeError(f"An unexpected error occurred with ollama embeddings: {e}") from e
+        vec = np.asarray(embedding, dtype=np.float64)
+        norm = float(np.linalg.norm(vec))
+        return (vec / norm).tolist() if norm > 0 else vec.tolist()
+
+    def _embed_chunk(self, texts: List[str]) -> List[List[float]]:
+        try:
+            response = self.client.embed(model=self.model, input=texts)
+            embeddings = response.get("embeddings")
+            if not isinstance(embeddings, list) or len(embeddings) != len(texts):
+                raise RuntimeError("ollama embed response missing or short 'embeddings' list")
+            return [list(vec) for vec in embeddings]
+        except Exception as e:  # pragma: no cover - network
+            now = time.time()
+            last = OllamaEmbeddingFunction._last_error_ts.get(self._key, 0.0)
+            if now - last >= 60.0:
+                logging.getLogger(__name__).warning(
+                    "ollama batch embed failed model=%s size=%d err=%s; falling back to per-item requests",
+                    self.model,
+                    len(texts),
+                    e,
+                )
+                OllamaEmbeddingFunction._last_error_ts[self._key] = now
+            return [self._embed_one(text) for text in texts]
+
     def __call__(self, input: Iterable[str]) -> List[List[float]]:
-        texts = list(input)
+        texts = [self._coerce(text) for text in input]
         if not texts:
             return []
+        chunks = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(chunks) == 1 or self.concurrency == 1:
+            results = [self._embed_chunk(chunk) for chunk in chunks]
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ollama-embed")
+            # map() preserves chunk order
+            results = list(self._executor.map(self._embed_chunk, chunks))
+        return [vec for chunk in results for vec in chunk]
 
-        embeddings: List[List[float]] = []
-        for text in texts:
-            # Defensively coerce any non-string input (e.g., ['text']) to a string
-            coerced: str
-            if isinstance(text, str):
-                coerced = text
-            elif isinstance(text, (list, tuple)):
-                try:
-                    coerced = " ".join(map(str, text))
-                except Exception:
-                    coerced = str(text)
-            else:
-                coerced = str(text)
+    # /api/embed vectors are normalized, unlike the old per-text endpoint; a
+    # new name keeps them apart from older vectors in Chroma (collections are
+    # suffixed with it) and in the embedding cache
+    def name(self) -> str:  # pragma: no cover - simple getter
+        return f"ollama-embed::{self.model}"
+
+    # Chroma compatibility helpers
+    def embed_documents(self, input: Iterable[str]) -> List[List[float]]:
+        return self(list(input))
+
+    def embed_query(self, input: str) -> List[List[float]]:
+        return self([input])
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache keyed by (provider/model, sha1(text)).
+
+    Tier 1 is an in-process LRU shared by every embedding function in the
+    process. Tier 2 (optional) stores packed float32 vectors in Redis so
+    replicas and restarts share work. Redis errors disable tier 2 for a
+    short cooldown instead of failing the embedding call.
+    """
+
+    _REDIS_COOLDOWN_SEC = 30.0
+
+    def __init__(self, max_entries: int, redis_url: str | None = None, ttl_sec: int = 0) -> None:
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_sec = int(ttl_sec)
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_down_until = 0.0
+        if redis_url:
+            import redis as _redis
+
+            self._redis = _redis.Redis.from_url(redis_url)
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(namespace: str, text: str) -> str:
+        digest = hashlib.sha1(text.encode("utf-8", errors="replace")).hexdigest()
+        return f"emb:{namespace}:{digest}"
+
+    def _redis_available(self) -> bool:
+        return self._redis is not None and time.time() >= self._redis_down_until
+
+    def _redis_failed(self, exc: Exception) -> None:
+        self._redis_down_until = time.time() + self._REDIS_COOLDOWN_SEC
+        logging.getLogger(__name__).info("embedding cache redis tier unavailable err=%s", exc)
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> List[List[float] | None]:
+        out: List[List[float] | None] = [None] * len(keys)
+        missing: List[int] = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                vec = self._lru.get(key)
+                if vec is None:
+                    missing.append(i)
+                    continue
+                self._lru.move_to_end(key)
+                out[i] = vec
+            self.hits += len(keys) - len(missing)
+        if missing and self._redis_available():
             try:
-                response = self.client.embeddings(model=self.model, prompt=coerced)
-                embedding = response.get("embedding")
-                if not isinstance(embedding, list):
-                        raise RuntimeError("ollama embeddings response missing 'embedding' list")
-                embeddings.append(embedding)
-            except ollama.ResponseError as e:  # pragma: no cover - network
-                raise RuntimeError(f"ollama embeddings API error: {e.error}") from e
-            except Exception as e: # pragma: no cover - unexpected
-                raise RuntimeError(f"An unexpected error occurred with ollama embeddings: {e}") from e
-
-        return embeddings
+                packed = self._redis.mget([keys[i] for i in missing])  # type: ignore[union-attr]
+            except Exception as exc:  # pragma: no cover - network
+                self._redis_failed(exc)
+                packed = []
+            still_missing: List[int] = []
+            for i, raw in zip(missing, packed):
+                if not raw:
+                    still_missing.append(i)
+                    continue
+                vec = np.frombuffer(raw, dtype=np.float32).tolist()
+                out[i] = vec
+                self._remember(keys[i], vec)
+            if packed:
+                self.redis_hits += len(missing) - len(still_missing)
+                missing = still_missing
+        self.misses += len(missing)
+        return out
+
+    def put_many(self, keys: List[str], vectors: List[List[float]]) -> None:
+        for key, vec in zip(keys, vectors):
+            self._remember(key, vec)
+        if not keys or not self._redis_available():
+            return
+        try:
+            pipe = self._redis.pipeline(transaction=False)  # type: ignore[union-attr]
+            for key, vec in zip(keys, vectors):
+                pipe.set(key, np.asarray(vec, dtype=np.float32).tobytes(), ex=self.ttl_sec or None)
+            pipe.execute()
+        except Exception as exc:  # pragma: no cover - network
+            self._redis_failed(exc)
+
+    def stats(self) -> dict[str, object]:
+        lookups = self.hits + self.redis_hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "max_entries": self.max_entries,
+            "redis_enabled": self._redis is not None,
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": ((self.hits + self.redis_hits) / lookups) if lookups else 0.0,
+        }
+
+
+_cache: EmbeddingCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide embedding cache configured from settings."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(
+                max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+                redis_url=settings.REDIS_URL if settings.EMBEDDING_CACHE_REDIS else None,
+                ttl_sec=settings.EMBEDDING_CACHE_TTL_SEC,
+            )
+        return _cache
+
+
+class CachedEmbeddingFunction:
+    """Wrap an embedding function with the shared `EmbeddingCache`.
+
+    Only cache misses reach the wrapped provider, and duplicates within one
+    call are embedded once. `name()` is delegated so Chroma collection names
+    stay unchanged.
+    """
+
+    def __init__(self, inner, cache: EmbeddingCache | None = None) -> None:
+        self.inner = inner
+        self.cache = cache or get_embedding_cache()
+        namespace = getattr(inner, "cache_namespace", None)
+        self.namespace = namespace() if callable(namespace) else inner.name()
+
+    def __call__(self, input: Iterable[str]) -> List[List[float]]:
+        texts = [t if isinstance(t, str) else str(t) for t in input]
+        if not texts:
+            return []
+        keys = [EmbeddingCache.key(self.namespace, t) for t in texts]
+        vectors = self.cache.get_many(keys)
+        pending: dict[str, str] = {}
+        for key, text, vec in zip(keys, texts, vectors):
+            if vec is None:
+                pending.setdefault(key, text)
+        if pending:
+            fresh = self.inner(list(pending.values()))
+            fresh_by_key = {key: list(vec) for key, vec in zip(pending.keys(), fresh)}
+            self.cache.put_many(list(fresh_by_key.keys()), list(fresh_by_key.values()))
+            vectors = [vec if vec is not None else fresh_by_key[key] for key, vec in zip(keys, vectors)]
+        return vectors  # type: ignore[return-value]
 
     def name(self) -> str:  # pragma: no cover - simple getter
-        return f"ollama::{self.model}"
+        return self.inner.name()
 
     # Chroma compatibility helpers
     def embed_documents(self, input: Iterable[str]) -> List[List[float]]:
         return self(list(input))
 
     def embed_query(self, input: str) -> List[List[float]]:
-        return self([input])
\ No newline at end of file
+        return self([input])
+
+
+def get_embedding_cache_stats() -> dict[str, object]:
+    return get_embedding_cache().stats()
@@ -1,12 +1,26 @@
 from __future__ import annotations
 
+import logging
 import re
-from typing import Dict, List, Tuple
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, List, Sequence, Tuple
 import yaml
 from pathlib import Path
 
+try:  # Python >= 3.11
+    from re import _parser as _sre_parse
+except ImportError:  # pragma: no cover - older interpreters
+    import sre_parse as _sre_parse  # type: ignore[no-redef]
+
+
+LOG = logging.getLogger(__name__)
 
 _RULES_FILE = Path(__file__).parent.parent / "rules" / "rules.yml"
+_RELOAD_CHECK_SEC = 2.0
+_MIN_ANCHOR_LEN = 3
+# numbered backreferences would point at the wrong group once rules are concatenated
+_BACKREF = re.compile(r"\\[1-9]|\(\?P=")
 
 
 def load_rules() -> List[Tuple[str, re.Pattern[str]]]:
@@ -26,7 +40,176 @@ def load_rules() -> List[Tuple[str, re.Pattern[str]]]:
         )
     return rules
 
-_RULES = load_rules()
+
+def _required_literals(items: Iterable) -> FrozenSet[str] | None:
+    """Lower-cased literals one of which every match of `items` must contain.
+
+    Walks a parsed regex sequence: the longest run of plain literals is
+    required; a group or alternation yields the union of its branches'
+    requirements. Returns None when no safe requirement can be derived.
+    """
+    best: FrozenSet[str] | None = None
+    run: List[str] = []
+
+    def _consider(candidate: FrozenSet[str] | None) -> None:
+        nonlocal best
+        if not candidate:
+            return
+        if best is None or min(map(len, candidate)) > min(map(len, best)):
+            best = candidate
+
+    def _flush() -> None:
+        if len(run) >= _MIN_ANCHOR_LEN:
+            _consider(frozenset(["".join(run)]))
+        run.clear()
+
+    for op, av in items:
+        if op is _sre_parse.LITERAL and av < 128:
+            run.append(chr(av).lower())
+            continue
+        if op is _sre_parse.AT:
+            # \b and friends are zero-width and do not break the literal run
+            continue
+        _flush()
+        if op is _sre_parse.SUBPATTERN:
+            _consider(_required_literals(av[-1]))
+        elif op is _sre_parse.BRANCH:
+            branches = [_required_literals(branch) for branch in av[1]]
+            if all(branches):
+                _consider(frozenset().union(*branches))  # type: ignore[arg-type]
+    _flush()
+    return best
+
+
+class _LiteralScanner:
+    """Finds every anchor literal occurring in a lower-cased ASCII text.
+
+    Uses a pyahocorasick automaton when the package is installed. Otherwise
+    a single lookahead alternation visits each position once; alternatives
+    are ordered longest first and each hit also reports the anchors that are
+    prefixes of it, so overlapping anchors are never shadowed.
+    """
+
+    def __init__(self, literals: Iterable[str]) -> None:
+        self.literals = sorted(set(literals), key=lambda s: (-len(s), s))
+        self._automaton = None
+        try:
+            import ahocorasick
+
+            automaton = ahocorasick.Automaton()
+            for literal in self.literals:
+                automaton.add_word(literal, literal)
+            automaton.make_automaton()
+            self._automaton = automaton
+        except Exception:
+            pass
+        self._implied: Dict[str, Tuple[str, ...]] = {
+            lit: tuple(other for other in self.literals if lit.startswith(other)) for lit in self.literals
+        }
+        pattern = "|".join(re.escape(lit) for lit in self.literals) or r"(?!)"
+        self._scanner = re.compile(f"(?=({pattern}))")
+
+    def find(self, text: str) -> set[str]:
+        if self._automaton is not None:
+            return {literal for _, literal in self._automaton.iter(text)} if self.literals else set()
+        found: set[str] = set()
+        for m in self._scanner.finditer(text):
+            found.update(self._implied[m.group(1)])
+        return found
+
+
+class CompiledRules:
+    """rules.yml compiled for one-pass matching.
+
+    Each rule keeps its own regex, which has the final say, so results are
+    identical to running the rules one by one. In front of that sit two
+    cheaper stages:
+
+    * a literal prefilter: the literals every match of a rule must contain
+      are scanned for in one pass, and only rules whose literals occur are
+      checked. Only used for ASCII text (Unicode case folding lets e.g.
+      U+017F match "s" under IGNORECASE) and when every rule has literals.
+    * otherwise a combined alternation of all rules: one search tells
+      whether any rule can match, which is the common "no signal" answer.
+    """
+
+    def __init__(self, rules: Sequence[Tuple[str, re.Pattern[str]]]) -> None:
+        self.rules = list(rules)
+        self._combined: re.Pattern[str] | None = None
+        if self.rules and not any(_BACKREF.search(pattern.pattern) for _, pattern in self.rules):
+            try:
+                self._combined = re.compile(
+                    "|".join(f"(?:{pattern.pattern})" for _, pattern in self.rules), re.IGNORECASE
+                )
+            except re.error:
+                pass
+        anchors = [_required_literals(_sre_parse.parse(pattern.pattern, pattern.flags)) for _, pattern in self.rules]
+        self._prefilter: _LiteralScanner | None = None
+        self._rules_by_literal: Dict[str, Tuple[int, ...]] = {}
+        if self.rules and all(anchors):
+            by_literal: Dict[str, List[int]] = {}
+            for index, literals in enumerate(anchors):
+                for literal in literals or ():
+                    by_literal.setdefault(literal, []).append(index)
+            self._rules_by_literal = {lit: tuple(idx) for lit, idx in by_literal.items()}
+            self._prefilter = _LiteralScanner(by_literal)
+
+    def labels(self, text: str) -> List[str]:
+        """Labels of all rules matching `text`, in rules.yml order."""
+        if not self.rules:
+            return []
+        if self._prefilter is not None and text.isascii():
+            candidates: set[int] = set()
+            for literal in self._prefilter.find(text.lower()):
+                candidates.update(self._rules_by_literal[literal])
+            if not candidates:
+                return []
+            return [self.rules[i][0] for i in sorted(candidates) if self.rules[i][1].search(text)]
+        if self._combined is not None and not self._combined.search(text):
+            return []
+        return [label for label, pattern in self.rules if pattern.search(text)]
+
+
+class _RuleSet:
+    """Holds the compiled rules and recompiles them when rules.yml changes."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._mtime: float | None = None
+        self.compiled = CompiledRules([])
+        self._reload(self._file_mtime())
+
+    @staticmethod
+    def _file_mtime() -> float | None:
+        try:
+            return _RULES_FILE.stat().st_mtime
+        except OSError:
+            return None
+
+    def _reload(self, mtime: float | None) -> None:
+        try:
+            self.compiled = CompiledRules(load_rules())
+        except Exception as exc:
+            # keep serving the previous rules until the file is fixed
+            LOG.info("failure rules reload failed err=%s", exc)
+        self._mtime = mtime
+
+    def current(self) -> CompiledRules:
+        now = time.monotonic()
+        if now - self._checked_at >= _RELOAD_CHECK_SEC:
+            with self._lock:
+                if now - self._checked_at >= _RELOAD_CHECK_SEC:
+                    self._checked_at = now
+                    mtime = self._file_mtime()
+                    if mtime != self._mtime:
+                        self._reload(mtime)
+                        LOG.info("failure rules reloaded rules=%d", len(self.compiled.rules))
+        return self.compiled
+
+
+_RULE_SET = _RuleSet()
+
 
 def match_failure_signals(text: str) -> Dict[str, object]:
     """Return quick rule-based signal for potential hardware failures.
@@ -35,13 +218,7 @@ def match_failure_signals(text: str) -> Dict[str, object]:
     {"has_signal": bool, "label": str, "score": float, "evidence": List[str]}
     """
     text = text or ""
-    evidence: List[str] = []
-    labels: List[str] = []
-    for label, pattern in _RULES:
-        if pattern.search(text):
-            labels.append(label)
-            evidence.append(label)
+    labels = _RULE_SET.current().labels(text)
+    evidence: List[str] = list(labels)
     score = min(1.0, 0.2 * len(labels)) if labels else 0.0
     return {"has_signal": bool(labels), "label": labels[0] if labels else "unknown", "score": score, "evidence": evidence}
-
-
@@ -0,0 +1,397 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import operator
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+import numpy as np
+import redis.asyncio as aioredis
+from fastapi import FastAPI
+
+from app.core.config import get_settings
+from app.streams.metric_codec import MetricCodec
+from app.streams.metric_index import MetricSeriesIndex
+
+
+LOG = logging.getLogger(__name__)
+settings = get_settings()
+
+METRICS_STREAM = "metrics"
+RESOLUTIONS = {"1m": 60, "1h": 3600}
+
+_OPS: Dict[str, Callable[[float, float], bool]] = {
+    "gt": operator.gt,
+    "ge": operator.ge,
+    "lt": operator.lt,
+    "le": operator.le,
+    "eq": operator.eq,
+    "ne": operator.ne,
+}
+
+
+class _Ring:
+    """Fixed-capacity ring of float64 rows, preallocated; the oldest row is overwritten first."""
+
+    __slots__ = ("data", "head", "size")
+
+    def __init__(self, capacity: int, width: int) -> None:
+        self.data = np.empty((max(1, int(capacity)), width), dtype=np.float64)
+        self.head = 0  # next row to write
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.data.nbytes)
+
+    def append(self, row: Tuple[float, ...]) -> None:
+        self.data[self.head] = row
+        self.head = (self.head + 1) % len(self.data)
+        self.size = min(self.size + 1, len(self.data))
+
+    def last(self, col: int, back: int = 0) -> float:
+        return float(self.data[(self.head - 1 - back) % len(self.data), col])
+
+    def set_last(self, col: int, value: float) -> None:
+        self.data[(self.head - 1) % len(self.data), col] = value
+
+    def ordered(self) -> np.ndarray:
+        if self.size < len(self.data):
+            return self.data[: self.size]
+        return np.concatenate((self.data[self.head :], self.data[: self.head]))
+
+    def rows_between(self, start: float, end: float) -> List[List[float]]:
+        """Rows whose first column lies in [start, end], oldest first."""
+        rows = self.ordered()
+        lo = int(np.searchsorted(rows[:, 0], start, side="left"))
+        hi = int(np.searchsorted(rows[:, 0], end, side="right"))
+        return rows[lo:hi].tolist()
+
+
+class _Series:
+    __slots__ = ("name", "type", "unit", "resource", "attributes", "raw", "rollups", "updated")
+
+    def __init__(self, item: Dict[str, Any], raw_points: int, rollup_points: Dict[str, int]) -> None:
+        self.name = str(item.get("name") or "")
+        self.type = item.get("type")
+        self.unit = item.get("unit")
+        self.resource = item.get("resource") or {}
+        self.attributes = item.get("attributes") or {}
+        self.raw = _Ring(raw_points, 2)  # (t, value)
+        self.rollups = {res: _Ring(rollup_points[res], 5) for res in RESOLUTIONS}  # (t, min, max, sum, count)
+        self.updated = time.time()  # wall clock of the last stored sample
+
+    @staticmethod
+    def nbytes_for(raw_points: int, rollup_points: Dict[str, int]) -> int:
+        """Bytes preallocated by the rings of one series."""
+        return 8 * (2 * max(1, raw_points) + 5 * sum(max(1, n) for n in rollup_points.values()))
+
+    def add(self, t: float, value: float) -> bool:
+        if len(self.raw) and t <= self.raw.last(0):
+            return False
+        self.raw.append((t, value))
+        for res, step in RESOLUTIONS.items():
+            ring = self.rollups[res]
+            start = t - t % step
+            if len(ring) and ring.last(0) == start:
+                ring.set_last(1, min(ring.last(1), value))
+                ring.set_last(2, max(ring.last(2), value))
+                ring.set_last(3, ring.last(3) + value)
+                ring.set_last(4, ring.last(4) + 1)
+            else:
+                ring.append((start, value, value, value, 1.0))
+        self.updated = time.time()
+        return True
+
+    def matches(self, name: str | None, host: str | None, vendor: str | None) -> bool:
+        return (
+            (name is None or self.name == name)
+            and (host is None or self.resource.get("host") == host)
+            and (vendor is None or self.resource.get("vendor") == vendor)
+        )
+
+    def points(self, resolution: str, start: float, end: float) -> List[Any]:
+        if resolution == "raw":
+            return [[int(t * 1000), v] for t, v in self.raw.rows_between(start, end)]
+        return [
+            {"t": int(t * 1000), "min": lo, "max": hi, "avg": total / count, "count": int(count)}
+            for t, lo, hi, total, count in self.rollups[resolution].rows_between(start, end)
+        ]
+
+    def describe(self, key: str) -> Dict[str, Any]:
+        return {
+            "series": key,
+            "name": self.name,
+            "type": self.type,
+            "unit": self.unit,
+            "resource": self.resource,
+            "attributes": self.attributes,
+        }
+
+
+class MetricStore:
+    """Rolling in-memory time series of normalized metric points.
+
+    One series per (name, resource set, attribute set), keyed like
+    MetricSeriesIndex. Each series keeps the last `raw_points` samples
+    plus 1-minute and 1-hour min/max/sum/count rollups in preallocated
+    float64 rings. The series count is capped by `max_series` and by
+    `memory_bytes` / bytes per series, so memory stays within the budget:
+    series kept in update order, those idle for longer than the hourly
+    rollup horizon are dropped, and a new series beyond the cap evicts the
+    least recently updated one. Samples not newer than a series' newest one
+    are ignored. Thread-safe: fed by the follower thread and read from the
+    API loop.
+    """
+
+    def __init__(
+        self, raw_points: int, minute_points: int, hour_points: int, max_series: int, memory_bytes: int | None = None
+    ) -> None:
+        self.raw_points = int(raw_points)
+        self.rollup_points = {"1m": int(minute_points), "1h": int(hour_points)}
+        self.series_bytes = _Series.nbytes_for(self.raw_points, self.rollup_points)
+        limit = int(max_series)
+        if memory_bytes:
+            limit = min(limit, int(memory_bytes) // self.series_bytes)
+        self.max_series = max(1, limit)
+        self.idle_sec = 3600.0 * max(1, self.rollup_points["1h"])
+        self._series: "OrderedDict[str, _Series]" = OrderedDict()  # least recently updated first
+        self._lock = threading.Lock()
+        self.added_total = 0
+        self.late_total = 0
+        self.evicted_total = 0
+
+    def _evict_idle(self) -> None:
+        cutoff = time.time() - self.idle_sec
+        while self._series and next(iter(self._series.values())).updated < cutoff:
+            self._series.popitem(last=False)
+            self.evicted_total += 1
+
+    def add(self, items: Iterable[Dict[str, Any]]) -> int:
+        """Add decoded metric entries (see MetricCodec.decode); returns the number stored."""
+        added = 0
+        with self._lock:
+            self._evict_idle()
+            for item in items:
+                if item.get("rid") is None:
+                    continue
+                try:
+                    value = float(item.get("value"))  # type: ignore[arg-type]
+                except (TypeError, ValueError):
+                    continue
+                key = MetricSeriesIndex.series_key(str(item.get("name") or ""), item["rid"], item["aid"])
+                series = self._series.get(key)
+                if series is None:
+                    if len(self._series) >= self.max_series:
+                        self._series.popitem(last=False)
+                        self.evicted_total += 1
+                    series = _Series(item, self.raw_points, self.rollup_points)
+                    self._series[key] = series
+                ts_ns = int(item.get("ts") or 0)
+                t = ts_ns / 1e9 if ts_ns else int(str(item.get("id") or "0").split("-")[0]) / 1000
+                if series.add(t, value):
+                    self._series.move_to_end(key)
+                    added += 1
+                else:
+                    self.late_total += 1
+            self.added_total += added
+        return added
+
+    def _select(self, name: str | None, host: str | None, vendor: str | None) -> List[Tuple[str, _Series]]:
+        return sorted((k, s) for k, s in self._series.items() if s.matches(name, host, vendor))
+
+    def query(
+        self,
+        *,
+        name: str | None = None,
+        host: str | None = None,
+        vendor: str | None = None,
+        resolution: str = "raw",
+        start_ms: int,
+        end_ms: int,
+        cursor: str | None = None,
+        limit: int = 50,
+    ) -> Dict[str, Any]:
+        """Series matching the filters with their points in [start_ms, end_ms], paged like MetricSeriesIndex.query."""
+        if resolution != "raw" and resolution not in RESOLUTIONS:
+            raise ValueError(f"unknown resolution {resolution!r}")
+        start, end = start_ms / 1000, end_ms / 1000
+        items: List[Dict[str, Any]] = []
+        next_cursor = None
+        with self._lock:
+            for key, series in self._select(name, host, vendor):
+                if cursor is not None and key <= cursor:
+                    continue
+                if len(items) >= limit:
+                    next_cursor = items[-1]["series"]
+                    break
+                points = series.points(resolution, start, end)
+                if points:
+                    items.append({**series.describe(key), "points": points})
+        return {"series": items, "next_cursor": next_cursor}
+
+    def latest(self, *, name: str | None = None, host: str | None = None, vendor: str | None = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {**series.describe(key), "t": int(series.raw.last(0) * 1000), "value": series.raw.last(1)}
+                for key, series in self._select(name, host, vendor)
+                if len(series.raw)
+            ]
+
+    def recent(self, *, limit: int = 100, vendor: str | None = None, name_prefix: str | None = None) -> List[Dict[str, Any]]:
+        """The `limit` newest raw samples across matching series, newest first."""
+        with self._lock:
+            selected = [
+                (key, series)
+                for key, series in self._select(None, None, vendor)
+                if len(series.raw) and (not name_prefix or series.name.startswith(name_prefix))
+            ]
+            # k-way merge backwards from each series' newest sample
+            heap = [(-series.raw.last(0), index, 0) for index, (_, series) in enumerate(selected)]
+            heapq.heapify(heap)
+            items: List[Dict[str, Any]] = []
+            while heap and len(items) < limit:
+                neg_t, index, back = heapq.heappop(heap)
+                key, series = selected[index]
+                items.append({**series.describe(key), "t": int(-neg_t * 1000), "value": series.raw.last(1, back)})
+                if back + 1 < len(series.raw):
+                    heapq.heappush(heap, (-series.raw.last(0, back + 1), index, back + 1))
+        return items
+
+    def check_threshold(
+        self,
+        *,
+        name: str,
+        op: str,
+        threshold: float,
+        window_sec: float,
+        agg: str = "avg",
+        host: str | None = None,
+        vendor: str | None = None,
+        now: float | None = None,
+    ) -> List[Dict[str, Any]]:
+        """Series whose `agg` (last, avg, min, max) over the last `window_sec` compares `op` to `threshold`."""
+        compare = _OPS.get(op)
+        if compare is None or agg not in {"last", "avg", "min", "max"}:
+            raise ValueError(f"unsupported op={op!r} or agg={agg!r}")
+        end = now if now is not None else time.time()
+        breaches: List[Dict[str, Any]] = []
+        with self._lock:
+            for key, series in self._select(name, host, vendor):
+                values = [v for _, v in series.raw.rows_between(end - window_sec, end)]
+                if not values:
+                    continue
+                if agg == "last":
+                    observed = values[-1]
+                elif agg == "avg":
+                    observed = sum(values) / len(values)
+                else:
+                    observed = min(values) if agg == "min" else max(values)
+                if compare(observed, threshold):
+                    breaches.append({**series.describe(key), "observed": observed, "samples": len(values)})
+        return breaches
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            series = len(self._series)
+        return {
+            "series": series,
+            "max_series": self.max_series,
+            "bytes_per_series": self.series_bytes,
+            "allocated_bytes": series * self.series_bytes,
+            "raw_points": self.raw_points,
+            "rollup_points": dict(self.rollup_points),
+            "added_total": self.added_total,
+            "late_total": self.late_total,
+            "evicted_total": self.evicted_total,
+            "idle_sec": self.idle_sec,
+        }
+
+
+_store: MetricStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_metric_store() -> MetricStore:
+    """Return the process-wide metric store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MetricStore(
+                raw_points=settings.METRIC_STORE_RAW_POINTS,
+                minute_points=settings.METRIC_STORE_MINUTE_POINTS,
+                hour_points=settings.METRIC_STORE_HOUR_POINTS,
+                max_series=settings.METRIC_STORE_MAX_SERIES,
+                memory_bytes=int(settings.METRIC_STORE_MEMORY_MB * (1 << 20)),
+            )
+        return _store
+
+
+async def follow_metrics(client: Any, store: MetricStore) -> None:
+    """Feed `store` from the metrics stream: the last METRIC_STORE_WARM_ENTRIES entries, then new ones as they arrive.
+
+    A plain XREAD (no consumer group), so every API replica keeps a full store.
+    """
+    codec = MetricCodec(client)
+    warm = await client.xrevrange(METRICS_STREAM, count=max(0, int(settings.METRIC_STORE_WARM_ENTRIES))) or []
+    warm.reverse()
+    store.add(await codec.decode(warm))
+    last_id = warm[-1][0] if warm else "$"
+    LOG.info("metric store warmed entries=%d", len(warm))
+    while True:
+        try:
+            response = await client.xread({METRICS_STREAM: last_id}, count=1000, block=1000)
+        except Exception as exc:
+            LOG.info("metric store xread failed err=%s", exc)
+            await asyncio.sleep(1)
+            continue
+        for _stream, rows in response or []:
+            if rows:
+                store.add(await codec.decode(rows))
+                last_id = rows[-1][0]
+
+
+def attach_metric_store(app: FastAPI):
+    async def _run_forever():
+        client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        backoff = 1.0
+        while True:
+            try:
+                await follow_metrics(client, get_metric_store())
+            except Exception as exc:
+                LOG.info("metric store follower crashed err=%s; restarting in %.1fs", exc, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 10)
+
+    @app.on_event("startup")
+    async def startup_event():
+        if not settings.METRIC_STORE_ENABLED:
+            return
+        LOG.info("starting metric store follower in dedicated thread")
+        loop = asyncio.new_event_loop()
+
+        def _runner():
+            asyncio.set_event_loop(loop)
+            loop.create_task(_run_forever())
+            loop.run_forever()
+
+        thread = threading.Thread(target=_runner, name="metric-store-thread", daemon=True)
+        thread.start()
+        app.state.metric_store_loop = loop
+        app.state.metric_store_thread = thread
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        loop = getattr(app.state, "metric_store_loop", None)
+        thread = getattr(app.state, "metric_store_thread", None)
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout=5)
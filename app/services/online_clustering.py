@@ -2,8 +2,9 @@ from __future__ import annotations
 
 import uuid
 
-from app.services.prototype_router import nearest_prototype
-from app.services.chroma_service import ChromaClientProvider
+from app.services.prototype_router import _get_provider, nearest_prototype
+from app.services.prototype_index import get_prototype_index
+from app.services.template_routes import get_template_routes
 from app.core.config import settings
 
 
@@ -47,27 +48,32 @@ def assign_or_create_cluster(os_name: str, templated: str, *, threshold: float |
     # Create a new prototype seeded with this templated line as its medoid/centroid
     cid = f"cluster_{uuid.uuid4().hex[:12]}"
     try:
-        provider = ChromaClientProvider()
-        collection = provider.get_or_create_collection(_proto_collection_name(os_name))
+        provider = _get_provider()
+        coll_name = _proto_collection_name(os_name)
+        collection = provider.get_or_create_collection(coll_name)
+        # Embedding is a cache hit: nearest_prototype just embedded this text
+        embeddings = provider.embedding_fn([templated])
+        metadata = {
+            "os": os_name,
+            "label": "unknown",
+            "rationale": "online",
+            "size": 1,
+            "exemplars": [],
+            "created_by": "online",
+        }
         collection.add(
             ids=[cid],
             documents=[templated],
-            metadatas=[{
-                "os": os_name,
-                "label": "unknown",
-                "rationale": "online",
-                "size": 1,
-                "exemplars": [],
-                "created_by": "online",
-            }],
+            embeddings=embeddings,
+            metadatas=[metadata],
         )
+        get_prototype_index().upsert(coll_name, [cid], embeddings, [templated], [metadata])
+        if settings.TEMPLATE_ROUTES_ENABLED:
+            # The seed template is its own prototype; repeats skip routing
+            get_template_routes().put_many(
+                _suffix_for_os(os_name), [templated], [{"cluster_id": cid, "distance": 0.0, "label": "unknown"}]
+            )
     except Exception:
         # Best-effort; if storage fails we still return the id for downstream tagging
         pass
     return cid
-
-
-
-
-
-
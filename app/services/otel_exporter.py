@@ -1,7 +1,11 @@
 from __future__ import annotations
 
 import logging
-from typing import Any, Dict, List
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Tuple
 
 from app.core.config import get_settings
 
@@ -16,6 +20,8 @@ _runtime_enabled: bool | None = None
 _export_total: int = 0
 _last_export_ns: int = 0
 
+AttrKey = Tuple[Tuple[str, Any], ...]
+
 
 def _setup_otel() -> None:
     global _otel_ready, _meter
@@ -39,39 +45,230 @@ def _setup_otel() -> None:
         _otel_ready = False
 
 
+def _attr_value(value: Any) -> Any:
+    return value if isinstance(value, (str, bool, int, float)) else str(value)
+
+
+class _LatestValues:
+    """Last value per attribute set, reported by an observable instrument's callback.
+
+    Kept in update order: attribute sets not updated for `stale_sec` are
+    dropped when observed, and beyond `max_sets` the least recently updated
+    set is evicted, so high-cardinality tags cannot grow it without bound.
+    """
+
+    def __init__(self, max_sets: int, stale_sec: float) -> None:
+        self.max_sets = max(1, int(max_sets))
+        self.stale_sec = float(stale_sec)
+        self._values: "OrderedDict[AttrKey, Tuple[float, float]]" = OrderedDict()  # attrs -> (value, updated)
+        self._lock = threading.Lock()
+        self.evicted_total = 0
+
+    def set(self, attributes: AttrKey, value: float) -> None:
+        with self._lock:
+            self._values[attributes] = (value, time.monotonic())
+            self._values.move_to_end(attributes)
+            while len(self._values) > self.max_sets:
+                self._values.popitem(last=False)
+                self.evicted_total += 1
+
+    def observe(self, _options: Any = None) -> Iterable[Any]:
+        from opentelemetry.metrics import Observation
+
+        with self._lock:
+            if self.stale_sec > 0:
+                cutoff = time.monotonic() - self.stale_sec
+                while self._values and next(iter(self._values.values()))[1] < cutoff:
+                    self._values.popitem(last=False)
+                    self.evicted_total += 1
+            items = [(attrs, value) for attrs, (value, _) in self._values.items()]
+        return [Observation(value, dict(attrs)) for attrs, value in items]
+
+
+class InstrumentRegistry:
+    """OTel instruments keyed by metric name, created once per name.
+
+    The declared type of a name's first point picks the instrument:
+    "histogram" records into a Histogram; "gauge" sets a synchronous Gauge
+    when the API has one, else an observable gauge reporting the last value
+    per attribute set; "sum" values are cumulative totals (e.g. SNMP
+    counters), reported through an observable counter. Unknown types are
+    treated as gauges. Later points of the name go to that instrument
+    whatever their type or unit, since the SDK drops a name registered as
+    two instruments. At most `max_instruments` are created; points for
+    further names are rejected.
+    """
+
+    def __init__(self, meter: Any, max_instruments: int, max_attribute_sets: int = 1000, stale_sec: float = 600.0) -> None:
+        self.meter = meter
+        self.max_instruments = max(1, int(max_instruments))
+        self.max_attribute_sets = max_attribute_sets
+        self.stale_sec = stale_sec
+        self._instruments: Dict[str, Callable[[float, AttrKey], None] | None] = {}
+        self._latest: List[_LatestValues] = []
+
+    def __len__(self) -> int:
+        return len(self._instruments)
+
+    def _create(self, name: str, unit: str, kind: str) -> Callable[[float, AttrKey], None]:
+        unit_arg = unit or ""
+        if kind == "histogram":
+            histogram = self.meter.create_histogram(name, unit=unit_arg)
+            return lambda value, attrs: histogram.record(value, attributes=dict(attrs))
+        if kind == "gauge" and hasattr(self.meter, "create_gauge"):
+            gauge = self.meter.create_gauge(name, unit=unit_arg)
+            return lambda value, attrs: gauge.set(value, attributes=dict(attrs))
+        latest = _LatestValues(self.max_attribute_sets, self.stale_sec)
+        self._latest.append(latest)
+        if kind == "sum":
+            self.meter.create_observable_counter(name, callbacks=[latest.observe], unit=unit_arg)
+        else:
+            self.meter.create_observable_gauge(name, callbacks=[latest.observe], unit=unit_arg)
+        return lambda value, attrs: latest.set(attrs, value)
+
+    def record(self, name: str, unit: str, kind: str, value: float, attributes: AttrKey) -> bool:
+        recorder = self._instruments.get(name)
+        if recorder is None:
+            if name in self._instruments or len(self._instruments) >= self.max_instruments:
+                return False
+            try:
+                recorder = self._create(name, unit, kind)
+            except Exception as exc:  # noqa: BLE001
+                LOG.info("OTel instrument creation failed name=%s type=%s err=%s", name, kind, exc)
+                recorder = None
+            self._instruments[name] = recorder
+            if recorder is None:
+                return False
+        recorder(value, attributes)
+        return True
+
+    def evicted_total(self) -> int:
+        return sum(latest.evicted_total for latest in self._latest)
+
+
+class _ExportWorker:
+    """Bounded point queue drained by a daemon thread that records into OTel.
+
+    `submit` never blocks the caller: when the queue is full the remaining
+    points of the batch are dropped and counted.
+    """
+
+    def __init__(self, maxsize: int, max_instruments: int) -> None:
+        self.queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max(1, int(maxsize)))
+        self.max_instruments = max_instruments
+        self.registry: InstrumentRegistry | None = None
+        self.dropped_total = 0
+        self.rejected_total = 0  # non-numeric values or no instrument available
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, points: List[Dict[str, Any]]) -> int:
+        self._ensure_thread()
+        for i, mp in enumerate(points):
+            try:
+                self.queue.put_nowait(mp)
+            except queue.Full:
+                dropped = len(points) - i
+                with self._lock:
+                    self.dropped_total += dropped
+                return i
+        return len(points)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="otel-export-thread", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < 1000:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                self._record(batch)
+            except Exception as exc:  # noqa: BLE001
+                LOG.info("OTel export failed err=%s", exc)
+
+    def _record(self, batch: List[Dict[str, Any]]) -> None:
+        global _export_total, _last_export_ns
+        if not _otel_ready:
+            _setup_otel()
+        if not _otel_ready or _meter is None:
+            with self._lock:
+                self.dropped_total += len(batch)
+            return
+        if self.registry is None:
+            self.registry = InstrumentRegistry(
+                _meter,
+                self.max_instruments,
+                max_attribute_sets=settings.OTEL_MAX_ATTRIBUTE_SETS,
+                stale_sec=settings.OTEL_ATTRIBUTE_STALE_SEC,
+            )
+        exported = 0
+        rejected = 0
+        for mp in batch:
+            try:
+                value = float(mp.get("value"))  # type: ignore[arg-type]
+            except (TypeError, ValueError):
+                rejected += 1
+                continue
+            attrs: Dict[str, Any] = {}
+            for source in (mp.get("resource"), mp.get("attributes")):
+                if source:
+                    attrs.update(source)
+            key = tuple(sorted((str(k), _attr_value(v)) for k, v in attrs.items() if v is not None))
+            name = str(mp.get("name") or "metric.value")
+            kind = str(mp.get("type") or "gauge")
+            if self.registry.record(name, str(mp.get("unit") or ""), kind, value, key):
+                exported += 1
+            else:
+                rejected += 1
+        with self._lock:
+            self.rejected_total += rejected
+        if exported:
+            _export_total += exported
+            _last_export_ns = time.time_ns()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "dropped_total": self.dropped_total,
+            "rejected_total": self.rejected_total,
+            "instruments": len(self.registry) if self.registry is not None else 0,
+            "evicted_attribute_sets": self.registry.evicted_total() if self.registry is not None else 0,
+        }
+
+
+_worker: _ExportWorker | None = None
+_worker_lock = threading.Lock()
+
+
+def _get_worker() -> _ExportWorker:
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = _ExportWorker(settings.OTEL_EXPORT_QUEUE_SIZE, settings.OTEL_MAX_INSTRUMENTS)
+        return _worker
+
+
 def export_metrics(points: List[Dict[str, Any]]) -> None:
-    """Best-effort export: record metrics as histograms with attributes.
-    Uses dynamic instruments by metric name. If OTel is not available, no-op.
+    """Best-effort export: queue points for the OTel export thread.
+
+    Returns immediately; instruments are created and recorded on the
+    export thread (see InstrumentRegistry). If OTel is not available or
+    the queue is full, points are dropped and counted.
     """
-    global _export_total, _last_export_ns
     enabled = _runtime_enabled if _runtime_enabled is not None else settings.ENABLE_OTEL_EXPORT
-    if not enabled:
-        return
-    if not _otel_ready:
-        _setup_otel()
-    if not _otel_ready or _meter is None:
+    if not enabled or not points:
         return
-    try:
-        # Avoid unbounded instrument creation by limiting unique names
-        for mp in points[:1000]:
-            name = str(mp.get("name") or "metric.value")
-            unit = mp.get("unit")
-            value = mp.get("value")
-            attributes = {**(mp.get("resource") or {}), **(mp.get("attributes") or {})}
-            # Use histogram to record numeric values generically
-            hist = _meter.create_histogram(name, unit=unit or None)
-            try:
-                v = float(value)
-            except Exception:
-                continue
-            hist.record(v, attributes=attributes)
-            _export_total += 1
-        # update last export time when at least one point was exported
-        if points:
-            import time as _time
-            _last_export_ns = int(_time.time() * 1e9)
-    except Exception as exc:  # noqa: BLE001
-        LOG.info("OTel export failed err=%s", exc)
+    _get_worker().submit(points)
 
 
 def get_export_status() -> dict[str, object]:
@@ -85,6 +282,7 @@ def get_export_status() -> dict[str, object]:
         "last_export_time": last_iso,
         "endpoint": settings.OTEL_EXPORTER_OTLP_ENDPOINT,
         "service_name": settings.OTEL_SERVICE_NAME,
+        **(_worker.stats() if _worker is not None else {}),
     }
 
 
@@ -92,5 +290,3 @@ def set_export_enabled(value: bool) -> dict[str, object]:
     global _runtime_enabled
     _runtime_enabled = bool(value)
     return get_export_status()
-
-
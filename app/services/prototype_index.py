@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+
+
+class _Shard:
+    """Prototype centroids of one proto_<os> collection.
+
+    Rows live in a growable contiguous buffer; `unit` holds L2-normalized
+    centroids and `norms` their original lengths so distances can be
+    reported in the collection's own space.
+    """
+
+    def __init__(self, space: str) -> None:
+        self.space = space
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.rows: Dict[str, int] = {}
+        self.unit = np.zeros((0, 0), dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.loaded_at = time.time()
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    def _reserve(self, extra: int, dim: int) -> None:
+        if self.unit.shape[1] != dim:
+            if self.size:
+                raise ValueError(f"embedding dimension mismatch: index={self.unit.shape[1]} new={dim}")
+            self.unit = np.zeros((0, dim), dtype=np.float32)
+        needed = self.size + extra
+        if needed <= self.unit.shape[0]:
+            return
+        capacity = max(needed, 2 * self.unit.shape[0], 64)
+        unit = np.zeros((capacity, dim), dtype=np.float32)
+        norms = np.zeros(capacity, dtype=np.float32)
+        unit[: self.size] = self.unit[: self.size]
+        norms[: self.size] = self.norms[: self.size]
+        self.unit, self.norms = unit, norms
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings: Any,
+        documents: Sequence[str] | None,
+        metadatas: Sequence[Dict[str, Any] | None] | None,
+    ) -> None:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(ids) != vectors.shape[0]:
+            raise ValueError("embeddings must be a (len(ids), dim) matrix")
+        if not len(ids):
+            return
+        norms = np.linalg.norm(vectors, axis=1)
+        unit = vectors / np.where(norms > 0, norms, 1.0)[:, None]
+        self._reserve(sum(1 for i in ids if i not in self.rows), vectors.shape[1])
+        for j, pid in enumerate(ids):
+            row = self.rows.get(pid)
+            if row is None:
+                row = self.size
+                self.rows[pid] = row
+                self.ids.append(pid)
+                self.documents.append("")
+                self.metadatas.append({})
+            self.unit[row] = unit[j]
+            self.norms[row] = norms[j]
+            if documents is not None:
+                self.documents[row] = documents[j] or ""
+            if metadatas is not None:
+                self.metadatas[row] = dict(metadatas[j] or {})
+
+    def distances(self, queries: np.ndarray) -> np.ndarray:
+        """Distance matrix (queries x prototypes) in the collection's space."""
+        q_norms = np.linalg.norm(queries, axis=1)
+        q_unit = queries / np.where(q_norms > 0, q_norms, 1.0)[:, None]
+        cos = q_unit @ self.unit[: self.size].T
+        if self.space == "cosine":
+            return 1.0 - cos
+        scaled = cos * q_norms[:, None] * self.norms[None, : self.size]
+        if self.space == "ip":
+            return 1.0 - scaled
+        # default Chroma space: squared L2
+        sq = (q_norms ** 2)[:, None] + (self.norms[None, : self.size] ** 2) - 2.0 * scaled
+        return np.maximum(sq, 0.0)
+
+
+class PrototypeIndex:
+    """Process-local, thread-safe index of prototype centroids per collection.
+
+    Chroma remains the durable store: shards are loaded from a collection on
+    first use (and reloaded after `refresh_sec`), then kept current through
+    `upsert`/`update_metadata` calls from the code paths that write
+    prototypes. Top-k queries, batched or not, are one matrix product.
+    """
+
+    def __init__(self, refresh_sec: float = 0.0) -> None:
+        self.refresh_sec = float(refresh_sec)
+        self._lock = threading.RLock()
+        self._shards: Dict[str, _Shard] = {}
+
+    def is_fresh(self, name: str) -> bool:
+        with self._lock:
+            shard = self._shards.get(name)
+            if shard is None:
+                return False
+            return not self.refresh_sec or (time.time() - shard.loaded_at) < self.refresh_sec
+
+    def load(self, name: str, collection: Any) -> None:
+        """(Re)build the shard for `name` from a Chroma collection."""
+        data = collection.get(include=["embeddings", "documents", "metadatas"]) or {}
+        ids = list(data.get("ids") or [])
+        embeddings = data.get("embeddings")
+        space = str((getattr(collection, "metadata", None) or {}).get("hnsw:space") or "l2")
+        shard = _Shard(space)
+        if ids and embeddings is not None and len(embeddings):
+            shard.upsert(ids, embeddings, data.get("documents"), data.get("metadatas"))
+        with self._lock:
+            self._shards[name] = shard
+
+    def ensure_loaded(self, name: str, get_collection: Callable[[], Any]) -> None:
+        """Load the shard for `name` if missing or stale; `get_collection` is only called then."""
+        if not self.is_fresh(name):
+            self.load(name, get_collection())
+
+    def upsert(
+        self,
+        name: str,
+        ids: Sequence[str],
+        embeddings: Any,
+        documents: Sequence[str] | None = None,
+        metadatas: Sequence[Dict[str, Any] | None] | None = None,
+    ) -> None:
+        """Apply an upsert that was just written to Chroma.
+
+        Shards that were never loaded are skipped; they pick up the change
+        from Chroma on first use.
+        """
+        with self._lock:
+            shard = self._shards.get(name)
+            if shard is not None:
+                shard.upsert(ids, embeddings, documents, metadatas)
+
+    def update_metadata(self, name: str, ids: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
+        with self._lock:
+            shard = self._shards.get(name)
+            if shard is None:
+                return
+            for pid, meta in zip(ids, metadatas):
+                row = shard.rows.get(pid)
+                if row is not None:
+                    shard.metadatas[row] = dict(meta or {})
+
+    def invalidate(self, name: str | None = None) -> None:
+        with self._lock:
+            if name is None:
+                self._shards.clear()
+            else:
+                self._shards.pop(name, None)
+
+    def query(self, name: str, embeddings: Any, k: int = 1) -> List[List[Dict[str, Any]]]:
+        """Top-k prototypes per query vector as {id, document, distance, metadata}."""
+        queries = np.asarray(embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        with self._lock:
+            shard = self._shards.get(name)
+            if shard is None or not shard.size or not len(queries):
+                return [[] for _ in range(len(queries))]
+            dists = shard.distances(queries)
+            k = max(1, min(int(k), shard.size))
+            if k < shard.size:
+                top = np.argpartition(dists, k - 1, axis=1)[:, :k]
+            else:
+                top = np.tile(np.arange(shard.size), (len(queries), 1))
+            out: List[List[Dict[str, Any]]] = []
+            for qi in range(len(queries)):
+                order = top[qi][np.argsort(dists[qi, top[qi]], kind="stable")]
+                out.append([
+                    {
+                        "id": shard.ids[row],
+                        "document": shard.documents[row],
+                        "distance": float(dists[qi, row]),
+                        "metadata": shard.metadatas[row],
+                    }
+                    for row in order
+                ])
+            return out
+
+
+_index: PrototypeIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_prototype_index() -> PrototypeIndex:
+    """Return the process-wide prototype index."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PrototypeIndex(refresh_sec=settings.PROTOTYPE_INDEX_REFRESH_SEC)
+        return _index
@@ -1,12 +1,20 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List
+import logging
+import threading
+from typing import Any, Dict, List, Sequence, Tuple
 
 from app.services.chroma_service import ChromaClientProvider
+from app.services.prototype_index import get_prototype_index
+from app.services.template_routes import Route, get_template_routes
 from app.core.config import settings
 
 
 _provider: ChromaClientProvider | None = None
+_provider_lock = threading.Lock()
+# proto_<os> collection handles; with CHROMA_MODE=http each lookup is a round trip
+_collections: Dict[str, Any] = {}
+LOG = logging.getLogger(__name__)
 
 
 def _suffix_for_os(os_name: str) -> str:
@@ -26,26 +34,34 @@ def _proto_collection_name(os_name: str) -> str:
 
 def _get_provider() -> ChromaClientProvider:
     global _provider
-    if _provider is None:
-        _provider = ChromaClientProvider()
+    # Routing runs on worker threads; build the provider only once
+    with _provider_lock:
+        if _provider is None:
+            _provider = ChromaClientProvider()
     return _provider
 
 
-def nearest_prototype(os_name: str, templated_text: str, k: int = 3) -> List[Dict[str, Any]]:
-    """Return top-k nearest prototypes from proto_<os> with distances.
+def _get_collection(collection_name: str) -> Any:
+    collection = _collections.get(collection_name)
+    if collection is None:
+        collection = _get_provider().get_or_create_collection(collection_name)
+        with _provider_lock:
+            collection = _collections.setdefault(collection_name, collection)
+    return collection
 
-    Output per item: {id, document, distance, metadata}
-    """
-    provider = _get_provider()
-    collection = provider.get_or_create_collection(_proto_collection_name(os_name))
-    if not templated_text:
-        return []
-    result = collection.query(query_texts=[templated_text], n_results=max(1, k), include=["distances", "metadatas", "documents"])
+
+def _column(result: Dict[str, Any], key: str, qi: int) -> List[Any]:
+    col = result.get(key) or []
+    return (col[qi] or []) if qi < len(col) else []
+
+
+def _rows_from_result(result: Dict[str, Any], qi: int) -> List[Dict[str, Any]]:
+    """Convert the qi-th query of a Chroma query result into rows."""
+    ids = _column(result, "ids", qi)
+    docs = _column(result, "documents", qi)
+    dists = _column(result, "distances", qi)
+    metas = _column(result, "metadatas", qi)
     out: List[Dict[str, Any]] = []
-    ids = (result.get("ids") or [[]])[0]
-    docs = (result.get("documents") or [[]])[0]
-    dists = (result.get("distances") or [[]])[0]
-    metas = (result.get("metadatas") or [[]])[0]
     for i in range(len(ids)):
         out.append({
             "id": ids[i],
@@ -56,3 +72,110 @@ def nearest_prototype(os_name: str, templated_text: str, k: int = 3) -> List[Dic
     return out
 
 
+def _route(collection_name: str, texts: List[str], k: int) -> List[List[Dict[str, Any]]]:
+    """Embed `texts` once and return top-k prototypes per text.
+
+    Served from the in-memory prototype index when enabled; otherwise one
+    multi-query call against the Chroma collection.
+    """
+    embeddings = _get_provider().embedding_fn(texts)
+    if settings.PROTOTYPE_INDEX_ENABLED:
+        # Chroma is only touched when the shard has to be (re)loaded
+        index = get_prototype_index()
+        index.ensure_loaded(collection_name, lambda: _get_collection(collection_name))
+        return index.query(collection_name, embeddings, k=max(1, k))
+    result = _get_collection(collection_name).query(
+        query_embeddings=embeddings,
+        n_results=max(1, k),
+        include=["distances", "metadatas", "documents"],
+    )
+    return [_rows_from_result(result, qi) for qi in range(len(texts))]
+
+
+def _rows_from_route(route: Route) -> List[Dict[str, Any]]:
+    if not route.get("cluster_id"):
+        return []
+    return [{
+        "id": route["cluster_id"],
+        "document": "",
+        "distance": route.get("distance"),
+        "metadata": {"label": route.get("label") or ""},
+    }]
+
+
+def _route_from_rows(rows: List[Dict[str, Any]]) -> Route:
+    if not rows:
+        return {"cluster_id": "", "distance": None, "label": ""}
+    top = rows[0]
+    return {
+        "cluster_id": str(top.get("id") or ""),
+        "distance": top.get("distance"),
+        "label": (top.get("metadata") or {}).get("label") or "",
+    }
+
+
+def _route_top1(os_key: str, texts: List[str]) -> List[List[Dict[str, Any]]]:
+    """Top-1 routing through the exact-template table; only unseen templates are embedded.
+
+    Rows served from the table carry the prototype id, distance and label
+    (as metadata) but no document.
+    """
+    if not settings.TEMPLATE_ROUTES_ENABLED:
+        return _route(_proto_collection_name(os_key), texts, 1)
+    table = get_template_routes()
+    cached = table.get_many(os_key, texts)
+    out: List[List[Dict[str, Any]]] = [_rows_from_route(route) if route is not None else [] for route in cached]
+    misses = [i for i, route in enumerate(cached) if route is None]
+    if misses:
+        routed = _route(_proto_collection_name(os_key), [texts[i] for i in misses], 1)
+        for i, rows in zip(misses, routed):
+            out[i] = rows
+        table.put_many(os_key, [texts[i] for i in misses], [_route_from_rows(rows) for rows in routed])
+    return out
+
+
+def nearest_prototype(os_name: str, templated_text: str, k: int = 3) -> List[Dict[str, Any]]:
+    """Return top-k nearest prototypes from proto_<os> with distances.
+
+    Output per item: {id, document, distance, metadata}. Top-1 lookups of
+    already routed templates are answered from the template route table.
+    """
+    if not templated_text:
+        return []
+    if k == 1:
+        return _route_top1(_suffix_for_os(os_name), [templated_text])[0]
+    return _route(_proto_collection_name(os_name), [templated_text], k)[0]
+
+
+def nearest_prototypes(items: Sequence[Tuple[str, str]], k: int = 1) -> List[List[Dict[str, Any]]]:
+    """Batched variant of `nearest_prototype` for (os_name, templated_text) pairs.
+
+    Items are grouped by OS and each group's unique texts are embedded and
+    routed in one call. Results are returned in input order. A failing OS
+    group yields empty results for its items instead of failing the batch.
+    """
+    results: List[List[Dict[str, Any]]] = [[] for _ in items]
+    if not items:
+        return results
+
+    # os suffix -> unique text -> input positions
+    groups: Dict[str, Dict[str, List[int]]] = {}
+    for pos, (os_name, text) in enumerate(items):
+        if not text:
+            continue
+        groups.setdefault(_suffix_for_os(os_name), {}).setdefault(text, []).append(pos)
+
+    for os_key, by_text in groups.items():
+        texts = list(by_text.keys())
+        try:
+            if k == 1:
+                rows_per_text = _route_top1(os_key, texts)
+            else:
+                rows_per_text = _route(_proto_collection_name(os_key), texts, k)
+        except Exception as exc:
+            LOG.info("batched prototype routing failed os=%s queries=%d err=%s", os_key, len(texts), exc)
+            continue
+        for text, rows in zip(texts, rows_per_text):
+            for pos in by_text[text]:
+                results[pos] = rows
+    return results
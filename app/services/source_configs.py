@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.data_source import DataSource
+
+
+LOG = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SourceSnapshot:
+    """Read-only copy of a DataSource row, safe to share between event loops."""
+
+    id: int
+    name: str
+    type: str
+    enabled: bool
+    config: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_row(cls, row: DataSource) -> "SourceSnapshot":
+        return cls(
+            id=int(row.id),
+            name=str(row.name),
+            type=str(row.type),
+            enabled=bool(row.enabled),
+            config=dict(row.config) if isinstance(row.config, dict) else {},
+        )
+
+
+class SourceConfigCache:
+    """In-process TTL cache of DataSource rows for the hot paths.
+
+    The consumer needs a source's config for every metric sample, and the
+    telegraf endpoint needs the enabled agents for every push; both read
+    through this cache instead of querying Postgres each time. Missing ids
+    are cached too. Writes through the sources API call `invalidate()`,
+    which drops local entries and bumps a generation counter in Redis;
+    other processes notice the new generation within `sync_sec` and drop
+    theirs, so edits apply everywhere well before `ttl_sec`. The cache is
+    shared by several event loops, so it keeps a synchronous Redis client
+    and runs its calls on a worker thread.
+    """
+
+    GENERATION_KEY = "datasource:config:gen"
+    _REDIS_COOLDOWN_SEC = 30.0
+
+    def __init__(self, ttl_sec: float = 30.0, sync_sec: float = 2.0, redis_url: str | None = None) -> None:
+        self.ttl_sec = float(ttl_sec)
+        self.sync_sec = float(sync_sec)
+        self._entries: Dict[int, Tuple[SourceSnapshot | None, float]] = {}
+        self._agents: Tuple[List[SourceSnapshot], float] | None = None
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._synced_at = 0.0
+        self._redis = None
+        self._redis_down_until = 0.0
+        if redis_url:
+            import redis as _redis
+
+            self._redis = _redis.Redis.from_url(redis_url, decode_responses=True, socket_timeout=1.0)
+        self.hits = 0
+        self.misses = 0
+
+    # --- cross-process invalidation ------------------------------------
+
+    def _redis_available(self) -> bool:
+        return self._redis is not None and time.time() >= self._redis_down_until
+
+    def _redis_failed(self, exc: Exception) -> None:
+        self._redis_down_until = time.time() + self._REDIS_COOLDOWN_SEC
+        LOG.info("source config cache redis unavailable err=%s", exc)
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._agents = None
+
+    async def _sync(self) -> None:
+        now = time.time()
+        if not self._redis_available() or now - self._synced_at < self.sync_sec:
+            return
+        self._synced_at = now
+        try:
+            generation = int(await asyncio.to_thread(self._redis.get, self.GENERATION_KEY) or 0)  # type: ignore[union-attr]
+        except Exception as exc:  # pragma: no cover - network
+            self._redis_failed(exc)
+            return
+        if generation != self._generation:
+            self._generation = generation
+            self._clear()
+
+    async def invalidate(self, source_id: int | None = None) -> None:
+        """Forget `source_id` (or everything) here and, via Redis, in other processes."""
+        with self._lock:
+            if source_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(int(source_id), None)
+            self._agents = None
+        if not self._redis_available():
+            return
+        try:
+            generation = int(await asyncio.to_thread(self._redis.incr, self.GENERATION_KEY))  # type: ignore[union-attr]
+        except Exception as exc:  # pragma: no cover - network
+            self._redis_failed(exc)
+            return
+        if generation != self._generation + 1:
+            # another process invalidated since our last sync
+            self._clear()
+        self._generation = generation
+        self._synced_at = time.time()
+
+    # --- lookups ---------------------------------------------------------
+
+    async def get(self, source_id: int, db: AsyncSession | None = None) -> SourceSnapshot | None:
+        await self._sync()
+        now = time.time()
+        with self._lock:
+            cached = self._entries.get(source_id)
+        if cached is not None and cached[1] > now:
+            self.hits += 1
+            return cached[0]
+        self.misses += 1
+        if db is not None:
+            row = await db.get(DataSource, source_id)
+        else:
+            async with AsyncSessionLocal() as session:  # type: ignore
+                row = await session.get(DataSource, source_id)
+        snapshot = SourceSnapshot.from_row(row) if row is not None else None
+        with self._lock:
+            self._entries[source_id] = (snapshot, now + self.ttl_sec)
+        return snapshot
+
+    async def get_config(self, source_id: int) -> Dict[str, Any]:
+        snapshot = await self.get(source_id)
+        return snapshot.config if snapshot is not None else {}
+
+    async def telegraf_agents(self, db: AsyncSession | None = None) -> List[SourceSnapshot]:
+        """Enabled telegraf sources."""
+        await self._sync()
+        now = time.time()
+        with self._lock:
+            cached = self._agents
+        if cached is not None and cached[1] > now:
+            self.hits += 1
+            return cached[0]
+        self.misses += 1
+        query = select(DataSource).where(DataSource.type == "telegraf", DataSource.enabled == True)  # noqa: E712
+        if db is not None:
+            rows = (await db.execute(query)).scalars().all()
+        else:
+            async with AsyncSessionLocal() as session:  # type: ignore
+                rows = (await session.execute(query)).scalars().all()
+        agents = [SourceSnapshot.from_row(row) for row in rows]
+        with self._lock:
+            self._agents = (agents, now + self.ttl_sec)
+            for agent in agents:
+                self._entries[agent.id] = (agent, now + self.ttl_sec)
+        return agents
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "ttl_sec": self.ttl_sec,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+_cache: SourceConfigCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_source_configs() -> SourceConfigCache:
+    """Return the process-wide DataSource config cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SourceConfigCache(
+                ttl_sec=settings.SOURCE_CONFIG_CACHE_TTL_SEC,
+                sync_sec=settings.SOURCE_CONFIG_CACHE_SYNC_SEC,
+                redis_url=settings.REDIS_URL,
+            )
+        return _cache
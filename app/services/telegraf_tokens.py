@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+from typing import Any, Iterable
+
+import redis.asyncio as aioredis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.data_source import DataSource
+
+
+LOG = logging.getLogger(__name__)
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TelegrafTokenIndex:
+    """Redis hash of sha256(token) -> source_id for enabled telegraf sources.
+
+    Lets `ingest_telegraf` authenticate a push with one HGET instead of
+    scanning every agent's config. Only digests are stored, never tokens.
+    The sources API keeps it in sync on create/update/delete; the first
+    lookup after the index is missing (new deployment, flushed Redis, or a
+    failed sync that called `invalidate()`) rebuilds it from Postgres.
+    Entries are only removed while they still map to the source being
+    changed, so sources sharing a token keep theirs.
+    """
+
+    KEY = "telegraf:tokens"
+    BUILT_KEY = "telegraf:tokens:built"
+    # HDEL the digest only if it still maps to the given source id
+    _REMOVE_SCRIPT = """
+if redis.call("hget", KEYS[1], ARGV[1]) == ARGV[2] then
+    return redis.call("hdel", KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+    def __init__(self, client: Any) -> None:
+        self.client = client
+
+    @staticmethod
+    def _token_of(source: Any) -> str:
+        config = getattr(source, "config", None) or {}
+        return str(config.get("token") or "")
+
+    async def rebuild(self, sources: Iterable[Any]) -> int:
+        mapping = {
+            token_digest(self._token_of(s)): str(s.id)
+            for s in sources
+            if s.type == "telegraf" and s.enabled and self._token_of(s)
+        }
+        tmp = f"{self.KEY}:rebuild"
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(tmp)
+        if mapping:
+            pipe.hset(tmp, mapping=mapping)
+            pipe.rename(tmp, self.KEY)
+        else:
+            pipe.delete(self.KEY)
+        pipe.set(self.BUILT_KEY, "1")
+        await pipe.execute()
+        LOG.info("telegraf token index rebuilt tokens=%d", len(mapping))
+        return len(mapping)
+
+    async def _ensure_built(self, db: AsyncSession) -> None:
+        if await self.client.exists(self.BUILT_KEY):
+            return
+        rows = (await db.execute(select(DataSource).where(DataSource.type == "telegraf"))).scalars().all()
+        await self.rebuild(rows)
+
+    async def lookup(self, token: str, db: AsyncSession) -> int | None:
+        """source_id registered for `token`, or None."""
+        await self._ensure_built(db)
+        raw = await self.client.hget(self.KEY, token_digest(token))
+        return int(raw) if raw else None
+
+    def _queue_remove(self, pipe: Any, token: str, source_id: Any) -> None:
+        pipe.eval(self._REMOVE_SCRIPT, 1, self.KEY, token_digest(token), str(source_id))
+
+    async def sync_source(self, source: Any, previous_token: str | None = None) -> None:
+        """Reflect a created/updated source: drop its old token, index the current one if enabled."""
+        pipe = self.client.pipeline(transaction=True)
+        current = self._token_of(source)
+        if previous_token and previous_token != current:
+            self._queue_remove(pipe, previous_token, source.id)
+        if current:
+            if source.type == "telegraf" and source.enabled:
+                pipe.hset(self.KEY, token_digest(current), str(source.id))
+            else:
+                self._queue_remove(pipe, current, source.id)
+        await pipe.execute()
+
+    async def remove(self, token: str | None, source_id: Any) -> None:
+        """Drop `token` if it is still registered for `source_id`."""
+        if token:
+            pipe = self.client.pipeline(transaction=False)
+            self._queue_remove(pipe, token, source_id)
+            await pipe.execute()
+
+    async def repair(self, token: str, source_id: Any) -> None:
+        """Register `token` for `source_id` after a lookup missed a valid agent."""
+        await self.client.hset(self.KEY, token_digest(token), str(source_id))
+
+    async def invalidate(self) -> None:
+        """Have the next lookup rebuild the index from Postgres (e.g. after a failed sync)."""
+        await self.client.delete(self.BUILT_KEY)
+
+
+_index: TelegrafTokenIndex | None = None
+
+
+def get_telegraf_tokens() -> TelegrafTokenIndex:
+    """Return the API process's token index (used from the API event loop only)."""
+    global _index
+    if _index is None:
+        _index = TelegrafTokenIndex(aioredis.from_url(settings.REDIS_URL, decode_responses=True))
+    return _index
@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence, Tuple
+
+from app.core.config import settings
+
+
+LOG = logging.getLogger(__name__)
+
+# Route for one templated string: nearest prototype id ("" if none), its distance and label
+Route = Dict[str, Any]
+
+
+def template_key(templated: str) -> str:
+    return hashlib.sha1(templated.encode("utf-8", errors="replace")).hexdigest()
+
+
+class TemplateRouteTable:
+    """Exact-template routing table: sha1(templated) -> (cluster_id, distance, label).
+
+    Identical templated strings embed identically, so once a template has
+    been routed against proto_<os> the answer can be reused without calling
+    the embedding model or Chroma. Entries live in an in-process LRU and are
+    written through to per-OS Redis hashes so replicas and restarts share
+    them. Routes that ended far from every prototype expire after
+    `miss_ttl_sec`, since online clustering may add a closer one.
+
+    The Redis tier is bounded like a two-generation LRU: once the current
+    hash holds `redis_max_entries` routes it is renamed to the previous
+    one (replacing it) and a new current hash starts. Lookups that miss
+    the current hash fall back to the previous one and promote what they
+    find, so routes still in use survive and the rest age out.
+
+    `invalidate(os)` bumps a per-OS generation in Redis; every process drops
+    its local entries for that OS when it notices the new generation.
+    Label updates are kept as per-cluster overrides applied on lookup.
+    """
+
+    _REDIS_COOLDOWN_SEC = 30.0
+    # rotate current -> previous atomically, so concurrent writers rotate once
+    _ROTATE_SCRIPT = """
+if redis.call("hlen", KEYS[1]) >= tonumber(ARGV[1]) then
+    redis.call("rename", KEYS[1], KEYS[2])
+    return 1
+end
+return 0
+"""
+
+    def __init__(
+        self,
+        max_entries: int,
+        miss_ttl_sec: float = 60.0,
+        redis_url: str | None = None,
+        sync_sec: float = 5.0,
+        redis_max_entries: int = 200_000,
+    ) -> None:
+        self.max_entries = max(0, int(max_entries))
+        self.redis_max_entries = max(1, int(redis_max_entries))
+        self.miss_ttl_sec = float(miss_ttl_sec)
+        self.sync_sec = float(sync_sec)
+        self._lru: "OrderedDict[Tuple[str, str], Tuple[str, float | None, str, float]]" = OrderedDict()
+        self._labels: Dict[Tuple[str, str], str] = {}
+        self._generations: Dict[str, int] = {}
+        self._synced_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_down_until = 0.0
+        if redis_url:
+            import redis as _redis
+
+            self._redis = _redis.Redis.from_url(redis_url, decode_responses=True)
+        self.hits = 0
+        self.misses = 0
+        self.rotations = 0
+
+    # --- Redis tier -------------------------------------------------------
+
+    def _redis_available(self) -> bool:
+        return self._redis is not None and time.time() >= self._redis_down_until
+
+    def _redis_failed(self, exc: Exception) -> None:
+        self._redis_down_until = time.time() + self._REDIS_COOLDOWN_SEC
+        LOG.info("template route table redis tier unavailable err=%s", exc)
+
+    @staticmethod
+    def _generation_key(os_key: str) -> str:
+        return f"troute:gen:{os_key}"
+
+    def _routes_key(self, os_key: str) -> str:
+        return f"troute:{os_key}:{self._generations.get(os_key, 0)}"
+
+    def _previous_routes_key(self, os_key: str) -> str:
+        return f"troute:{os_key}:{self._generations.get(os_key, 0)}:prev"
+
+    def _labels_key(self, os_key: str) -> str:
+        return f"troute:{os_key}:{self._generations.get(os_key, 0)}:labels"
+
+    def _drop_local(self, os_key: str) -> None:
+        for key in [k for k in self._lru if k[0] == os_key]:
+            del self._lru[key]
+        for key in [k for k in self._labels if k[0] == os_key]:
+            del self._labels[key]
+
+    def _sync_generation(self, os_key: str) -> None:
+        """Adopt other processes' invalidations and label updates for `os_key` (every `sync_sec`)."""
+        now = time.time()
+        if not self._redis_available() or now - self._synced_at.get(os_key, 0.0) < self.sync_sec:
+            return
+        self._synced_at[os_key] = now
+        try:
+            generation = int(self._redis.get(self._generation_key(os_key)) or 0)  # type: ignore[union-attr]
+            with self._lock:
+                if generation != self._generations.get(os_key, 0):
+                    self._drop_local(os_key)
+                    self._generations[os_key] = generation
+            labels = self._redis.hgetall(self._labels_key(os_key)) or {}  # type: ignore[union-attr]
+        except Exception as exc:  # pragma: no cover - network
+            self._redis_failed(exc)
+            return
+        with self._lock:
+            for cluster_id, label in labels.items():
+                self._labels[(os_key, cluster_id)] = label
+
+    def _write_routes(self, os_key: str, mapping: Dict[str, str]) -> None:
+        """HSET encoded routes into the current hash, rotating it once it is full."""
+        key, previous = self._routes_key(os_key), self._previous_routes_key(os_key)
+        ttl = int(settings.TEMPLATE_ROUTES_REDIS_TTL_SEC)
+        pipe = self._redis.pipeline(transaction=False)  # type: ignore[union-attr]
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, ttl)
+        pipe.eval(self._ROTATE_SCRIPT, 2, key, previous, self.redis_max_entries)
+        pipe.expire(previous, ttl)
+        if pipe.execute()[2]:
+            self.rotations += 1
+
+    def _fetch_routes(self, os_key: str, digests: List[str]) -> Dict[str, Tuple[str, float | None, str, float]]:
+        """Encoded routes for `digests` from the current hash, then the previous one (promoting hits)."""
+        raw = self._redis.hmget(self._routes_key(os_key), digests)  # type: ignore[union-attr]
+        found = {digest: value for digest, value in zip(digests, raw or []) if value}
+        rest = [digest for digest in digests if digest not in found]
+        if rest:
+            old = self._redis.hmget(self._previous_routes_key(os_key), rest)  # type: ignore[union-attr]
+            promoted = {digest: value for digest, value in zip(rest, old or []) if value}
+            if promoted:
+                self._write_routes(os_key, promoted)
+                found.update(promoted)
+        return {digest: tuple(json.loads(value)) for digest, value in found.items()}  # type: ignore[misc]
+
+    # --- public API -------------------------------------------------------
+
+    def _decode(self, os_key: str, cached: Tuple[str, float | None, str, float]) -> Route | None:
+        cluster_id, distance, label, expires_at = cached
+        if expires_at and expires_at < time.time():
+            return None
+        label = self._labels.get((os_key, cluster_id), label)
+        return {"cluster_id": cluster_id, "distance": distance, "label": label}
+
+    def get_many(self, os_key: str, templates: Sequence[str]) -> List[Route | None]:
+        out: List[Route | None] = [None] * len(templates)
+        if not templates:
+            return out
+        self._sync_generation(os_key)
+        digests = [template_key(t) for t in templates]
+        missing: List[int] = []
+        with self._lock:
+            for i, digest in enumerate(digests):
+                cached = self._lru.get((os_key, digest))
+                route = self._decode(os_key, cached) if cached is not None else None
+                if route is None:
+                    missing.append(i)
+                    continue
+                self._lru.move_to_end((os_key, digest))
+                out[i] = route
+        if missing and self._redis_available():
+            try:
+                found = self._fetch_routes(os_key, [digests[i] for i in missing])
+            except Exception as exc:  # pragma: no cover - network
+                self._redis_failed(exc)
+                found = {}
+            with self._lock:
+                still_missing: List[int] = []
+                for i in missing:
+                    cached = found.get(digests[i])
+                    route = self._decode(os_key, cached) if cached is not None else None
+                    if route is None:
+                        still_missing.append(i)
+                        continue
+                    self._remember(os_key, digests[i], cached)  # type: ignore[arg-type]
+                    out[i] = route
+                missing = still_missing
+        self.hits += len(templates) - len(missing)
+        self.misses += len(missing)
+        return out
+
+    def _remember(self, os_key: str, digest: str, cached: Tuple[str, float | None, str, float]) -> None:
+        if not self.max_entries:
+            return
+        self._lru[(os_key, digest)] = cached
+        self._lru.move_to_end((os_key, digest))
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def put_many(self, os_key: str, templates: Sequence[str], routes: Sequence[Route]) -> None:
+        if not templates:
+            return
+        threshold = float(settings.ONLINE_CLUSTER_DISTANCE_THRESHOLD)
+        now = time.time()
+        rows: Dict[str, Tuple[str, float | None, str, float]] = {}
+        for templated, route in zip(templates, routes):
+            distance = route.get("distance")
+            distance = float(distance) if isinstance(distance, (int, float)) else None
+            cluster_id = str(route.get("cluster_id") or "")
+            far = not cluster_id or distance is None or distance > threshold
+            rows[template_key(templated)] = (
+                cluster_id,
+                distance,
+                str(route.get("label") or ""),
+                now + self.miss_ttl_sec if far else 0.0,
+            )
+        with self._lock:
+            for digest, cached in rows.items():
+                self._remember(os_key, digest, cached)
+        if not self._redis_available():
+            return
+        try:
+            self._write_routes(os_key, {digest: json.dumps(cached) for digest, cached in rows.items()})
+        except Exception as exc:  # pragma: no cover - network
+            self._redis_failed(exc)
+
+    def update_label(self, os_key: str, cluster_id: str, label: str) -> None:
+        with self._lock:
+            self._labels[(os_key, cluster_id)] = label
+        if not self._redis_available():
+            return
+        try:
+            key = self._labels_key(os_key)
+            pipe = self._redis.pipeline(transaction=False)  # type: ignore[union-attr]
+            pipe.hset(key, cluster_id, label)
+            pipe.expire(key, int(settings.TEMPLATE_ROUTES_REDIS_TTL_SEC))
+            pipe.execute()
+        except Exception as exc:  # pragma: no cover - network
+            self._redis_failed(exc)
+
+    def invalidate(self, os_key: str) -> None:
+        """Forget every route for `os_key`, here and (via Redis) in other processes."""
+        with self._lock:
+            self._drop_local(os_key)
+        if not self._redis_available():
+            return
+        try:
+            old_keys = (self._routes_key(os_key), self._previous_routes_key(os_key), self._labels_key(os_key))
+            generation = int(self._redis.incr(self._generation_key(os_key)))  # type: ignore[union-attr]
+            self._redis.delete(*old_keys)  # type: ignore[union-attr]
+            with self._lock:
+                self._generations[os_key] = generation
+                self._synced_at[os_key] = time.time()
+        except Exception as exc:  # pragma: no cover - network
+            self._redis_failed(exc)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "max_entries": self.max_entries,
+            "redis_enabled": self._redis is not None,
+            "redis_max_entries": self.redis_max_entries,
+            "redis_rotations": self.rotations,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+_table: TemplateRouteTable | None = None
+_table_lock = threading.Lock()
+
+
+def get_template_routes() -> TemplateRouteTable:
+    """Return the process-wide template route table."""
+    global _table
+    with _table_lock:
+        if _table is None:
+            _table = TemplateRouteTable(
+                max_entries=settings.TEMPLATE_ROUTES_MAX_ENTRIES,
+                miss_ttl_sec=settings.TEMPLATE_ROUTES_MISS_TTL_SEC,
+                redis_url=settings.REDIS_URL if settings.TEMPLATE_ROUTES_REDIS else None,
+                sync_sec=settings.TEMPLATE_ROUTES_SYNC_SEC,
+                redis_max_entries=settings.TEMPLATE_ROUTES_REDIS_MAX_ENTRIES,
+            )
+        return _table
@@ -13,6 +13,8 @@ from fastapi import FastAPI
 
 from app.core.config import get_settings
 from app.rules.automations import load_rules
+from app.streams.utils import consumer_name
+from app.streams.worker import StreamGroupReader
 
 
 LOG = logging.getLogger(__name__)
@@ -149,66 +151,63 @@ async def run_automations() -> None:
     global _total_triggered, _provider_counts, _last_trigger_iso
     rules = load_rules()
     group = "automations"
-    consumer = "auto_1"
-    try:
-        await redis.xgroup_create(settings.ALERTS_STREAM, group, id="$", mkstream=True)
-    except Exception:
-        pass
+    consumer = consumer_name("auto")
+    reader = StreamGroupReader(redis, settings.ALERTS_STREAM, group, consumer, count=50, block_ms=1000)
+    await reader.ensure_group()
     while True:
         try:
             enabled = (_runtime_enabled if _runtime_enabled is not None else settings.ENABLE_AUTOMATIONS)
             if not enabled:
                 await asyncio.sleep(1)
                 continue
-            resp = await redis.xreadgroup(group, consumer, {settings.ALERTS_STREAM: ">"}, count=50, block=1000)
+            msgs = await reader.read()
         except Exception as exc:
             LOG.info("automations read failed err=%s", exc)
             await asyncio.sleep(1)
             continue
-        if not resp:
+        if not msgs:
             continue
         to_ack: list[str] = []
-        for _stream, msgs in resp:
-            for msg_id, fields in msgs:
-                to_ack.append(msg_id)
-                # normalize alert
-                alert = {
-                    "id": msg_id,
-                    "os": fields.get("os"),
-                    "issue_key": fields.get("issue_key"),
-                    "failure_type": fields.get("failure_type") or "",
-                    "confidence": fields.get("confidence") or "",
-                    "result": {},
-                }
+        for msg_id, fields in msgs:
+            to_ack.append(msg_id)
+            # normalize alert
+            alert = {
+                "id": msg_id,
+                "os": fields.get("os"),
+                "issue_key": fields.get("issue_key"),
+                "failure_type": fields.get("failure_type") or "",
+                "confidence": fields.get("confidence") or "",
+                "result": {},
+            }
+            try:
+                if fields.get("result"):
+                    alert["result"] = json.loads(fields.get("result") or "{}")
+            except Exception:
+                pass
+            for rule in (rules.get("rules") or []):
                 try:
-                    if fields.get("result"):
-                        alert["result"] = json.loads(fields.get("result") or "{}")
-                except Exception:
-                    pass
-                for rule in (rules.get("rules") or []):
-                    try:
-                        if not _match(rule, alert):
-                            continue
-                        key = alert.get("issue_key") or alert.get("id")
-                        if not await _cooldown_guard(rule.get("id") or "rule", str(key), rule.get("cooldown") or "15m"):
-                            continue
-                        provider_name = (rule.get("action") or {}).get("provider") or ""
-                        provider = PROVIDERS.get(provider_name)
-                        if not provider:
-                            continue
-                        if _dry_run:
-                            LOG.info("[dry-run] would trigger provider=%s rule=%s alert=%s", provider_name, rule.get("id"), alert.get("id"))
-                        else:
-                            await provider((rule.get("action") or {}).get("params") or {}, alert)
-                        _total_triggered += 1
-                        _provider_counts[provider_name] = _provider_counts.get(provider_name, 0) + 1
-                        from datetime import datetime, timezone
-                        _last_trigger_iso = datetime.now(timezone.utc).isoformat()
-                    except Exception as exc:
-                        LOG.info("automation exec failed rule=%s err=%s", rule.get("id"), exc)
+                    if not _match(rule, alert):
+                        continue
+                    key = alert.get("issue_key") or alert.get("id")
+                    if not await _cooldown_guard(rule.get("id") or "rule", str(key), rule.get("cooldown") or "15m"):
+                        continue
+                    provider_name = (rule.get("action") or {}).get("provider") or ""
+                    provider = PROVIDERS.get(provider_name)
+                    if not provider:
+                        continue
+                    if _dry_run:
+                        LOG.info("[dry-run] would trigger provider=%s rule=%s alert=%s", provider_name, rule.get("id"), alert.get("id"))
+                    else:
+                        await provider((rule.get("action") or {}).get("params") or {}, alert)
+                    _total_triggered += 1
+                    _provider_counts[provider_name] = _provider_counts.get(provider_name, 0) + 1
+                    from datetime import datetime, timezone
+                    _last_trigger_iso = datetime.now(timezone.utc).isoformat()
+                except Exception as exc:
+                    LOG.info("automation exec failed rule=%s err=%s", rule.get("id"), exc)
         if to_ack:
             with contextlib.suppress(Exception):
-                await redis.xack(settings.ALERTS_STREAM, group, *to_ack)
+                await reader.ack(*to_ack)
 
 
 def attach_automations(app: FastAPI) -> None:
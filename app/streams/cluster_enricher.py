@@ -11,6 +11,10 @@ from fastapi import FastAPI
 from app.core.config import get_settings
 from app.services.chroma_service import ChromaClientProvider, collection_name_for_os
 from app.services.llm_service import classify_cluster, generate_hypothesis
+from app.services.prototype_index import get_prototype_index
+from app.services.template_routes import get_template_routes
+from app.streams.utils import consumer_name
+from app.streams.worker import StreamGroupReader
 import threading
 
 
@@ -60,96 +64,97 @@ def _get_prototype(os_name: str, cluster_id: str) -> tuple[list[float] | None, s
 
 async def run_cluster_enricher() -> None:
     group = "clusters_enrichers"
-    consumer = "cluster_enricher_1"
-    try:
-        await redis.xgroup_create(settings.CLUSTERS_CANDIDATES_STREAM, group, id="$", mkstream=True)
-    except Exception:
-        pass
+    consumer = consumer_name("cluster_enricher")
+    reader = StreamGroupReader(redis, settings.CLUSTERS_CANDIDATES_STREAM, group, consumer, count=5, block_ms=1000)
+    await reader.ensure_group()
 
     while True:
         try:
-            response = await redis.xreadgroup(group, consumer, {settings.CLUSTERS_CANDIDATES_STREAM: ">"}, count=5, block=1000)
+            messages = await reader.read()
         except Exception as exc:
             LOG.info("cluster enricher read failed err=%s", exc)
             await asyncio.sleep(1)
             continue
-        if not response:
+        if not messages:
             continue
-        for _, messages in response:
-            for msg_id, data in messages:
-                try:
-                    os_name = data.get("os") or "unknown"
-                    cluster_id = data.get("cluster_id") or ""
-                    centroid, medoid_doc, proto_meta = _get_prototype(os_name, cluster_id)
-
-                    # neighbors from templates via centroid
-                    neighbors: List[Dict[str, Any]] = []
-                    if centroid:
-                        tcoll = _get_provider().get_or_create_collection(collection_name_for_os(os_name))
-                        q = tcoll.query(query_embeddings=[centroid], n_results=8, include=["documents", "metadatas", "distances"]) or {}
-                        ids = (q.get("ids") or [[]])[0]
-                        docs = (q.get("documents") or [[]])[0]
-                        dists = (q.get("distances") or [[]])[0]
-                        metas = (q.get("metadatas") or [[]])[0]
-                        for i in range(len(ids)):
-                            neighbors.append({
-                                "id": ids[i],
-                                "document": docs[i] if i < len(docs) else "",
-                                "distance": dists[i] if i < len(dists) else None,
-                                "metadata": metas[i] if i < len(metas) else {},
-                            })
-
-                    # HYDE queries using medoid
-                    seed_logs = [{"templated": medoid_doc}] if medoid_doc else []
-                    queries = generate_hypothesis(os_name, medoid_doc, seed_logs, num_queries=3)
-
-                    # retrieve logs within same cluster via where filter
-                    retrieved: List[Dict[str, Any]] = []
-                    lcoll = _get_provider().get_or_create_collection(_logs_collection_name(os_name))
-                    for qtxt in (queries or [medoid_doc] or []):
-                        try:
-                            res = lcoll.query(query_texts=[qtxt], where={"cluster_id": cluster_id}, n_results=10, include=["documents", "metadatas", "distances"]) or {}
-                        except Exception:
-                            res = {}
-                        ids = (res.get("ids") or [[]])[0]
-                        docs = (res.get("documents") or [[]])[0]
-                        metas = (res.get("metadatas") or [[]])[0]
-                        for i in range(len(ids)):
-                            retrieved.append({
-                                "id": ids[i],
-                                "templated": docs[i] if i < len(docs) else "",
-                                "raw": (metas[i] or {}).get("raw", ""),
-                            })
-
-                    result = classify_cluster(os_name, cluster_id, medoid_doc, neighbors, retrieved)
-                    payload = {
-                        "type": "cluster",
-                        "os": os_name,
-                        "cluster_id": cluster_id,
-                        "failure_type": result.get("failure_type", ""),
-                        "confidence": str(result.get("confidence") or ""),
-                        "result": json.dumps(result),
-                    }
-                    await redis.xadd(settings.ALERTS_STREAM, payload)
-
-                    # Update prototype metadata with learned label/solution
-                    try:
-                        pcoll = _get_provider().get_or_create_collection(_proto_collection_name(os_name))
-                        meta = dict(proto_meta or {})
-                        meta["label"] = result.get("failure_type", meta.get("label", "unknown"))
-                        meta["rationale"] = "llm_cluster"
-                        if result.get("recommendation"):
-                            meta["solution"] = result.get("recommendation")
-                        pcoll.update(ids=[cluster_id], metadatas=[meta])
-                    except Exception:
-                        pass
-                except Exception as exc:
-                    LOG.info("cluster enricher processing failed id=%s err=%s", msg_id, exc)
-                finally:
+        for msg_id, data in messages:
+            try:
+                os_name = data.get("os") or "unknown"
+                cluster_id = data.get("cluster_id") or ""
+                centroid, medoid_doc, proto_meta = _get_prototype(os_name, cluster_id)
+
+                # neighbors from templates via centroid
+                neighbors: List[Dict[str, Any]] = []
+                if centroid:
+                    tcoll = _get_provider().get_or_create_collection(collection_name_for_os(os_name))
+                    q = tcoll.query(query_embeddings=[centroid], n_results=8, include=["documents", "metadatas", "distances"]) or {}
+                    ids = (q.get("ids") or [[]])[0]
+                    docs = (q.get("documents") or [[]])[0]
+                    dists = (q.get("distances") or [[]])[0]
+                    metas = (q.get("metadatas") or [[]])[0]
+                    for i in range(len(ids)):
+                        neighbors.append({
+                            "id": ids[i],
+                            "document": docs[i] if i < len(docs) else "",
+                            "distance": dists[i] if i < len(dists) else None,
+                            "metadata": metas[i] if i < len(metas) else {},
+                        })
+
+                # HYDE queries using medoid
+                seed_logs = [{"templated": medoid_doc}] if medoid_doc else []
+                queries = generate_hypothesis(os_name, medoid_doc, seed_logs, num_queries=3)
+
+                # retrieve logs within same cluster via where filter
+                retrieved: List[Dict[str, Any]] = []
+                lcoll = _get_provider().get_or_create_collection(_logs_collection_name(os_name))
+                for qtxt in (queries or [medoid_doc] or []):
                     try:
-                        await redis.xack(settings.CLUSTERS_CANDIDATES_STREAM, group, msg_id)
+                        res = lcoll.query(query_texts=[qtxt], where={"cluster_id": cluster_id}, n_results=10, include=["documents", "metadatas", "distances"]) or {}
                     except Exception:
-                        pass
+                        res = {}
+                    ids = (res.get("ids") or [[]])[0]
+                    docs = (res.get("documents") or [[]])[0]
+                    metas = (res.get("metadatas") or [[]])[0]
+                    for i in range(len(ids)):
+                        retrieved.append({
+                            "id": ids[i],
+                            "templated": docs[i] if i < len(docs) else "",
+                            "raw": (metas[i] or {}).get("raw", ""),
+                        })
+
+                result = classify_cluster(os_name, cluster_id, medoid_doc, neighbors, retrieved)
+                payload = {
+                    "type": "cluster",
+                    "os": os_name,
+                    "cluster_id": cluster_id,
+                    "failure_type": result.get("failure_type", ""),
+                    "confidence": str(result.get("confidence") or ""),
+                    "result": json.dumps(result),
+                }
+                await redis.xadd(settings.ALERTS_STREAM, payload)
+
+                # Update prototype metadata with learned label/solution
+                try:
+                    pcoll_name = _proto_collection_name(os_name)
+                    pcoll = _get_provider().get_or_create_collection(pcoll_name)
+                    meta = dict(proto_meta or {})
+                    meta["label"] = result.get("failure_type", meta.get("label", "unknown"))
+                    meta["rationale"] = "llm_cluster"
+                    if result.get("recommendation"):
+                        meta["solution"] = result.get("recommendation")
+                    pcoll.update(ids=[cluster_id], metadatas=[meta])
+                    get_prototype_index().update_metadata(pcoll_name, [cluster_id], [meta])
+                    if settings.TEMPLATE_ROUTES_ENABLED:
+                        get_template_routes().update_label(_suffix_for_os(os_name), cluster_id, meta["label"])
+                except Exception:
+                    pass
+            except Exception as exc:
+                LOG.info("cluster enricher processing failed id=%s err=%s", msg_id, exc)
+            finally:
+                try:
+                    await reader.ack(msg_id)
+                except Exception:
+                    pass
 
 
 def attach_cluster_enricher(app: FastAPI):
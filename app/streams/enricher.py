@@ -9,6 +9,8 @@ from fastapi import FastAPI
 from app.core.config import get_settings
 from app.services.llm_service import generate_hypothesis, classify_issue
 from app.services.chroma_service import ChromaClientProvider, collection_name_for_os
+from app.streams.utils import consumer_name
+from app.streams.worker import StreamGroupReader
 import threading
 
 
@@ -81,78 +83,75 @@ async def _retrieve_logs_by_queries(os_name: str, queries: List[str], k_per_quer
 async def run_enricher():
     """Consume issues_candidates stream, enrich via LLM with HYDE, and write to alerts stream."""
     group = "issues_enrichers"
-    consumer = "enricher_1"
-    try:
-        await redis.xgroup_create(settings.ISSUES_CANDIDATES_STREAM, group, id="$", mkstream=True)
-    except Exception:
-        pass
+    consumer = consumer_name("enricher")
+    reader = StreamGroupReader(redis, settings.ISSUES_CANDIDATES_STREAM, group, consumer, count=5, block_ms=1000)
+    await reader.ensure_group()
 
     while True:
         try:
-            response = await redis.xreadgroup(group, consumer, {settings.ISSUES_CANDIDATES_STREAM: ">"}, count=5, block=1000)
+            messages = await reader.read()
         except Exception as exc:
             LOG.info("enricher read failed err=%s", exc)
             await asyncio.sleep(1)
             continue
-        if not response:
+        if not messages:
             continue
-        for _, messages in response:
-            for msg_id, data in messages:
-                try:
-                    os_name = data.get("os") or "unknown"
-                    templated_summary = data.get("templated_summary") or ""
-                    raw_logs = data.get("logs")
-                    if isinstance(raw_logs, str):
-                        try:
-                            logs: List[Dict[str, Any]] = json.loads(raw_logs)
-                        except Exception:
-                            logs = []
-                    else:
-                        logs = raw_logs or []
-
-                    # neighbors from templates for coarse context
-                    neighbors = await _retrieve_neighbors(os_name, templated_summary or (logs[0].get("templated") if logs else ""), k=8)
-                    # HYDE queries and retrieval from logs_<os>
-                    queries = generate_hypothesis(os_name, templated_summary, logs, num_queries=3)
-                    retrieved = await _retrieve_logs_by_queries(os_name, queries, k_per_query=5)
-                    retrieved_logs = [{
-                        "templated": item.get("document", ""),
-                        "raw": (item.get("metadata") or {}).get("raw", ""),
-                    } for item in retrieved]
-
-                    result = classify_issue(os_name, logs, neighbors, retrieved_logs)
-                    # Normalize fields for easier consumption on the UI
-                    is_hw = bool(result.get("is_hardware_failure"))
-                    failure_type = str(result.get("failure_type", ""))
-                    confidence = result.get("confidence")
-                    log_ids = [log.get("id") for log in logs if log.get("id")]
-                    payload = {
-                        "type": "issue",
-                        "os": os_name,
-                        "issue_key": data.get("issue_key", ""),
-                        "is_hardware_failure": str(is_hw).lower(),  # streams are strings
-                        "failure_type": failure_type,
-                        "confidence": str(confidence) if confidence is not None else "",
-                        "result": json.dumps(result),
-                        "log_ids": json.dumps(log_ids),
-                    }
-                    entry_id = await redis.xadd(settings.ALERTS_STREAM, payload)
-                    # Mirror alert into a hash with a TTL for ~24h visibility; allow persisting later
+        for msg_id, data in messages:
+            try:
+                os_name = data.get("os") or "unknown"
+                templated_summary = data.get("templated_summary") or ""
+                raw_logs = data.get("logs")
+                if isinstance(raw_logs, str):
                     try:
-                        key = f"alert:{entry_id}"
-                        # Store fields as strings for consistency
-                        to_store = {**payload, "id": entry_id}
-                        await redis.hset(key, mapping=to_store)
-                        await redis.expire(key, int(settings.ALERTS_TTL_SEC))
-                    except Exception as e:
-                        LOG.info("failed to store alert hash id=%s err=%s", entry_id, e)
+                        logs: List[Dict[str, Any]] = json.loads(raw_logs)
+                    except Exception:
+                        logs = []
+                else:
+                    logs = raw_logs or []
+
+                # neighbors from templates for coarse context
+                neighbors = await _retrieve_neighbors(os_name, templated_summary or (logs[0].get("templated") if logs else ""), k=8)
+                # HYDE queries and retrieval from logs_<os>
+                queries = generate_hypothesis(os_name, templated_summary, logs, num_queries=3)
+                retrieved = await _retrieve_logs_by_queries(os_name, queries, k_per_query=5)
+                retrieved_logs = [{
+                    "templated": item.get("document", ""),
+                    "raw": (item.get("metadata") or {}).get("raw", ""),
+                } for item in retrieved]
+
+                result = classify_issue(os_name, logs, neighbors, retrieved_logs)
+                # Normalize fields for easier consumption on the UI
+                is_hw = bool(result.get("is_hardware_failure"))
+                failure_type = str(result.get("failure_type", ""))
+                confidence = result.get("confidence")
+                log_ids = [log.get("id") for log in logs if log.get("id")]
+                payload = {
+                    "type": "issue",
+                    "os": os_name,
+                    "issue_key": data.get("issue_key", ""),
+                    "is_hardware_failure": str(is_hw).lower(),  # streams are strings
+                    "failure_type": failure_type,
+                    "confidence": str(confidence) if confidence is not None else "",
+                    "result": json.dumps(result),
+                    "log_ids": json.dumps(log_ids),
+                }
+                entry_id = await redis.xadd(settings.ALERTS_STREAM, payload)
+                # Mirror alert into a hash with a TTL for ~24h visibility; allow persisting later
+                try:
+                    key = f"alert:{entry_id}"
+                    # Store fields as strings for consistency
+                    to_store = {**payload, "id": entry_id}
+                    await redis.hset(key, mapping=to_store)
+                    await redis.expire(key, int(settings.ALERTS_TTL_SEC))
+                except Exception as e:
+                    LOG.info("failed to store alert hash id=%s err=%s", entry_id, e)
+            except Exception as exc:
+                LOG.info("enricher processing failed id=%s err=%s", msg_id, exc)
+            finally:
+                try:
+                    await reader.ack(msg_id)
                 except Exception as exc:
-                    LOG.info("enricher processing failed id=%s err=%s", msg_id, exc)
-                finally:
-                    try:
-                        await redis.xack(settings.ISSUES_CANDIDATES_STREAM, group, msg_id)
-                    except Exception as exc:
-                        LOG.info("enricher ack failed id=%s err=%s", msg_id, exc)
+                    LOG.info("enricher ack failed id=%s err=%s", msg_id, exc)
 
 
 if __name__ == "__main__":
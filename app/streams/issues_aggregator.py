@@ -2,16 +2,17 @@ import asyncio
 import logging
 import time
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List
 
 import redis.asyncio as aioredis
 
 from app.core.config import get_settings
 from app.services.chroma_service import ChromaClientProvider
 from app.services.online_clustering import assign_or_create_cluster
-from app.parsers.linux import parse_linux_line
-from app.parsers.macos import parse_macos_line
-from app.parsers.templating import render_templated_line
+from app.parsers.drain import get_template_miners
+from app.parsers.pipeline import get_parse_pipeline
+from app.streams.utils import consumer_name
+from app.streams.worker import StreamGroupReader
 import threading
 
 
@@ -29,36 +30,6 @@ def _get_provider() -> ChromaClientProvider:
     return _provider
 
 
-def _os_from_source(source: str | None) -> str:
-    if not source:
-        return "unknown"
-    s = source.lower()
-    if "linux.log" in s:
-        return "linux"
-    if "mac.log" in s:
-        return "macos"
-    if "windows" in s:
-        return "windows"
-    return "unknown"
-
-
-def _parse_and_template(os_name: str, line: str) -> Tuple[str, Dict[str, str]]:
-    parsed: Dict[str, str] | None = None
-    if os_name == "linux":
-        parsed = parse_linux_line(0, line) or None
-    elif os_name == "macos":
-        parsed = parse_macos_line(0, line) or None
-    if not parsed:
-        templated = render_templated_line(component="unknown", pid=None, content=line)
-        return templated, {"content": line, "component": "unknown"}
-    templated = render_templated_line(
-        component=parsed.get("component", ""),
-        pid=parsed.get("PID"),
-        content=parsed.get("content", ""),
-    )
-    return templated, parsed
-
-
 def _issue_key(os_name: str, parsed: Dict[str, str]) -> str:
     component = parsed.get("component", "unknown").lower().strip()
     pid = parsed.get("PID", "").strip()
@@ -118,13 +89,9 @@ async def run_issues_aggregator() -> None:
     """Consume raw logs from 'logs' stream, group them into issues, publish issues when idle."""
     stream = "logs"
     group = "issues_aggregator"
-    consumer = "aggregator_1"
-    # Create group if it doesn't exist
-    try:
-        await redis.xgroup_create(stream, group, id="$", mkstream=True)
-        LOG.info("group created stream=%s group=%s", stream, group)
-    except Exception as exc:
-        LOG.info("group exists stream=%s group=%s info=%s", stream, group, exc)
+    consumer = consumer_name("aggregator")
+    reader = StreamGroupReader(redis, stream, group, consumer, count=100, block_ms=1000)
+    await reader.ensure_group()
 
     inactivity = float(settings.ISSUE_INACTIVITY_SEC)
 
@@ -132,57 +99,65 @@ async def run_issues_aggregator() -> None:
     while True:
         # read new messages
         try:
-            response = await redis.xreadgroup(group, consumer, {stream: ">"}, count=100, block=1000)
+            messages = await reader.read()
         except Exception as exc:
             LOG.info("xreadgroup failed stream=%s group=%s consumer=%s err=%s", stream, group, consumer, exc)
             await asyncio.sleep(1)
             continue
         now = time.time()
-        if response:
+        parsed_rows = None
+        if messages:
+            # reuses rows the logs consumer already parsed when both run in this process
+            entries = [(msg_id, data.get("source"), data.get("line") or "") for msg_id, data in messages]
+            try:
+                parsed_rows = await get_parse_pipeline().parse(entries)
+            except Exception as exc:
+                # not acked: the batch stays pending and is reclaimed later
+                LOG.info("parse stage failed stream=%s group=%s count=%d err=%s", stream, group, len(entries), exc)
+        if messages and parsed_rows is not None:
             processed = 0
-            for _, messages in response:
-                for msg_id, data in messages:
-                    processed += 1
-                    source = data.get("source")
-                    raw = data.get("line") or ""
-                    os_name = _os_from_source(source)
-                    templated, parsed = _parse_and_template(os_name, raw)
-
-                    # Online assign/create cluster for this templated log
-                    try:
-                        cluster_id = assign_or_create_cluster(os_name, templated)
-                    except Exception:
-                        cluster_id = ""
-
-                    # Attempt to persist cluster_id onto the log doc metadata in logs_<os>
-                    try:
-                        coll_name = f"{settings.CHROMA_LOG_COLLECTION_PREFIX}{os_name}"
-                        collection = _get_provider().get_or_create_collection(coll_name)
-                        current = collection.get(ids=[msg_id], include=["metadatas"]) or {}
-                        metas = (current.get("metadatas") or [[]])[0] or {}
-                        metas["cluster_id"] = cluster_id
-                        collection.update(ids=[msg_id], metadatas=[metas])
-                    except Exception:
-                        pass
-                    key = _issue_key(os_name, parsed)
-                    issue = _issues.get(key)
-                    if issue is None:
-                        issue = Issue(os=os_name, key=key, created_at=now, last_seen_at=now)
-                        _issues[key] = issue
-                    issue.add_log(raw=raw, templated=templated, parsed=parsed)
-                    # We do not ack here; base consumer owns acking, we only observe this stream via separate group
-                    # Track per-cluster size and publish cluster candidate at threshold
-                    try:
-                        if cluster_id:
-                            counter_key = f"cluster:count:{os_name}:{cluster_id}"
-                            new_count = await redis.incr(counter_key)
-                            if new_count == int(settings.CLUSTER_MIN_LOGS_FOR_CLASSIFICATION):
-                                await redis.xadd(settings.CLUSTERS_CANDIDATES_STREAM, {
-                                    "os": os_name,
-                                    "cluster_id": cluster_id,
-                                })
-                    except Exception:
-                        pass
+            for (msg_id, _, raw), (os_name, templated, parsed) in zip(entries, parsed_rows):
+                processed += 1
+
+                # Online assign/create cluster for this templated log
+                try:
+                    cluster_id = assign_or_create_cluster(os_name, templated)
+                except Exception:
+                    cluster_id = ""
+
+                # Attempt to persist cluster_id onto the log doc metadata in logs_<os>
+                try:
+                    coll_name = f"{settings.CHROMA_LOG_COLLECTION_PREFIX}{os_name}"
+                    collection = _get_provider().get_or_create_collection(coll_name)
+                    current = collection.get(ids=[msg_id], include=["metadatas"]) or {}
+                    metas = (current.get("metadatas") or [[]])[0] or {}
+                    metas["cluster_id"] = cluster_id
+                    collection.update(ids=[msg_id], metadatas=[metas])
+                except Exception:
+                    pass
+                key = _issue_key(os_name, parsed)
+                issue = _issues.get(key)
+                if issue is None:
+                    issue = Issue(os=os_name, key=key, created_at=now, last_seen_at=now)
+                    _issues[key] = issue
+                issue.add_log(raw=raw, templated=templated, parsed=parsed)
+                # Track per-cluster size and publish cluster candidate at threshold
+                try:
+                    if cluster_id:
+                        counter_key = f"cluster:count:{os_name}:{cluster_id}"
+                        new_count = await redis.incr(counter_key)
+                        if new_count == int(settings.CLUSTER_MIN_LOGS_FOR_CLASSIFICATION):
+                            await redis.xadd(settings.CLUSTERS_CANDIDATES_STREAM, {
+                                "os": os_name,
+                                "cluster_id": cluster_id,
+                            })
+                except Exception:
+                    pass
+            # Ack once the batch is folded into open issues so a crash leaves it pending for reclaim
+            try:
+                await reader.ack(*[msg_id for msg_id, _ in messages])
+            except Exception as exc:
+                LOG.info("ack failed stream=%s group=%s count=%d err=%s", stream, group, len(messages), exc)
             LOG.debug("aggregated messages=%d open_issues=%d", processed, len(_issues))
         # periodically close idle issues
         to_close: List[str] = []
@@ -212,6 +187,8 @@ def attach_issues_aggregator(app):
 
         def _runner():
             asyncio.set_event_loop(loop)
+            # load template snapshots here, before consuming and off the API loop
+            get_template_miners().restore()
             loop.create_task(_run_forever())
             loop.run_forever()
 
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Tuple
+
+from app.core.config import get_settings
+from app.services.metrics_normalization import MetricPoint
+
+
+settings = get_settings()
+LOG = logging.getLogger(__name__)
+
+# Reserved id of the empty resource / attribute set
+EMPTY_ID = "0"
+
+
+def _canonical(value: Dict[str, Any] | None) -> str:
+    return json.dumps(value or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+class MetricCodec:
+    """Encoding of `metrics` stream entries with interned resource and attribute sets.
+
+    Each entry stores the point's scalars (`name`, `type`, `value`, `unit`,
+    `ts` = time_unix_nano) and, instead of two JSON documents, the ids of its
+    resource and attribute sets (`rid`, `aid`). Sets are interned once in
+    Redis: `metrics:intern:<kind>` maps id -> canonical JSON and
+    `metrics:intern:<kind>:ids` maps JSON -> id. Ids are never reused, so
+    both directions are cached per process without invalidation (bounded by
+    `cache_size` per direction). Entries written before this encoding, with
+    JSON `resource`/`attributes` fields, still decode.
+    """
+
+    KEY_PREFIX = "metrics:intern:"
+
+    def __init__(self, client: Any, cache_size: int | None = None) -> None:
+        self.client = client
+        self.cache_size = max(1, int(cache_size or settings.METRICS_INTERN_CACHE_SIZE))
+        self._ids: Dict[Tuple[str, str], str] = {}
+        self._sets: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def _remember(self, cache: Dict[Any, Any], key: Any, value: Any) -> None:
+        if len(cache) >= self.cache_size:
+            cache.clear()
+        cache[key] = value
+
+    async def _intern(self, kind: str, canonicals: Iterable[str]) -> Dict[str, str]:
+        """Ids of the canonical sets of `kind`, allocating ids in Redis for sets seen the first time."""
+        ids: Dict[str, str] = {"{}": EMPTY_ID}
+        missing: List[str] = []
+        for canonical in set(canonicals):
+            cached = self._ids.get((kind, canonical))
+            if cached is not None:
+                ids[canonical] = cached
+            elif canonical != "{}":
+                missing.append(canonical)
+        if not missing:
+            return ids
+        fwd = f"{self.KEY_PREFIX}{kind}"
+        rev = f"{fwd}:ids"
+        new: List[str] = []
+        for canonical, set_id in zip(missing, await self.client.hmget(rev, missing)):
+            if set_id:
+                ids[canonical] = str(set_id)
+            else:
+                new.append(canonical)
+        if new:
+            last = int(await self.client.incrby(f"{fwd}:seq", len(new)))
+            candidates = {canonical: str(last - len(new) + 1 + i) for i, canonical in enumerate(new)}
+            pipe = self.client.pipeline(transaction=False)
+            for canonical, set_id in candidates.items():
+                pipe.hset(fwd, set_id, canonical)
+                pipe.hsetnx(rev, canonical, set_id)
+            results = await pipe.execute()
+            ids.update(candidates)
+            lost = [c for c, created in zip(candidates, results[1::2]) if not created]
+            if lost:
+                # another process interned the same sets first; its ids win
+                for canonical, set_id in zip(lost, await self.client.hmget(rev, lost)):
+                    ids[canonical] = str(set_id)
+        for canonical in missing:
+            self._remember(self._ids, (kind, canonical), ids[canonical])
+        return ids
+
+    async def encode(self, points: List[MetricPoint]) -> List[Dict[str, str]]:
+        """Stream fields for `points`; interns unseen sets with a few round trips per batch."""
+        canon = [(_canonical(mp.get("resource")), _canonical(mp.get("attributes"))) for mp in points]
+        resource_ids = await self._intern("resource", (resource for resource, _ in canon))
+        attribute_ids = await self._intern("attributes", (attributes for _, attributes in canon))
+        encoded: List[Dict[str, str]] = []
+        for mp, (resource, attributes) in zip(points, canon):
+            encoded.append({
+                "name": mp.get("name", ""),
+                "type": mp.get("type", "gauge"),
+                "value": str(mp.get("value", "")),
+                "unit": (mp.get("unit") or ""),
+                "ts": str(int(mp.get("time_unix_nano") or 0)),
+                "rid": resource_ids[resource],
+                "aid": attribute_ids[attributes],
+            })
+        return encoded
+
+    async def resolve(self, kind: str, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Sets of `kind` by id, fetching the ones not cached yet."""
+        sets: Dict[str, Dict[str, Any]] = {EMPTY_ID: {}}
+        missing: List[str] = []
+        for set_id in set(ids):
+            cached = self._sets.get((kind, set_id))
+            if cached is not None:
+                sets[set_id] = cached
+            elif set_id != EMPTY_ID:
+                missing.append(set_id)
+        if not missing:
+            return sets
+        for set_id, canonical in zip(missing, await self.client.hmget(f"{self.KEY_PREFIX}{kind}", missing)):
+            try:
+                value = json.loads(canonical) if canonical else {}
+            except ValueError:
+                value = {}
+            sets[set_id] = value
+            self._remember(self._sets, (kind, set_id), value)
+        return sets
+
+    @staticmethod
+    def _legacy(raw: str | None) -> Dict[str, Any]:
+        try:
+            value = json.loads(raw or "{}")
+        except ValueError:
+            return {}
+        return value if isinstance(value, dict) else {}
+
+    async def decode(self, rows: List[Tuple[str, Dict[str, str]]]) -> List[Dict[str, Any]]:
+        """Decode (entry id, fields) rows into `{"id", "name", "type", "value", "unit", "ts", "resource", "attributes", "rid", "aid"}`.
+
+        `rid`/`aid` are None for entries written before interning.
+        """
+        resources = await self.resolve("resource", (f["rid"] for _, f in rows if "rid" in f))
+        attribute_sets = await self.resolve("attributes", (f.get("aid", EMPTY_ID) for _, f in rows if "rid" in f))
+        items: List[Dict[str, Any]] = []
+        for entry_id, fields in rows:
+            if "rid" in fields:
+                resource = resources.get(fields["rid"], {})
+                attributes = attribute_sets.get(fields.get("aid", EMPTY_ID), {})
+            else:
+                resource = self._legacy(fields.get("resource"))
+                attributes = self._legacy(fields.get("attributes"))
+            items.append({
+                "id": entry_id,
+                "name": fields.get("name"),
+                "type": fields.get("type"),
+                "value": fields.get("value"),
+                "unit": fields.get("unit"),
+                "ts": int(fields.get("ts") or 0),
+                "resource": resource,
+                "attributes": attributes,
+                "rid": fields.get("rid"),
+                "aid": fields.get("aid", EMPTY_ID) if "rid" in fields else None,
+            })
+        return items
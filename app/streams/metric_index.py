@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import json
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+from app.core.config import get_settings
+from app.services.metrics_normalization import MetricPoint
+from app.streams.metric_codec import EMPTY_ID, MetricCodec
+
+
+settings = get_settings()
+LOG = logging.getLogger(__name__)
+
+
+class MetricSeriesIndex:
+    """Per-series sample index for the metrics query API, maintained at write time.
+
+    A series is (name, resource set id, attribute set id) as interned by
+    MetricCodec. Per series, samples live in the sorted set
+    `metrics:ts:<series>` (score = time in ms, member = "<ts_ns>:<value>")
+    and are trimmed to `METRICS_INDEX_RETENTION_SEC`. The hash
+    `metrics:series` describes each series (name, type, unit, set ids) and
+    the sets `metrics:idx:{name,host,vendor}:<value>` list series by name
+    and by resource host/vendor, so queries pick their series with set
+    operations instead of scanning the stream. Series whose samples have
+    all expired are dropped from the catalog lazily by queries.
+    """
+
+    CATALOG_KEY = "metrics:series"
+    SAMPLES_PREFIX = "metrics:ts:"
+    INDEX_PREFIX = "metrics:idx:"
+    _TRIM_INTERVAL_SEC = 60.0
+    _MAX_KNOWN_SERIES = 100_000
+
+    def __init__(self, client: Any, codec: MetricCodec, retention_sec: float | None = None) -> None:
+        self.client = client
+        self.codec = codec
+        self.retention_sec = float(retention_sec if retention_sec is not None else settings.METRICS_INDEX_RETENTION_SEC)
+        self._known: Dict[str, float] = {}  # series -> last trim (monotonic) in this process
+
+    @staticmethod
+    def series_key(name: str, rid: str, aid: str) -> str:
+        return f"{rid}:{aid}:{name}"
+
+    @classmethod
+    def _index_keys(cls, name: str, resource: Dict[str, Any]) -> List[str]:
+        keys = [f"{cls.INDEX_PREFIX}name:{name}"]
+        for field in ("host", "vendor"):
+            if resource.get(field):
+                keys.append(f"{cls.INDEX_PREFIX}{field}:{resource[field]}")
+        return keys
+
+    def queue(self, pipe: Any, points: List[MetricPoint], encoded: List[Dict[str, str]]) -> None:
+        """Add the index updates for `points` (and their encoded stream fields) to `pipe`."""
+        now_ns = time.time_ns()
+        now = time.monotonic()
+        retention_ms = int(self.retention_sec * 1000)
+        ttl = max(1, int(self.retention_sec))
+        for mp, fields in zip(points, encoded):
+            try:
+                value = float(fields["value"])
+            except ValueError:
+                continue
+            series = self.series_key(fields["name"], fields["rid"], fields["aid"])
+            key = f"{self.SAMPLES_PREFIX}{series}"
+            ts_ns = int(fields["ts"]) or now_ns
+            pipe.zadd(key, {f"{ts_ns}:{value!r}": ts_ns // 1_000_000})
+            last_trim = self._known.get(series)
+            if last_trim is not None and now - last_trim < self._TRIM_INTERVAL_SEC:
+                continue
+            # first sample of the series in this process, or once per interval: (re)register it and trim
+            if last_trim is None and len(self._known) >= self._MAX_KNOWN_SERIES:
+                self._known.clear()
+            index_keys = self._index_keys(fields["name"], mp.get("resource") or {})
+            pipe.hsetnx(self.CATALOG_KEY, series, json.dumps({
+                "name": fields["name"],
+                "type": fields["type"],
+                "unit": fields["unit"],
+                "rid": fields["rid"],
+                "aid": fields["aid"],
+                "index": index_keys,
+            }))
+            for index_key in index_keys:
+                pipe.sadd(index_key, series)
+            pipe.zremrangebyscore(key, "-inf", f"({ts_ns // 1_000_000 - retention_ms}")
+            pipe.expire(key, ttl)
+            self._known[series] = now
+
+    async def _select(self, name: str | None, host: str | None, vendor: str | None) -> List[str]:
+        keys = [f"{self.INDEX_PREFIX}{field}:{value}" for field, value in (("name", name), ("host", host), ("vendor", vendor)) if value]
+        if not keys:
+            return sorted(await self.client.hkeys(self.CATALOG_KEY))
+        return sorted(await self.client.sinter(keys))
+
+    async def _prune(self, series: List[str], meta: Dict[str, Dict[str, Any]]) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        for key in series:
+            for index_key in meta.get(key, {}).get("index", []):
+                pipe.srem(index_key, key)
+            pipe.hdel(self.CATALOG_KEY, key)
+        await pipe.execute()
+
+    @staticmethod
+    def _downsample(samples: List[Tuple[int, float]], step_ms: int) -> List[Dict[str, Any]]:
+        buckets: List[Dict[str, Any]] = []
+        current: Dict[str, Any] | None = None
+        for ts_ms, value in samples:
+            start = ts_ms - ts_ms % step_ms
+            if current is None or current["t"] != start:
+                current = {"t": start, "min": value, "max": value, "sum": 0.0, "count": 0}
+                buckets.append(current)
+            current["min"] = min(current["min"], value)
+            current["max"] = max(current["max"], value)
+            current["sum"] += value
+            current["count"] += 1
+        for bucket in buckets:
+            bucket["avg"] = bucket.pop("sum") / bucket["count"]
+        return buckets
+
+    async def query(
+        self,
+        *,
+        name: str | None = None,
+        host: str | None = None,
+        vendor: str | None = None,
+        start_ms: int,
+        end_ms: int,
+        step_sec: float | None = None,
+        cursor: str | None = None,
+        limit: int = 50,
+        max_points: int = 1000,
+    ) -> Dict[str, Any]:
+        """Series matching the filters with their samples in [start_ms, end_ms].
+
+        Pages over series in key order: pass the returned `next_cursor` back
+        as `cursor`. With `step_sec`, samples are downsampled to
+        `{"t", "min", "max", "avg", "count"}` buckets; otherwise the latest
+        `max_points` raw samples are returned as `[t_ms, value]`.
+        """
+        candidates = [s for s in await self._select(name, host, vendor) if cursor is None or s > cursor]
+        series: List[Dict[str, Any]] = []
+        expired: List[str] = []
+        raw_meta: Dict[str, Dict[str, Any]] = {}
+        position = 0
+        while len(series) < limit and position < len(candidates):
+            page = candidates[position : position + limit - len(series)]
+            position += len(page)
+            pipe = self.client.pipeline(transaction=False)
+            for key in page:
+                pipe.hget(self.CATALOG_KEY, key)
+                if step_sec:
+                    pipe.zrangebyscore(f"{self.SAMPLES_PREFIX}{key}", start_ms, end_ms)
+                else:
+                    pipe.zrevrangebyscore(f"{self.SAMPLES_PREFIX}{key}", end_ms, start_ms, start=0, num=max_points)
+                pipe.exists(f"{self.SAMPLES_PREFIX}{key}")
+            results = await pipe.execute()
+            for index, key in enumerate(page):
+                meta_raw, members, exists = results[index * 3 : index * 3 + 3]
+                meta = json.loads(meta_raw) if meta_raw else {}
+                raw_meta[key] = meta
+                if not exists:
+                    expired.append(key)
+                    continue
+                if not members:
+                    continue
+                samples = []
+                for member in members:
+                    ts_ns, _, value = member.partition(":")
+                    samples.append((int(ts_ns) // 1_000_000, float(value)))
+                samples.sort()
+                series.append({"key": key, "meta": meta, "samples": samples})
+        if expired:
+            await self._prune(expired, raw_meta)
+
+        resources = await self.codec.resolve("resource", (s["meta"].get("rid", EMPTY_ID) for s in series))
+        attribute_sets = await self.codec.resolve("attributes", (s["meta"].get("aid", EMPTY_ID) for s in series))
+        step_ms = int(step_sec * 1000) if step_sec else 0
+        items = []
+        for s in series:
+            meta = s["meta"]
+            items.append({
+                "series": s["key"],
+                "name": meta.get("name"),
+                "type": meta.get("type"),
+                "unit": meta.get("unit"),
+                "resource": resources.get(meta.get("rid", EMPTY_ID), {}),
+                "attributes": attribute_sets.get(meta.get("aid", EMPTY_ID), {}),
+                "points": self._downsample(s["samples"], step_ms) if step_ms else [list(p) for p in s["samples"]],
+            })
+        return {"series": items, "next_cursor": candidates[position - 1] if position < len(candidates) else None}
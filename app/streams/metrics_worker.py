@@ -0,0 +1,181 @@
+import asyncio
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Tuple
+
+import redis.asyncio as aioredis
+from fastapi import FastAPI
+
+from app.core.config import get_settings
+from app.services.metrics_normalization import MetricPoint, normalize
+# Ensure normalizers are registered at import time
+from app.services.normalizers import telegraf as _telegraf_norm  # noqa: F401
+from app.services.normalizers import dcim_http as _dcim_http_norm  # noqa: F401
+from app.services.normalizers import snmp as _snmp_norm  # noqa: F401
+from app.services.otel_exporter import export_metrics
+from app.services.source_configs import get_source_configs
+from app.streams.metric_codec import MetricCodec
+from app.streams.metric_index import MetricSeriesIndex
+from app.streams.utils import METRICS_INPUT_STREAM, StreamWriter, consumer_name
+from app.streams.worker import Message, StreamGroupReader
+
+settings = get_settings()
+redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+
+GROUP_NAME = "metric_consumers"
+CONSUMER_NAME = consumer_name("metrics")
+METRICS_STREAM = "metrics"
+
+LOG = logging.getLogger(__name__)
+
+# (kind, payload, source_id) of one raw entry
+RawMetric = Tuple[str, Dict[str, Any], int | None]
+
+
+def _decode(messages: List[Message]) -> List[RawMetric]:
+    items: List[RawMetric] = []
+    for msg_id, data in messages:
+        kind = (data.get("source") or "").split(":", 1)[0]
+        try:
+            payload = json.loads(data.get("line") or "")
+            source_id = int(data["source_id"]) if data.get("source_id") else None
+        except (ValueError, TypeError):
+            LOG.info("metrics worker skipping undecodable entry id=%s source=%s", msg_id, data.get("source"))
+            continue
+        if isinstance(payload, dict):
+            items.append((kind, payload, source_id))
+    return items
+
+
+def _normalize_batch(items: List[RawMetric], configs: Dict[int | None, Dict[str, Any]]) -> List[MetricPoint]:
+    points: List[MetricPoint] = []
+    for kind, payload, source_id in items:
+        try:
+            points.extend(normalize(kind, payload, configs.get(source_id) or {}))
+        except Exception as exc:  # noqa: BLE001
+            LOG.info("normalize failed kind=%s err=%s", kind, exc)
+    return points
+
+
+async def process_batch(
+    messages: List[Message],
+    writer: StreamWriter,
+    codec: MetricCodec,
+    index: MetricSeriesIndex | None = None,
+) -> int:
+    """Normalize a batch of raw entries, export the points and write them to the metrics stream.
+
+    DataSource configs are looked up once per source in the batch. Returns
+    the number of points written; raises if the stream write fails, so the
+    caller leaves the batch unacknowledged for redelivery.
+    """
+    items = _decode(messages)
+    configs: Dict[int | None, Dict[str, Any]] = {}
+    for source_id in {sid for _, _, sid in items if sid is not None}:
+        try:
+            configs[source_id] = await get_source_configs().get_config(source_id)
+        except Exception as exc:  # noqa: BLE001
+            LOG.info("metrics worker config lookup failed source_id=%s err=%s", source_id, exc)
+    points = _normalize_batch(items, configs)
+    if not points:
+        return 0
+    export_metrics(points)
+    dropped = writer.dropped_total
+    encoded = await codec.encode(points)
+    for fields in encoded:
+        await writer.add(fields)
+    await writer.flush()
+    if writer.dropped_total > dropped:
+        raise RuntimeError(f"{writer.dropped_total - dropped} points not written to {writer.stream}")
+    if index is not None:
+        # best effort: a failed index update must not get the batch (already in the stream) redelivered
+        try:
+            pipe = writer.client.pipeline(transaction=False)
+            index.queue(pipe, points, encoded)
+            await pipe.execute()
+        except Exception as exc:  # noqa: BLE001
+            LOG.info("metrics index update failed points=%d err=%s", len(points), exc)
+    return len(points)
+
+
+async def consume_metrics(consumer: str | None = None):
+    """Consume raw metric payloads from METRICS_INPUT_STREAM, in batches.
+
+    Runs apart from the logs consumer (its own stream, group and loop), so
+    bursts of polled metrics and log embedding don't hold each other up.
+    Entries are acknowledged once their points have been written.
+    """
+    consumer = consumer or CONSUMER_NAME
+    batch_size = max(1, int(settings.METRICS_BATCH_SIZE))
+    reader = StreamGroupReader(redis, METRICS_INPUT_STREAM, GROUP_NAME, consumer, count=batch_size, block_ms=1000)
+    await reader.ensure_group()
+    writer = StreamWriter(METRICS_STREAM, client=redis)
+    codec = MetricCodec(redis)
+    index = MetricSeriesIndex(redis, codec) if settings.METRICS_INDEX_ENABLED else None
+
+    LOG.info("metrics worker ready stream=%s group=%s consumer=%s", METRICS_INPUT_STREAM, GROUP_NAME, consumer)
+    try:
+        while True:
+            try:
+                messages = await reader.read()
+            except Exception as exc:
+                LOG.info("xreadgroup failed stream=%s group=%s consumer=%s err=%s", METRICS_INPUT_STREAM, GROUP_NAME, consumer, exc)
+                await asyncio.sleep(1)
+                continue
+            if not messages:
+                continue
+            try:
+                written = await process_batch(messages, writer, codec, index)
+            except Exception as exc:
+                LOG.info("metrics batch failed count=%d err=%s", len(messages), exc)
+                continue
+            try:
+                await reader.ack(*[msg_id for msg_id, _ in messages])
+            except Exception as exc:
+                LOG.info("ack failed count=%d err=%s", len(messages), exc)
+            LOG.debug("metrics batch entries=%d points=%d", len(messages), written)
+    finally:
+        await writer.close()
+
+
+def attach_metrics_worker(app: FastAPI):
+    async def _run_forever(index: int):
+        name = consumer_name("metrics", index)
+        backoff = 1.0
+        while True:
+            try:
+                LOG.info("starting metrics worker stream=%s group=%s consumer=%s", METRICS_INPUT_STREAM, GROUP_NAME, name)
+                await consume_metrics(name)
+            except Exception as exc:
+                LOG.info("metrics worker crashed consumer=%s err=%s; restarting in %.1fs", name, exc, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 10)
+
+    @app.on_event("startup")
+    async def startup_event():
+        if not settings.ENABLE_METRICS_NORMALIZATION:
+            return
+        workers = max(1, settings.METRICS_WORKERS)
+        LOG.info("starting metrics worker in dedicated thread workers=%d", workers)
+        loop = asyncio.new_event_loop()
+
+        def _runner():
+            asyncio.set_event_loop(loop)
+            for index in range(workers):
+                loop.create_task(_run_forever(index))
+            loop.run_forever()
+
+        thread = threading.Thread(target=_runner, name="metrics-worker-thread", daemon=True)
+        thread.start()
+        app.state.metrics_worker_loop = loop
+        app.state.metrics_worker_thread = thread
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        loop = getattr(app.state, "metrics_worker_loop", None)
+        thread = getattr(app.state, "metrics_worker_thread", None)
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout=5)
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Dict, List, Tuple
+
+from app.core.config import get_settings
+
+
+settings = get_settings()
+LOG = logging.getLogger(__name__)
+
+
+class TailOffsets:
+    """Checkpointed read positions of one source's tailed files, kept in Redis.
+
+    One hash per source (`tail:offsets:<source_id>`), one field per path;
+    the value is the tailer position (file id as dev:inode, byte offset and
+    leading bytes), so a checkpoint only applies to the file it was taken
+    from. Positions are committed by the StreamWriter `on_written` hook,
+    i.e. only after the lines before them were added to the stream.
+    """
+
+    KEY_PREFIX = "tail:offsets:"
+
+    def __init__(self, client: Any, source_id: int | str) -> None:
+        self.client = client
+        self.key = f"{self.KEY_PREFIX}{source_id}"
+
+    async def load(self, path: str) -> Dict[str, Any] | None:
+        try:
+            raw = await self.client.hget(self.key, path)
+        except Exception as exc:  # noqa: BLE001
+            LOG.info("tail offsets load failed key=%s path=%s err=%s", self.key, path, exc)
+            return None
+        if not raw:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    async def commit(self, checkpoints: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Store the last position per path out of (path, position) checkpoints."""
+        latest: Dict[str, Dict[str, Any]] = {}
+        for path, position in checkpoints:
+            latest[path] = position
+        if latest:
+            await self.client.hset(self.key, mapping={path: json.dumps(pos) for path, pos in latest.items()})
+
+    async def reset(self, path: str | None = None) -> None:
+        """Forget checkpoints (one path, or all of the source) so reading starts from 0."""
+        if path is None:
+            await self.client.delete(self.key)
+        else:
+            await self.client.hdel(self.key, path)
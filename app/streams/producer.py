@@ -1,15 +1,16 @@
 import asyncio
-import os
 import logging
 from pathlib import Path
 
-import aiofiles
 from fastapi import FastAPI
 import redis.asyncio as aioredis
 from redis.exceptions import ConnectionError as RedisConnectionError
 import threading
 
 from app.core.config import get_settings
+from app.streams.offsets import TailOffsets
+from app.streams.tail import FileTailer
+from app.streams.utils import StreamWriter
 
 settings = get_settings()
 redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
@@ -19,28 +20,25 @@ LOG = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 
-async def _tail_file(path: Path):
-    """Push existing lines from `path` and then follow new lines, sending each to Redis."""
+async def _tail_file(path: Path, writer: StreamWriter, offsets: TailOffsets | None = None):
+    """Push lines from `path` (from the checkpointed offset, if any) and follow new ones, in batches."""
     source = path.name
-    async with aiofiles.open(path, mode="r") as f:
-        # push existing lines
-        await f.seek(0)
-        while True:
-            line = await f.readline()
-            if not line:
-                break
-            await _safe_xadd(STREAM_NAME, {"source": source, "line": line.strip()})
-            LOG.debug("pushed existing line from %s", source)
-
-        # now follow new lines
-        await f.seek(0, os.SEEK_END)
-        while True:
-            line = await f.readline()
-            if not line:
-                await asyncio.sleep(0.5)
-                continue
-            await _safe_xadd(STREAM_NAME, {"source": source, "line": line.strip()})
-            LOG.info("pushed new line from %s", source)
+    resume = None
+    if offsets is not None:
+        if settings.PRODUCER_BACKFILL:
+            await offsets.reset(str(path))
+        else:
+            resume = await offsets.load(str(path))
+    tailer = FileTailer(path, resume=resume)
+    try:
+        async for lines in tailer.follow():
+            checkpoint = (str(path), tailer.position())
+            last = len(lines) - 1
+            for i, line in enumerate(lines):
+                await writer.add({"source": source, "line": line.strip()}, checkpoint=checkpoint if i == last else None)
+            LOG.debug("pushed %d lines from %s", len(lines), source)
+    finally:
+        tailer.close()
 
 
 async def _wait_for_redis() -> None:
@@ -57,19 +55,6 @@ async def _wait_for_redis() -> None:
             delay = min(delay * 2, 5)
 
 
-async def _safe_xadd(stream: str, fields: dict, *, retry: int = 1) -> None:
-    """Perform xadd with one automatic reconnect/retry on connection errors."""
-    try:
-        await redis.xadd(stream, fields, id="*")
-    except RedisConnectionError as exc:
-        LOG.info("xadd failed (%s). Waiting for Redis and retrying...", exc)
-        await _wait_for_redis()
-        if retry > 0:
-            await _safe_xadd(stream, fields, retry=retry - 1)
-        else:
-            LOG.info("xadd retry exhausted stream=%s fields=%s", stream, fields)
-
-
 async def produce_logs():
     """Tail specific log files under data/ and push lines to Redis Stream concurrently.
 
@@ -84,6 +69,8 @@ async def produce_logs():
     await _wait_for_redis()
     LOG.info("producer ready; Redis reachable at %s, starting to collect files", settings.REDIS_URL)
 
+    offsets = TailOffsets(redis, "producer") if settings.TAIL_OFFSETS_ENABLED else None
+    writer = StreamWriter(STREAM_NAME, client=redis, on_written=offsets.commit if offsets else None)
     tasks = []
     expected_files = ["Linux.log", "Mac.log"]
     found_paths = []
@@ -92,7 +79,7 @@ async def produce_logs():
         path = data_dir / name
         if path.exists():
             found_paths.append(path)
-            tasks.append(asyncio.create_task(_tail_file(path)))
+            tasks.append(asyncio.create_task(_tail_file(path, writer, offsets)))
         else:
             LOG.info("Expected log file not found: %s", path)
 
@@ -102,7 +89,10 @@ async def produce_logs():
             await asyncio.sleep(3600)
 
     LOG.info("Tailing %d files: %s", len(found_paths), ", ".join([p.name for p in found_paths]))
-    await asyncio.gather(*tasks)
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await writer.close()
 
 
 if __name__ == "__main__":
@@ -9,7 +9,7 @@ import httpx
 
 from app.streams.producers.base import ProducerPlugin
 from app.streams.producers.registry import register
-from app.streams.utils import STREAM_NAME, safe_xadd, wait_for_redis
+from app.streams.utils import STREAM_NAME, StreamWriter, wait_for_redis
 
 
 LOG = logging.getLogger(__name__)
@@ -31,6 +31,7 @@ class Datadog(ProducerPlugin):
         self.os_hint: str = (cfg.get("os") or "unknown").lower()
         self._stop = False
         self._since: Optional[datetime] = None
+        self._writer: StreamWriter | None = None
 
     def _headers(self) -> Dict[str, str]:
         return {
@@ -72,7 +73,7 @@ class Datadog(ProducerPlugin):
                         continue
                     # Use os hint in source so downstream OS routing can work if desired
                     source = f"datadog:{self.os_hint}"
-                    await safe_xadd(STREAM_NAME, {"source": source, "line": str(msg).strip()})
+                    await self._writer.add({"source": source, "line": str(msg).strip()})  # type: ignore[union-attr]
                     total += 1
                 except Exception as exc:  # noqa: BLE001
                     LOG.info("datadog: failed to emit log err=%s", exc)
@@ -91,14 +92,18 @@ class Datadog(ProducerPlugin):
             while not self._stop:
                 await asyncio.sleep(60)
             return
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=30) as client:
-            while not self._stop:
-                try:
-                    count = await self._poll_once(client)
-                    LOG.info("datadog: fetched %d logs", count)
-                except Exception as exc:  # noqa: BLE001
-                    LOG.info("datadog poll failed err=%s", exc)
-                await asyncio.sleep(self.poll_interval_sec)
+        self._writer = StreamWriter(STREAM_NAME)
+        try:
+            async with httpx.AsyncClient(verify=self.verify_ssl, timeout=30) as client:
+                while not self._stop:
+                    try:
+                        count = await self._poll_once(client)
+                        LOG.info("datadog: fetched %d logs", count)
+                    except Exception as exc:  # noqa: BLE001
+                        LOG.info("datadog poll failed err=%s", exc)
+                    await asyncio.sleep(self.poll_interval_sec)
+        finally:
+            await self._writer.close()
 
     async def shutdown(self) -> None:
         self._stop = True
@@ -1,17 +1,18 @@
 from __future__ import annotations
 
 import asyncio
-import os
 from pathlib import Path
 import logging
 
-import aiofiles
-
 from app.streams.producers.base import ProducerPlugin
 from app.streams.producers.registry import register
-from app.streams.utils import STREAM_NAME, safe_xadd, wait_for_redis
+from app.core.config import get_settings
+from app.streams.offsets import TailOffsets
+from app.streams.tail import FileTailer
+from app.streams.utils import STREAM_NAME, StreamWriter, wait_for_redis
 
 
+settings = get_settings()
 LOG = logging.getLogger(__name__)
 
 
@@ -24,7 +25,13 @@ class FileTail(ProducerPlugin):
         # Text decoding configuration; Windows defaults can cause decode errors on arbitrary logs
         self.encoding = config.get("encoding") or "utf-8"
         self.errors = config.get("errors") or "replace"
+        # Re-read files from the start instead of resuming at the checkpointed offsets
+        self.backfill = bool(config.get("backfill", False))
+        self._source_id = config.get("_source_id")
         self._stop = False
+        self._writer: StreamWriter | None = None
+        self._tailers: list[FileTailer] = []
+        self._offsets: TailOffsets | None = None
         LOG.info(
             "filetail: configured paths=%s encoding=%s errors=%s",
             ", ".join(str(p) for p in self.paths),
@@ -34,37 +41,36 @@ class FileTail(ProducerPlugin):
 
     async def _tail(self, path: Path) -> None:
         source = path.name
+        resume = None
+        if self._offsets is not None:
+            if self.backfill:
+                await self._offsets.reset(str(path))
+            else:
+                resume = await self._offsets.load(str(path))
+        tailer = FileTailer(path, encoding=self.encoding, errors=self.errors, resume=resume)
+        self._tailers.append(tailer)
         backoff = 1.0
-        while not self._stop:
-            # Wait for file to appear if it's not there yet
-            while not self._stop and not path.exists():
-                await asyncio.sleep(1.0)
-            if self._stop:
-                return
-            try:
-                LOG.info("filetail: opening %s", path)
-                async with aiofiles.open(path, mode="r", encoding=self.encoding, errors=self.errors) as f:
-                    # Read existing content once
-                    await f.seek(0)
-                    while not self._stop:
-                        line = await f.readline()
-                        if not line:
-                            break
-                        await safe_xadd(STREAM_NAME, {"source": source, "line": line.strip()})
-                    # Seek to EOF and follow
-                    await f.seek(0, os.SEEK_END)
-                    while not self._stop:
-                        line = await f.readline()
-                        if not line:
-                            await asyncio.sleep(0.5)
-                            continue
-                        await safe_xadd(STREAM_NAME, {"source": source, "line": line.strip()})
-                # successful pass; reset backoff
-                backoff = 1.0
-            except Exception as exc:  # noqa: BLE001
-                LOG.exception("filetail: error while tailing %s: %s", path, exc)
-                await asyncio.sleep(backoff)
-                backoff = min(backoff * 2, 10.0)
+        try:
+            while not self._stop:
+                try:
+                    # Reads existing content, then follows; waits for the file to appear
+                    async for lines in tailer.follow():
+                        # the batch's last line carries the position to commit once it is written
+                        checkpoint = (str(path), tailer.position())
+                        last = len(lines) - 1
+                        for i, line in enumerate(lines):
+                            await self._writer.add(  # type: ignore[union-attr]
+                                {"source": source, "line": line.strip()},
+                                checkpoint=checkpoint if i == last else None,
+                            )
+                        backoff = 1.0
+                    return
+                except Exception as exc:  # noqa: BLE001
+                    LOG.exception("filetail: error while tailing %s: %s", path, exc)
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 10.0)
+        finally:
+            tailer.close()
 
     async def run(self) -> None:
         await wait_for_redis()
@@ -74,11 +80,21 @@ class FileTail(ProducerPlugin):
             LOG.error("filetail: missing files at startup: %s", ", ".join(missing))
         # Always start tasks for configured paths; each task waits for file to appear
         LOG.info("filetail: starting tails for %d paths", len(self.paths))
+        self._writer = StreamWriter(STREAM_NAME)
+        self._tailers = []
+        if settings.TAIL_OFFSETS_ENABLED and self._source_id is not None:
+            self._offsets = TailOffsets(self._writer.client, self._source_id)
+            self._writer.on_written = self._offsets.commit
         tasks = [asyncio.create_task(self._tail(p)) for p in self.paths]
-        await asyncio.gather(*tasks)
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await self._writer.close()
 
     async def shutdown(self) -> None:
         self._stop = True
+        for tailer in self._tailers:
+            tailer.stop()
 
 
 @register("filetail")
@@ -10,7 +10,7 @@ import httpx
 
 from app.streams.producers.base import ProducerPlugin
 from app.streams.producers.registry import register
-from app.streams.utils import STREAM_NAME, safe_xadd, wait_for_redis
+from app.streams.utils import StreamWriter, stream_for_source, wait_for_redis
 
 
 LOG = logging.getLogger(__name__)
@@ -33,6 +33,7 @@ class DCIMHttpPoller(ProducerPlugin):
         self.verify_ssl: bool = bool(config.get("verify_ssl", True))
         self._stop = False
         self._source_id: int | None = int(config.get("_source_id")) if config.get("_source_id") is not None else None
+        self._writer: StreamWriter | None = None
 
     async def _poll_endpoint(self, ep: dict[str, Any]) -> None:
         url: str = str(ep.get("url") or "")
@@ -61,8 +62,7 @@ class DCIMHttpPoller(ProducerPlugin):
                         "status": resp.status_code,
                         "body": body,
                     }
-                    await safe_xadd(
-                        STREAM_NAME,
+                    await self._writer.add(  # type: ignore[union-attr]
                         {
                             "source": src,
                             "line": json.dumps(payload, ensure_ascii=False),
@@ -80,8 +80,12 @@ class DCIMHttpPoller(ProducerPlugin):
             while not self._stop:
                 await asyncio.sleep(60)
             return
+        self._writer = StreamWriter(stream_for_source("dcim_http"))
         tasks = [asyncio.create_task(self._poll_endpoint(ep)) for ep in self.endpoints]
-        await asyncio.gather(*tasks)
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await self._writer.close()
 
     async def shutdown(self) -> None:
         self._stop = True
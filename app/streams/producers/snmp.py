@@ -7,7 +7,7 @@ from typing import Any
 
 from app.streams.producers.base import ProducerPlugin
 from app.streams.producers.registry import register
-from app.streams.utils import STREAM_NAME, safe_xadd, wait_for_redis
+from app.streams.utils import StreamWriter, stream_for_source, wait_for_redis
 
 
 LOG = logging.getLogger(__name__)
@@ -41,6 +41,7 @@ class SNMPProducer(ProducerPlugin):
         self._stop = False
         self._source_id: int | None = int(config.get("_source_id")) if config.get("_source_id") is not None else None
         self._snmp = _import_puresnmp()
+        self._writer: StreamWriter | None = None
 
     async def _get_oid(self, client: Any, oid: str) -> Any:
         # puresnmp uses tuples for OIDs sometimes; accept string
@@ -80,8 +81,7 @@ class SNMPProducer(ProducerPlugin):
                         "oid": oid,
                         "value": str(res),
                     }
-                    await safe_xadd(
-                        STREAM_NAME,
+                    await self._writer.add(  # type: ignore[union-attr]
                         {
                             "source": f"snmp:{host}",
                             "line": json.dumps(payload, ensure_ascii=False),
@@ -100,8 +100,12 @@ class SNMPProducer(ProducerPlugin):
             while not self._stop:
                 await asyncio.sleep(60)
             return
+        self._writer = StreamWriter(stream_for_source("snmp"))
         tasks = [asyncio.create_task(self._poll_host(h)) for h in self.hosts]
-        await asyncio.gather(*tasks)
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await self._writer.close()
 
     async def shutdown(self) -> None:
         self._stop = True
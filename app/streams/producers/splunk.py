@@ -8,7 +8,7 @@ import httpx
 
 from app.streams.producers.base import ProducerPlugin
 from app.streams.producers.registry import register
-from app.streams.utils import STREAM_NAME, safe_xadd, wait_for_redis
+from app.streams.utils import STREAM_NAME, StreamWriter, wait_for_redis
 
 
 LOG = logging.getLogger(__name__)
@@ -32,6 +32,7 @@ class Splunk(ProducerPlugin):
         self.headers = {"Authorization": f"Splunk {token}"}
         self.verify = bool(cfg.get("verify_ssl", True))
         self._stop = False
+        self._writer: StreamWriter | None = None
 
     async def run(self) -> None:
         await wait_for_redis()
@@ -40,23 +41,27 @@ class Splunk(ProducerPlugin):
             while not self._stop:
                 await asyncio.sleep(60)
             return
-        async with httpx.AsyncClient(verify=self.verify, timeout=None) as client:
-            async with client.stream("GET", self.url, params=self.params, headers=self.headers) as resp:
-                resp.raise_for_status()
-                async for line in resp.aiter_lines():
-                    if self._stop:
-                        break
-                    if not line:
-                        continue
-                    try:
-                        obj = json.loads(line)
-                        result = obj.get("result") or {}
-                        raw = result.get("_raw") or ""
-                        if raw:
-                            await safe_xadd(STREAM_NAME, {"source": "splunk:unknown", "line": raw})
-                    except Exception as exc:
-                        LOG.info("splunk stream parse failed err=%s", exc)
-                        await asyncio.sleep(0.1)
+        self._writer = StreamWriter(STREAM_NAME)
+        try:
+            async with httpx.AsyncClient(verify=self.verify, timeout=None) as client:
+                async with client.stream("GET", self.url, params=self.params, headers=self.headers) as resp:
+                    resp.raise_for_status()
+                    async for line in resp.aiter_lines():
+                        if self._stop:
+                            break
+                        if not line:
+                            continue
+                        try:
+                            obj = json.loads(line)
+                            result = obj.get("result") or {}
+                            raw = result.get("_raw") or ""
+                            if raw:
+                                await self._writer.add({"source": "splunk:unknown", "line": raw})
+                        except Exception as exc:
+                            LOG.info("splunk stream parse failed err=%s", exc)
+                            await asyncio.sleep(0.1)
+        finally:
+            await self._writer.close()
 
     async def shutdown(self) -> None:
         self._stop = True
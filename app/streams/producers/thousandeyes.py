@@ -8,7 +8,7 @@ import httpx
 
 from app.streams.producers.base import ProducerPlugin
 from app.streams.producers.registry import register
-from app.streams.utils import STREAM_NAME, safe_xadd, wait_for_redis
+from app.streams.utils import STREAM_NAME, StreamWriter, wait_for_redis
 
 
 LOG = logging.getLogger(__name__)
@@ -32,6 +32,7 @@ class ThousandEyes(ProducerPlugin):
         self.api_token: Optional[str] = cfg.get("api_token")
 
         self._stop = False
+        self._writer: StreamWriter | None = None
 
     def _headers(self) -> Dict[str, str]:
         headers: Dict[str, str] = {"Content-Type": "application/json"}
@@ -59,7 +60,7 @@ class ThousandEyes(ProducerPlugin):
                 if not line:
                     line = str(a)
                 source = f"thousandeyes:{self.os_hint}"
-                await safe_xadd(STREAM_NAME, {"source": source, "line": line.strip()})
+                await self._writer.add({"source": source, "line": line.strip()})  # type: ignore[union-attr]
                 count += 1
             except Exception as exc:  # noqa: BLE001
                 LOG.info("thousandeyes: failed to emit log err=%s", exc)
@@ -72,14 +73,18 @@ class ThousandEyes(ProducerPlugin):
             while not self._stop:
                 await asyncio.sleep(60)
             return
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=30) as client:
-            while not self._stop:
-                try:
-                    n = await self._poll_once(client)
-                    LOG.info("thousandeyes: fetched %d items", n)
-                except Exception as exc:  # noqa: BLE001
-                    LOG.info("thousandeyes poll failed err=%s", exc)
-                await asyncio.sleep(self.poll_interval_sec)
+        self._writer = StreamWriter(STREAM_NAME)
+        try:
+            async with httpx.AsyncClient(verify=self.verify_ssl, timeout=30) as client:
+                while not self._stop:
+                    try:
+                        n = await self._poll_once(client)
+                        LOG.info("thousandeyes: fetched %d items", n)
+                    except Exception as exc:  # noqa: BLE001
+                        LOG.info("thousandeyes poll failed err=%s", exc)
+                    await asyncio.sleep(self.poll_interval_sec)
+        finally:
+            await self._writer.close()
 
     async def shutdown(self) -> None:
         self._stop = True
@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import redis.asyncio as aioredis
+from fastapi import FastAPI
+
+from app.core.config import get_settings
+from app.streams.utils import StreamWriter
+
+
+settings = get_settings()
+redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+LOG = logging.getLogger(__name__)
+
+Entry = Tuple[str, Dict[str, Any]]
+
+_SEGMENT_SUFFIX = ".jsonl.gz"
+_ENTRY_ID_RE = re.compile(r"^\d+(-\d+)?$")
+
+
+def is_entry_id(value: str) -> bool:
+    """Whether `value` is a stream entry id (`<ms>-<seq>` or `<ms>`)."""
+    return bool(_ENTRY_ID_RE.match(value or ""))
+
+
+def _parse_id(entry_id: str) -> Tuple[int, int]:
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def _next_id(entry_id: str) -> str:
+    ms, seq = _parse_id(entry_id)
+    return f"{ms}-{seq + 1}"
+
+
+class StreamArchive:
+    """Gzipped JSONL segment files of trimmed stream entries.
+
+    Layout: `<root>/<stream>/<first_id>_<last_id>_<count>.jsonl.gz`, one
+    `{"id": ..., "fields": {...}}` object per line, entries in stream order.
+    Segments are written to a temp file and renamed, so a listed segment is
+    always complete. Only streams with a retention policy have an archive;
+    other names raise ValueError.
+    """
+
+    def __init__(self, root: str | Path | None = None) -> None:
+        self.root = Path(root if root is not None else settings.STREAM_ARCHIVE_DIR)
+
+    def _dir(self, stream: str) -> Path:
+        if stream not in StreamRetention.policies():
+            raise ValueError(f"no retention policy for stream {stream!r}")
+        return self.root / stream
+
+    def write_segment(self, stream: str, entries: List[Entry]) -> Path:
+        directory = self._dir(stream)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = f"{entries[0][0]}_{entries[-1][0]}_{len(entries)}{_SEGMENT_SUFFIX}"
+        path = directory / name
+        tmp = directory / f".{name}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            for entry_id, fields in entries:
+                f.write(json.dumps({"id": entry_id, "fields": fields}, ensure_ascii=False))
+                f.write("\n")
+        os.replace(tmp, path)
+        return path
+
+    def list_segments(self, stream: str) -> List[Dict[str, Any]]:
+        directory = self._dir(stream)
+        if not directory.is_dir():
+            return []
+        segments: List[Dict[str, Any]] = []
+        for path in directory.iterdir():
+            if path.name.startswith(".") or not path.name.endswith(_SEGMENT_SUFFIX):
+                continue
+            try:
+                first_id, last_id, count = path.name[: -len(_SEGMENT_SUFFIX)].split("_")
+                _parse_id(first_id), _parse_id(last_id)
+            except ValueError:
+                continue
+            segments.append({
+                "name": path.name,
+                "first_id": first_id,
+                "last_id": last_id,
+                "entries": int(count),
+                "bytes": path.stat().st_size,
+            })
+        segments.sort(key=lambda s: _parse_id(s["first_id"]))
+        return segments
+
+    def read_segment(self, stream: str, name: str) -> List[Entry]:
+        path = self._dir(stream) / Path(name).name
+        entries: List[Entry] = []
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                obj = json.loads(line)
+                entries.append((obj["id"], obj["fields"]))
+        return entries
+
+
+async def replay_archive(
+    client: Any,
+    stream: str,
+    *,
+    start_id: str = "-",
+    end_id: str = "+",
+    target: str | None = None,
+    archive: StreamArchive | None = None,
+    max_entries: int | None = None,
+) -> Tuple[int, str | None]:
+    """Re-add archived entries of `stream` with ids in [start_id, end_id] to `target` (default: `stream`).
+
+    Entries get new ids in the target stream, so they are processed again
+    by its consumer groups. At most `max_entries` are replayed per call.
+    Returns the number of entries replayed and, when the limit cut the
+    range short, the start id to continue from (else None). Raises
+    ValueError for malformed ids.
+    """
+    for entry_id, open_end in ((start_id, "-"), (end_id, "+")):
+        if entry_id != open_end and not is_entry_id(entry_id):
+            raise ValueError(f"invalid stream entry id {entry_id!r}")
+    archive = archive or StreamArchive()
+    low = _parse_id(start_id) if start_id != "-" else (0, 0)
+    high = _parse_id(end_id) if end_id != "+" else None
+    limit = max(1, int(max_entries if max_entries is not None else settings.STREAM_REPLAY_MAX_ENTRIES))
+    writer = StreamWriter(target or stream, client=client)
+    replayed = 0
+    try:
+        for segment in archive.list_segments(stream):
+            if _parse_id(segment["last_id"]) < low:
+                continue
+            if high is not None and _parse_id(segment["first_id"]) > high:
+                break
+            entries = await asyncio.to_thread(archive.read_segment, stream, segment["name"])
+            for entry_id, fields in entries:
+                key = _parse_id(entry_id)
+                if key < low or (high is not None and key > high):
+                    continue
+                if replayed >= limit:
+                    return replayed, entry_id
+                await writer.add(fields)
+                replayed += 1
+    finally:
+        await writer.close()
+    return replayed, None
+
+
+class StreamRetention:
+    """Keeps streams bounded: archives their oldest entries, then trims them.
+
+    Per stream, entries are trimmed once they are beyond `STREAM_MAXLEN[stream]`
+    (oldest first) or older than `STREAM_MAX_AGE_SEC[stream]`. Unless
+    `STREAM_TRIM_UNCONSUMED` is set, entries not yet delivered to, or still
+    pending in, any consumer group of the stream are kept. Entries are
+    written to archive segments first (when `STREAM_ARCHIVE_DIR` is set); a
+    per-stream watermark of the last archived id makes approximate
+    (`MINID ~`) trimming safe, since entries left over by a partial trim are
+    not archived twice. A Redis lock keeps replicas from running passes
+    concurrently; it is released only by the pass that holds it.
+    """
+
+    LOCK_KEY = "stream:retention:lock"
+    # delete the lock only if it still holds our token (it may have expired and been taken by another replica)
+    _RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+    def __init__(self, client: Any, archive: StreamArchive | None = None) -> None:
+        self.client = client
+        self.archive = archive if archive is not None else (StreamArchive() if settings.STREAM_ARCHIVE_DIR else None)
+        self.page_size = 1000
+        self.segment_entries = max(1, int(settings.STREAM_ARCHIVE_SEGMENT_ENTRIES))
+        self.trimmed_total: Dict[str, int] = {}
+        self.archived_total: Dict[str, int] = {}
+
+    @staticmethod
+    def policies() -> Dict[str, Tuple[int, int]]:
+        """stream -> (maxlen, max_age_sec); 0 disables that bound."""
+        maxlens = settings.STREAM_MAXLEN or {}
+        ages = settings.STREAM_MAX_AGE_SEC or {}
+        return {
+            stream: (int(maxlens.get(stream) or 0), int(ages.get(stream) or 0))
+            for stream in set(maxlens) | set(ages)
+        }
+
+    @staticmethod
+    def watermark_key(stream: str) -> str:
+        return f"stream:archive:{stream}:watermark"
+
+    async def _consumed_limit(self, stream: str) -> Tuple[int, int] | None:
+        """Lowest id some consumer group still needs; None when every entry may go."""
+        if settings.STREAM_TRIM_UNCONSUMED:
+            return None
+        limit: Tuple[int, int] | None = None
+        for group in await self.client.xinfo_groups(stream):
+            name = group.get("name")
+            needed = _parse_id(_next_id(str(group.get("last-delivered-id") or "0-0")))
+            if int(group.get("pending") or 0):
+                summary = await self.client.xpending(stream, name)
+                if summary and summary.get("min"):
+                    needed = min(needed, _parse_id(str(summary["min"])))
+            limit = needed if limit is None else min(limit, needed)
+        return limit
+
+    async def enforce(self, stream: str, maxlen: int, max_age_sec: int) -> int:
+        """Archive and trim one stream; returns the number of entries trimmed."""
+        length = int(await self.client.xlen(stream))
+        if not length:
+            return 0
+        excess = max(0, length - maxlen) if maxlen else 0
+        age_cutoff = (int(time.time() * 1000) - max_age_sec * 1000, 0) if max_age_sec else None
+        if not excess and age_cutoff is None:
+            return 0
+        safe_limit = await self._consumed_limit(stream)
+        watermark_raw = await self.client.get(self.watermark_key(stream))
+        watermark = _parse_id(watermark_raw) if watermark_raw else (-1, -1)
+
+        position = 0
+        last_id: str | None = None
+        committed_id: str | None = None
+        pending: List[Entry] = []
+        trimmed = 0
+        cursor = "-"
+        done = False
+        while not done:
+            page = await self.client.xrange(stream, min=cursor, max="+", count=self.page_size)
+            for entry_id, fields in page:
+                key = _parse_id(entry_id)
+                expired = position < excess or (age_cutoff is not None and key < age_cutoff)
+                if not expired or (safe_limit is not None and key >= safe_limit):
+                    done = True
+                    break
+                if key > watermark:
+                    pending.append((entry_id, fields))
+                position += 1
+                last_id = entry_id
+            if len(pending) >= self.segment_entries:
+                trimmed += await self._archive_and_trim(stream, pending, last_id)  # type: ignore[arg-type]
+                committed_id, pending = last_id, []
+            if len(page) < self.page_size:
+                break
+            cursor = f"({page[-1][0]}"
+        if last_id is not None and last_id != committed_id:
+            trimmed += await self._archive_and_trim(stream, pending, last_id)
+        if trimmed:
+            self.trimmed_total[stream] = self.trimmed_total.get(stream, 0) + trimmed
+            LOG.info("stream retention trimmed stream=%s entries=%d length=%d", stream, trimmed, length)
+        return trimmed
+
+    async def _archive_and_trim(self, stream: str, entries: List[Entry], last_id: str) -> int:
+        """Archive `entries`, advance the watermark to `last_id` and trim everything up to it."""
+        if entries and self.archive is not None:
+            await asyncio.to_thread(self.archive.write_segment, stream, entries)
+            self.archived_total[stream] = self.archived_total.get(stream, 0) + len(entries)
+        await self.client.set(self.watermark_key(stream), last_id)
+        return int(await self.client.xtrim(stream, minid=_next_id(last_id), approximate=True) or 0)
+
+    async def run_once(self) -> Dict[str, int]:
+        lock_ttl = max(60, int(settings.STREAM_RETENTION_INTERVAL_SEC) * 5)
+        token = f"{os.getpid()}:{uuid.uuid4().hex}"
+        if not await self.client.set(self.LOCK_KEY, token, nx=True, ex=lock_ttl):
+            return {}
+        results: Dict[str, int] = {}
+        try:
+            for stream, (maxlen, max_age_sec) in sorted(self.policies().items()):
+                try:
+                    results[stream] = await self.enforce(stream, maxlen, max_age_sec)
+                except Exception as exc:  # noqa: BLE001
+                    LOG.info("stream retention failed stream=%s err=%s", stream, exc)
+        finally:
+            await self.client.eval(self._RELEASE_SCRIPT, 1, self.LOCK_KEY, token)
+        return results
+
+    async def status(self) -> Dict[str, Any]:
+        streams: Dict[str, Any] = {}
+        for stream, (maxlen, max_age_sec) in sorted(self.policies().items()):
+            streams[stream] = {
+                "length": int(await self.client.xlen(stream)),
+                "maxlen": maxlen,
+                "max_age_sec": max_age_sec,
+                "archived_up_to": await self.client.get(self.watermark_key(stream)),
+                "segments": len(self.archive.list_segments(stream)) if self.archive is not None else 0,
+            }
+        return {"archive_dir": str(self.archive.root) if self.archive is not None else "", "streams": streams}
+
+
+def attach_stream_retention(app: FastAPI):
+    async def _run_forever():
+        retention = StreamRetention(redis)
+        while True:
+            try:
+                await retention.run_once()
+            except Exception as exc:
+                LOG.info("stream retention pass failed err=%s", exc)
+            await asyncio.sleep(float(settings.STREAM_RETENTION_INTERVAL_SEC))
+
+    @app.on_event("startup")
+    async def startup_event():
+        if not settings.ENABLE_STREAM_RETENTION:
+            return
+        LOG.info("starting stream retention in dedicated thread")
+        loop = asyncio.new_event_loop()
+
+        def _runner():
+            asyncio.set_event_loop(loop)
+            loop.create_task(_run_forever())
+            loop.run_forever()
+
+        thread = threading.Thread(target=_runner, name="stream-retention-thread", daemon=True)
+        thread.start()
+        app.state.stream_retention_loop = loop
+        app.state.stream_retention_thread = thread
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        loop = getattr(app.state, "stream_retention_loop", None)
+        thread = getattr(app.state, "stream_retention_thread", None)
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout=5)
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from app.core.config import get_settings
+
+
+settings = get_settings()
+LOG = logging.getLogger(__name__)
+
+# inotify(7) flags
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+# Leading bytes remembered per file; a mismatch at EOF means it was truncated and rewritten
+_HEAD_BYTES = 64
+
+
+class _DirectoryWatch:
+    """inotify watch on a directory, exposed as an awaitable "something changed" signal.
+
+    Watching the directory rather than the file also reports the file being
+    created, renamed away (rotation) or deleted. Any event wakes the waiter;
+    the tailer then looks at the file itself, so spurious wakeups from other
+    files in the directory only cost a read() and a stat().
+    """
+
+    def __init__(self, directory: Path) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(fd, os.fsencode(str(directory)), _WATCH_MASK) < 0:
+            err = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(err, f"inotify_add_watch failed for {directory}")
+        self.fd = fd
+        self._changed = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(fd, self._drain)
+
+    def _drain(self) -> None:
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        self._changed.set()
+
+    async def wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._changed.clear()
+
+    def close(self) -> None:
+        try:
+            self._loop.remove_reader(self.fd)
+        finally:
+            os.close(self.fd)
+
+
+class FileTailer:
+    """Follows a log file from a byte offset, yielding batches of complete lines.
+
+    The file is read in `block_size` blocks on a worker thread (one thread
+    hop per block, not per line) and split into lines in memory, so catching
+    up on a large file runs at disk speed. At end of file the tailer checks
+    whether the path now names a different file (rotation: the rest of the
+    old file has already been read, the new one is opened from offset 0) or
+    whether the file shrank below the current offset or its first bytes
+    changed (truncation: reading restarts at 0). It then waits for changes with inotify on the file's
+    directory when available, falling back to polling with a delay that
+    grows from `poll_min_sec` to `poll_max_sec` while the file is idle.
+
+    A trailing line without newline is held back until it is completed, or
+    emitted as-is once the file has been idle for `poll_max_sec`.
+    `position()` describes the point just after the last yielded line; pass
+    it back as `resume` to continue there. It is only honoured when the path
+    still names the same file (inode and leading bytes) and the file is at
+    least that long; otherwise reading starts at 0.
+    """
+
+    def __init__(
+        self,
+        path: Path | str,
+        *,
+        encoding: str = "utf-8",
+        errors: str = "replace",
+        resume: Dict[str, Any] | None = None,
+        block_size: int | None = None,
+        poll_min_sec: float | None = None,
+        poll_max_sec: float | None = None,
+        use_inotify: bool | None = None,
+    ) -> None:
+        self.path = Path(path)
+        self.encoding = encoding
+        self.errors = errors
+        self.block_size = max(4096, int(block_size or settings.TAIL_BLOCK_SIZE))
+        self.poll_min_sec = float(poll_min_sec if poll_min_sec is not None else settings.TAIL_POLL_MIN_SEC)
+        self.poll_max_sec = max(self.poll_min_sec, float(poll_max_sec if poll_max_sec is not None else settings.TAIL_POLL_MAX_SEC))
+        self.use_inotify = settings.TAIL_USE_INOTIFY if use_inotify is None else use_inotify
+        self._resume = resume
+        self._fd: int | None = None
+        self.file_id: Tuple[int, int] | None = None  # (st_dev, st_ino) of the open file
+        self._pos = 0  # bytes read from the open file
+        self._partial = b""
+        self._head = b""  # first bytes of the open file, to notice it being rewritten in place
+        self._watch: _DirectoryWatch | None = None
+        self._watch_failed = False
+        self._delay = self.poll_min_sec
+        self._idle_since = time.monotonic()
+        self._stopped = False
+        self._waited = False
+        self.rotations = 0
+        self.truncations = 0
+
+    @property
+    def offset(self) -> int:
+        return self._pos - len(self._partial)
+
+    def stop(self) -> None:
+        self._stopped = True
+
+    def close(self) -> None:
+        self._close_file()
+        if self._watch is not None:
+            self._watch.close()
+            self._watch = None
+
+    def _close_file(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = None
+
+    def _open(self) -> bool:
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        st = os.fstat(fd)
+        offset = self._resume_offset(fd, st) if self._resume else 0
+        self._resume = None
+        os.lseek(fd, offset, os.SEEK_SET)
+        self._fd = fd
+        self.file_id = (st.st_dev, st.st_ino)
+        self._pos = offset
+        self._partial = b""
+        self._head = os.pread(fd, min(offset, _HEAD_BYTES), 0)
+        LOG.info("tail: opened %s offset=%d size=%d", self.path, offset, st.st_size)
+        return True
+
+    def _rewritten(self) -> bool:
+        assert self._fd is not None
+        return bool(self._head) and os.pread(self._fd, len(self._head), 0) != self._head
+
+    def _resume_offset(self, fd: int, st: os.stat_result) -> int:
+        resume = self._resume or {}
+        offset = int(resume.get("offset") or 0)
+        head = bytes.fromhex(str(resume.get("head") or ""))
+        if resume.get("file_id") != f"{st.st_dev}:{st.st_ino}" or offset > st.st_size:
+            LOG.info("tail: %s is not the checkpointed file, reading from 0", self.path)
+            return 0
+        if head and os.pread(fd, len(head), 0) != head:
+            LOG.info("tail: %s was rewritten since the checkpoint, reading from 0", self.path)
+            return 0
+        return offset
+
+    def position(self) -> Dict[str, Any]:
+        """Checkpoint for the point just after the last yielded line."""
+        file_id = f"{self.file_id[0]}:{self.file_id[1]}" if self.file_id else ""
+        return {"file_id": file_id, "offset": self.offset, "head": self._head.hex()}
+
+    def _read_block(self, after_idle: bool) -> bytes | None:
+        """Next block, b"" at EOF, or None if the file was rewritten while we were idle."""
+        assert self._fd is not None
+        if after_idle and self._rewritten():
+            return None
+        return os.read(self._fd, self.block_size)
+
+    def _split(self, data: bytes) -> List[str]:
+        if len(self._head) < _HEAD_BYTES and self._pos == len(self._head):
+            self._head += data[: _HEAD_BYTES - len(self._head)]
+        self._pos += len(data)
+        chunk = self._partial + data
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            self._partial = chunk
+            return []
+        self._partial = chunk[end + 1 :]
+        return chunk[:end].decode(self.encoding, self.errors).split("\n")
+
+    def _take_partial(self) -> List[str]:
+        line, self._partial = self._partial, b""
+        return [line.decode(self.encoding, self.errors)] if line else []
+
+    def _check_replaced(self) -> str:
+        """At EOF: return "rotated", "truncated" or "" after comparing the path with the open file."""
+        assert self._fd is not None
+        try:
+            current = os.fstat(self._fd)
+            if current.st_size < self._pos:
+                return "truncated"
+            if self._rewritten():
+                return "truncated"
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            # renamed away and not recreated yet; keep the old file until it is
+            return ""
+        if (st.st_dev, st.st_ino) != self.file_id:
+            return "rotated"
+        return ""
+
+    async def _wait(self) -> None:
+        if self.use_inotify and self._watch is None and not self._watch_failed:
+            try:
+                self._watch = _DirectoryWatch(self.path.parent if str(self.path.parent) else Path("."))
+            except (OSError, AttributeError, NotImplementedError) as exc:
+                self._watch_failed = True
+                LOG.info("tail: inotify unavailable for %s, polling err=%s", self.path, exc)
+        if self._watch is not None:
+            await self._watch.wait(self.poll_max_sec)
+            return
+        await asyncio.sleep(self._delay)
+        self._delay = min(self._delay * 2, self.poll_max_sec)
+
+    async def follow(self) -> AsyncIterator[List[str]]:
+        """Yield lists of lines (without newline) until `stop()` is called."""
+        while not self._stopped:
+            if self._fd is None and not self._open():
+                await self._wait()
+                continue
+            data = await asyncio.to_thread(self._read_block, self._waited)
+            self._waited = False
+            if data:
+                self._delay = self.poll_min_sec
+                self._idle_since = time.monotonic()
+                lines = self._split(data)
+                if lines:
+                    yield lines
+                continue
+            change = "truncated" if data is None else self._check_replaced()
+            if change == "rotated":
+                self.rotations += 1
+                LOG.info("tail: %s rotated, reopening", self.path)
+                tail = self._take_partial()
+                if tail:
+                    yield tail
+                self._close_file()
+                continue
+            if change == "truncated":
+                self.truncations += 1
+                LOG.info("tail: %s truncated, restarting at 0", self.path)
+                os.lseek(self._fd, 0, os.SEEK_SET)  # type: ignore[arg-type]
+                self._pos = 0
+                self._partial = b""
+                self._head = b""
+                continue
+            if self._partial and time.monotonic() - self._idle_since >= self.poll_max_sec:
+                yield self._take_partial()
+            await self._wait()
+            self._waited = True
@@ -1,8 +1,11 @@
 import asyncio
 import logging
+import os
+import socket
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
 
 import redis.asyncio as aioredis
-from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import ConnectionError as RedisConnectionError, RedisError, TimeoutError as RedisTimeoutError
 
 from app.core.config import get_settings
 
@@ -12,13 +15,25 @@ redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
 LOG = logging.getLogger(__name__)
 
 STREAM_NAME = "logs"
+METRICS_INPUT_STREAM = settings.METRICS_INPUT_STREAM
+# Source kinds whose lines are JSON metric payloads for the normalizers, not log lines
+METRIC_SOURCE_KINDS = frozenset({"snmp", "dcim_http", "telegraf"})
 
 
-async def wait_for_redis() -> None:
+def stream_for_source(source: str | None) -> str:
+    """Stream for an entry from `source`: metric payloads go to the metrics worker, the rest to logs."""
+    kind = (source or "").split(":", 1)[0]
+    if settings.ENABLE_METRICS_NORMALIZATION and kind in METRIC_SOURCE_KINDS:
+        return METRICS_INPUT_STREAM
+    return STREAM_NAME
+
+
+async def wait_for_redis(client: Any = None) -> None:
+    client = client if client is not None else redis
     delay = 0.5
     while True:
         try:
-            await redis.ping()
+            await client.ping()
             return
         except RedisConnectionError:
             await asyncio.sleep(delay)
@@ -34,9 +49,125 @@ async def safe_xadd(stream: str, fields: dict, *, retry: int = 1) -> None:
             await safe_xadd(stream, fields, retry=retry - 1)
 
 
-
-
-
-
-
-
+class StreamWriter:
+    """Batching XADD writer used by the producers.
+
+    Entries are buffered and written through one non-transactional pipeline
+    when `batch_size` entries are waiting or `linger_ms` after the first
+    buffered entry, whichever comes first. Only one batch is in flight at a
+    time: when Redis is slow, `add` blocks on the full buffer until the
+    previous batch has been written, so producers are throttled instead of
+    buffering without bound. On connection errors and timeouts the writer
+    waits for Redis and retries the batch once, like `safe_xadd`; batches
+    that still fail, or fail with any other Redis error, are dropped and
+    counted in `dropped_total`. Both flush paths (a full buffer and the
+    linger timer) handle errors the same way.
+
+    Entries may carry a `checkpoint` (e.g. a file offset). Once a batch has
+    been written, `on_written` is awaited with the batch's checkpoints, in
+    order, so callers only persist progress that actually reached Redis.
+
+    Create it inside the event loop that will use it and `close()` it when
+    the producer stops, so the last partial batch is written.
+    """
+
+    def __init__(
+        self,
+        stream: str = STREAM_NAME,
+        *,
+        client: Any = None,
+        batch_size: int | None = None,
+        linger_ms: float | None = None,
+        on_written: Callable[[List[Any]], Awaitable[None]] | None = None,
+    ) -> None:
+        self.stream = stream
+        self.client = client if client is not None else redis
+        self.batch_size = max(1, int(batch_size if batch_size is not None else settings.PRODUCER_BATCH_SIZE))
+        self.linger_sec = max(0.0, float(linger_ms if linger_ms is not None else settings.PRODUCER_LINGER_MS) / 1000.0)
+        self.on_written = on_written
+        self._buffer: List[Tuple[Dict[str, Any], Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._linger_task: asyncio.Task | None = None
+        self._executed = False  # the current batch reached Redis (set right after execute())
+        self.written_total = 0
+        self.dropped_total = 0
+
+    async def add(self, fields: Dict[str, Any], checkpoint: Any = None) -> None:
+        self._buffer.append((fields, checkpoint))
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+        elif self._linger_task is None or self._linger_task.done():
+            self._linger_task = asyncio.create_task(self._flush_after_linger())
+
+    async def _flush_after_linger(self) -> None:
+        await asyncio.sleep(self.linger_sec)
+        try:
+            await self.flush()
+        except Exception as exc:  # noqa: BLE001
+            LOG.info("stream writer flush failed stream=%s err=%s", self.stream, exc)
+
+    async def flush(self) -> int:
+        """Write everything buffered so far; returns the number of entries written."""
+        async with self._flush_lock:
+            written = 0
+            while self._buffer:
+                batch, self._buffer = self._buffer[: self.batch_size], self._buffer[self.batch_size :]
+                self._executed = False
+                try:
+                    written += await self._write(batch)
+                except asyncio.CancelledError:
+                    # e.g. close() cancelling the linger flush: keep the batch for the next
+                    # flush unless it was already written (then only its checkpoints are lost)
+                    if not self._executed:
+                        self._buffer[:0] = batch
+                    raise
+                except Exception as exc:  # noqa: BLE001
+                    self.dropped_total += len(batch)
+                    LOG.info("stream writer batch failed stream=%s dropped=%d err=%s", self.stream, len(batch), exc)
+            return written
+
+    async def _write(self, batch: List[Tuple[Dict[str, Any], Any]], *, retry: int = 1) -> int:
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for fields, _ in batch:
+                pipe.xadd(self.stream, fields, id="*")
+            await pipe.execute()
+            self._executed = True
+        except (RedisConnectionError, RedisTimeoutError) as exc:
+            if retry <= 0:
+                self.dropped_total += len(batch)
+                LOG.info("stream writer retry exhausted stream=%s dropped=%d err=%s", self.stream, len(batch), exc)
+                return 0
+            await wait_for_redis(self.client)
+            return await self._write(batch, retry=retry - 1)
+        except RedisError as exc:
+            # e.g. a ResponseError: retrying would fail the same way
+            self.dropped_total += len(batch)
+            LOG.info("stream writer batch failed stream=%s dropped=%d err=%s", self.stream, len(batch), exc)
+            return 0
+        self.written_total += len(batch)
+        checkpoints = [checkpoint for _, checkpoint in batch if checkpoint is not None]
+        if checkpoints and self.on_written is not None:
+            try:
+                await self.on_written(checkpoints)
+            except Exception as exc:  # noqa: BLE001
+                LOG.info("stream writer checkpoint failed stream=%s err=%s", self.stream, exc)
+        return len(batch)
+
+    async def close(self) -> None:
+        if self._linger_task is not None and not self._linger_task.done():
+            self._linger_task.cancel()
+        self._linger_task = None
+        await self.flush()
+
+
+def consumer_name(role: str, index: int = 0) -> str:
+    """Return a consumer identity unique to this process and worker.
+
+    Format: <role>-<instance>-<pid>-<index>, where instance is
+    STREAM_CONSUMER_ID when set (e.g. a pod name) or the hostname. Distinct
+    names let replicas share a consumer group instead of contending for
+    a single pending entries list.
+    """
+    instance = settings.STREAM_CONSUMER_ID or socket.gethostname()
+    return f"{role}-{instance}-{os.getpid()}-{index}"
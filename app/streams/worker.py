@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+from redis.exceptions import ResponseError
+
+from app.core.config import get_settings
+
+
+settings = get_settings()
+LOG = logging.getLogger(__name__)
+
+Message = Tuple[str, Dict[str, Any]]
+
+
+class StreamGroupReader:
+    """Consumer-group reader shared by the stream workers.
+
+    Besides reading new entries (`>`), it periodically scans the group's
+    pending entries list with XAUTOCLAIM and takes over entries that have
+    been idle longer than `reclaim_idle_ms` (e.g. left behind by a crashed
+    worker). Reclaimed entries whose delivery count exceeds `max_deliveries`
+    are copied to the dead-letter stream and acknowledged instead of being
+    retried forever. Consumers of the group that are long idle and hold no
+    pending entries are pruned after each full scan.
+    """
+
+    def __init__(
+        self,
+        redis: Any,
+        stream: str,
+        group: str,
+        consumer: str,
+        *,
+        count: int = 50,
+        block_ms: int = 1000,
+        start_id: str = "$",
+    ) -> None:
+        self.redis = redis
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self.count = count
+        self.block_ms = block_ms
+        self.start_id = start_id
+        self.reclaim_idle_ms = int(settings.STREAM_RECLAIM_IDLE_MS)
+        self.reclaim_interval_sec = float(settings.STREAM_RECLAIM_INTERVAL_SEC)
+        self.max_deliveries = int(settings.STREAM_MAX_DELIVERIES)
+        self.dead_letter_stream = f"{stream}{settings.STREAM_DEAD_LETTER_SUFFIX}"
+        self._reclaim_cursor = "0-0"
+        self._next_reclaim_at = 0.0
+        self.reclaimed_total = 0
+        self.dead_lettered_total = 0
+
+    async def ensure_group(self) -> None:
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id=self.start_id, mkstream=True)
+            LOG.info("consumer group created stream=%s group=%s", self.stream, self.group)
+        except ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+            LOG.debug("consumer group exists stream=%s group=%s", self.stream, self.group)
+
+    async def read(self) -> List[Message]:
+        """Return reclaimed pending entries when a reclaim pass is due, else new entries."""
+        if time.monotonic() >= self._next_reclaim_at:
+            try:
+                reclaimed = await self._reclaim_page()
+            except Exception as exc:
+                LOG.info("reclaim failed stream=%s group=%s err=%s", self.stream, self.group, exc)
+                reclaimed = []
+                self._finish_scan()
+            if reclaimed:
+                return reclaimed
+        response = await self.redis.xreadgroup(
+            self.group,
+            self.consumer,
+            {self.stream: ">"},
+            count=self.count,
+            block=self.block_ms,
+        )
+        return [msg for _, messages in (response or []) for msg in messages]
+
+    async def ack(self, *ids: str) -> None:
+        if ids:
+            await self.redis.xack(self.stream, self.group, *ids)
+
+    def _finish_scan(self) -> None:
+        self._reclaim_cursor = "0-0"
+        self._next_reclaim_at = time.monotonic() + self.reclaim_interval_sec
+
+    async def _reclaim_page(self) -> List[Message]:
+        result = await self.redis.xautoclaim(
+            self.stream,
+            self.group,
+            self.consumer,
+            min_idle_time=self.reclaim_idle_ms,
+            start_id=self._reclaim_cursor,
+            count=self.count,
+        )
+        next_cursor = str(result[0]) if result else "0-0"
+        claimed: List[Message] = list(result[1]) if result and len(result) > 1 else []
+        if next_cursor == "0-0":
+            self._finish_scan()
+            await self._prune_consumers()
+        else:
+            self._reclaim_cursor = next_cursor
+        if not claimed:
+            return []
+
+        # Entries trimmed from the stream come back without fields; nothing to retry
+        gone = [msg_id for msg_id, fields in claimed if msg_id and fields is None]
+        claimed = [(msg_id, fields) for msg_id, fields in claimed if msg_id and fields is not None]
+        if gone:
+            await self.ack(*gone)
+        if not claimed:
+            return []
+
+        deliveries = await self._delivery_counts(claimed[0][0], claimed[-1][0], len(claimed))
+        keep: List[Message] = []
+        dead: List[Message] = []
+        for msg_id, fields in claimed:
+            if deliveries.get(msg_id, 0) > self.max_deliveries:
+                dead.append((msg_id, fields))
+            else:
+                keep.append((msg_id, fields))
+        for msg_id, fields in dead:
+            await self.redis.xadd(self.dead_letter_stream, {
+                **fields,
+                "dead_letter_stream": self.stream,
+                "dead_letter_group": self.group,
+                "dead_letter_id": msg_id,
+                "dead_letter_deliveries": str(deliveries.get(msg_id, 0)),
+            })
+            await self.ack(msg_id)
+        if dead:
+            self.dead_lettered_total += len(dead)
+            LOG.info(
+                "dead-lettered entries stream=%s group=%s count=%d target=%s",
+                self.stream,
+                self.group,
+                len(dead),
+                self.dead_letter_stream,
+            )
+        if keep:
+            self.reclaimed_total += len(keep)
+            LOG.info(
+                "reclaimed pending entries stream=%s group=%s consumer=%s count=%d",
+                self.stream,
+                self.group,
+                self.consumer,
+                len(keep),
+            )
+        return keep
+
+    async def _delivery_counts(self, first_id: str, last_id: str, count: int) -> Dict[str, int]:
+        rows = await self.redis.xpending_range(
+            self.stream,
+            self.group,
+            min=first_id,
+            max=last_id,
+            count=count,
+            consumername=self.consumer,
+        )
+        return {str(row["message_id"]): int(row["times_delivered"]) for row in rows or []}
+
+    async def _prune_consumers(self) -> None:
+        """Delete group consumers (e.g. from restarted processes) idle and with nothing pending."""
+        prune_idle_ms = int(settings.STREAM_CONSUMER_PRUNE_IDLE_MS)
+        if prune_idle_ms <= 0:
+            return
+        try:
+            consumers = await self.redis.xinfo_consumers(self.stream, self.group)
+            for info in consumers or []:
+                name = str(info.get("name") or "")
+                if not name or name == self.consumer:
+                    continue
+                if int(info.get("pending") or 0) == 0 and int(info.get("idle") or 0) >= prune_idle_ms:
+                    await self.redis.xgroup_delconsumer(self.stream, self.group, name)
+                    LOG.info("pruned idle consumer stream=%s group=%s consumer=%s", self.stream, self.group, name)
+        except Exception as exc:
+            LOG.debug("consumer prune failed stream=%s group=%s err=%s", self.stream, self.group, exc)
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+# Ensure project root is on sys.path so `import app` works when running this script
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.parsers import templating
+from app.parsers.linux import parse_linux_line
+
+
+DEFAULT_SOURCES = [ROOT / "data" / "Linux.log", ROOT / "data" / "Windows_2k.log"]
+
+
+def build_corpus(paths: List[Path]) -> List[str]:
+    """Message bodies as the pipeline templates them: parsed syslog content and whole raw lines."""
+    corpus: List[str] = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                corpus.append(line)
+                parsed = parse_linux_line(0, line)
+                if parsed:
+                    corpus.append(parsed.get("content", ""))
+    return corpus
+
+
+def check_equivalence(corpus: List[str]) -> int:
+    mismatches = 0
+    for message in corpus:
+        expected = templating._template_content_passes(message)
+        actual = templating.template_content(message)
+        if actual != expected:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"MISMATCH {message!r}\n  passes: {expected!r}\n  engine: {actual!r}")
+    return mismatches
+
+
+def _time(fn: Callable[[str], str], corpus: List[str], repeat: int, setup: Callable[[], None] | None = None) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for message in corpus:
+            fn(message)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    """Check `template_content` against the per-mask passes and time both.
+
+    Usage: python scripts/bench_templating.py [--source FILE ...] [--repeat N] [--write corpus.jsonl]
+    """
+    parser = argparse.ArgumentParser(description="Templating equivalence check and micro-benchmark")
+    parser.add_argument("--source", dest="sources", action="append", type=Path, help="Log file to build the corpus from; can be repeated. Defaults to data/Linux.log and data/Windows_2k.log.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs per engine; the best is reported")
+    parser.add_argument("--write", type=Path, default=None, help="Also write the corpus with expected output as JSONL")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.sources or DEFAULT_SOURCES)
+    mismatches = check_equivalence(corpus)
+    print(f"corpus={len(corpus)} distinct={len(set(corpus))} mismatches={mismatches}")
+
+    if args.write:
+        with open(args.write, "w", encoding="utf-8") as f:
+            for message in corpus:
+                f.write(json.dumps({"input": message, "expected": templating._template_content_passes(message)}) + "\n")
+        print(f"wrote {args.write}")
+
+    timings = {
+        "passes": _time(templating._template_content_passes, corpus, args.repeat),
+        "engine (cold cache)": _time(templating.template_content, corpus, args.repeat, setup=templating._chunk_cache.clear),
+        "engine (warm cache)": _time(templating.template_content, corpus, args.repeat),
+    }
+    baseline = timings["passes"]
+    for name, seconds in timings.items():
+        per_line = seconds / max(1, len(corpus)) * 1e6
+        print(f"{name:<22} {seconds:8.3f}s  {per_line:7.2f} us/msg  x{baseline / seconds:5.2f}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
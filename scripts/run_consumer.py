@@ -1,4 +1,5 @@
 from pathlib import Path
+import argparse
 import sys
 import asyncio
 
@@ -7,18 +8,30 @@ ROOT = Path(__file__).resolve().parent.parent
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
+from app.core.config import get_settings
+from app.parsers.drain import get_template_miners
 from app.streams.consumer import consume_logs
+from app.streams.utils import consumer_name
+
+
+async def _run(workers: int) -> None:
+    await asyncio.to_thread(get_template_miners().restore)
+    await asyncio.gather(*(consume_logs(consumer_name("consumer", i)) for i in range(workers)))
 
 
 def main() -> None:
     """Run the Redis stream consumer.
 
-    Usage: python scripts/run_consumer.py
+    Usage: python scripts/run_consumer.py [--workers N]
+
+    Any number of these processes (and API replicas) can run side by side;
+    each worker joins the `log_consumers` group under its own name.
     """
-    asyncio.run(consume_logs())
+    parser = argparse.ArgumentParser(description="Consume the logs stream")
+    parser.add_argument("--workers", type=int, default=get_settings().LOG_CONSUMER_WORKERS, help="Concurrent consumers in this process")
+    args = parser.parse_args()
+    asyncio.run(_run(max(1, args.workers)))
 
 
 if __name__ == "__main__":
     main()
-
-
@@ -0,0 +1,36 @@
+from pathlib import Path
+import argparse
+import sys
+import asyncio
+
+# Ensure project root is on sys.path so `import app` works when running this script
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.core.config import get_settings
+from app.streams.metrics_worker import consume_metrics
+from app.streams.utils import consumer_name
+
+
+async def _run(workers: int) -> None:
+    await asyncio.gather(*(consume_metrics(consumer_name("metrics", i)) for i in range(workers)))
+
+
+def main() -> None:
+    """Run the metrics worker.
+
+    Usage: python scripts/run_metrics_worker.py [--workers N]
+
+    Normalizes raw metric payloads from METRICS_INPUT_STREAM and writes the
+    points to the `metrics` stream. Processes and API replicas share the
+    `metric_consumers` group, each worker under its own name.
+    """
+    parser = argparse.ArgumentParser(description="Consume the raw metrics stream")
+    parser.add_argument("--workers", type=int, default=get_settings().METRICS_WORKERS, help="Concurrent workers in this process")
+    args = parser.parse_args()
+    asyncio.run(_run(max(1, args.workers)))
+
+
+if __name__ == "__main__":
+    main()